@@ -1,12 +1,15 @@
-use dlal_component_base::{component, err, json, serde_json, Body, CmdResult, View};
+use dlal_component_base::{component, err, json, json_to_ptr, serde_json, Body, CmdResult, View};
 
 use colored::*;
 use portaudio as pa;
-use serde::Serialize;
 
+use std::collections::HashMap;
 use std::env;
 use std::ptr::{null, null_mut};
 use std::slice::{from_raw_parts, from_raw_parts_mut};
+use std::sync::atomic::{AtomicBool, AtomicU64, AtomicUsize, Ordering};
+use std::sync::{Arc, Mutex};
+use std::thread;
 use std::time::{Duration, Instant};
 
 fn default_input_latency(info: pa::DeviceInfo) -> pa::Time {
@@ -59,10 +62,355 @@ impl Default for Stream {
     fn default() -> Self { Stream::None }
 }
 
-#[derive(Serialize)]
-struct Profile {
+// ===== stats ===== //
+// Always collected, without allocating on the audio thread.
+// Histogram bucket i counts durations of [2^i, 2^(i+1)) ns, the last bucket also counts anything longer.
+
+const HISTOGRAM_BUCKETS: usize = 32;
+
+#[derive(Default)]
+struct Histogram {
+    buckets: [AtomicU64; HISTOGRAM_BUCKETS],
+    count: AtomicU64,
+    total: AtomicU64,
+    max: AtomicU64, // since last reset
+}
+
+impl Histogram {
+    fn record(&self, ns: u64) {
+        let i = (63 - (ns | 1).leading_zeros() as usize).min(HISTOGRAM_BUCKETS - 1);
+        self.buckets[i].fetch_add(1, Ordering::Relaxed);
+        self.count.fetch_add(1, Ordering::Relaxed);
+        self.total.fetch_add(ns, Ordering::Relaxed);
+        self.max.fetch_max(ns, Ordering::Relaxed);
+    }
+
+    fn snapshot(&self) -> serde_json::Value {
+        let mut buckets = self
+            .buckets
+            .iter()
+            .map(|i| i.load(Ordering::Relaxed))
+            .collect::<Vec<_>>();
+        while buckets.last() == Some(&0) {
+            buckets.pop();
+        }
+        json!({
+            "count": self.count.load(Ordering::Relaxed),
+            "total_ns": self.total.load(Ordering::Relaxed),
+            "max_ns": self.max.load(Ordering::Relaxed),
+            "buckets": buckets,
+        })
+    }
+
+    fn reset(&self) {
+        for i in &self.buckets {
+            i.store(0, Ordering::Relaxed);
+        }
+        self.count.store(0, Ordering::Relaxed);
+        self.total.store(0, Ordering::Relaxed);
+        self.max.store(0, Ordering::Relaxed);
+    }
+}
+
+#[derive(Default)]
+struct AddeeStats {
     name: String,
-    duration: Duration,
+    run: Histogram,
+}
+
+#[derive(Default)]
+struct Stats {
+    run: Histogram,
+    overruns: AtomicU64, // runs that took longer than the time they produce audio for
+    input_underflows: AtomicU64,
+    input_overflows: AtomicU64,
+    output_underflows: AtomicU64,
+    output_overflows: AtomicU64,
+}
+
+impl Stats {
+    fn callback_flags(&self, flags: pa::CallbackFlags) {
+        for (flag, counter) in [
+            (pa::CallbackFlags::INPUT_UNDERFLOW, &self.input_underflows),
+            (pa::CallbackFlags::INPUT_OVERFLOW, &self.input_overflows),
+            (pa::CallbackFlags::OUTPUT_UNDERFLOW, &self.output_underflows),
+            (pa::CallbackFlags::OUTPUT_OVERFLOW, &self.output_overflows),
+        ] {
+            if flags.contains(flag) {
+                counter.fetch_add(1, Ordering::Relaxed);
+            }
+        }
+    }
+
+    fn xruns_json(&self) -> serde_json::Value {
+        json!({
+            "overruns": self.overruns.load(Ordering::Relaxed),
+            "input_underflows": self.input_underflows.load(Ordering::Relaxed),
+            "input_overflows": self.input_overflows.load(Ordering::Relaxed),
+            "output_underflows": self.output_underflows.load(Ordering::Relaxed),
+            "output_overflows": self.output_overflows.load(Ordering::Relaxed),
+        })
+    }
+
+    fn reset(&self) {
+        self.run.reset();
+        for i in [
+            &self.overruns,
+            &self.input_underflows,
+            &self.input_overflows,
+            &self.output_underflows,
+            &self.output_overflows,
+        ] {
+            i.store(0, Ordering::Relaxed);
+        }
+    }
+}
+
+fn elapsed_ns(start: Instant) -> u64 {
+    start.elapsed().as_nanos() as u64
+}
+
+// ===== parallel ===== //
+// Addees run on a pool of threads, each as soon as the addees it depends on have run.
+// An addee depends on the last addee before it, in serial order, that touched any component it touches.
+// An addee touches itself and the components it's connected to.
+// Since addees that touch the same component run in serial order, results match serial execution exactly.
+// Addees whose touches are unknown are barriers: they run alone, after everything before them and before everything after them.
+
+struct Node {
+    view: View,
+    stats: Arc<AddeeStats>,
+    deps: usize,
+    dependents: Vec<usize>,
+}
+
+// Views are only used by one thread at a time, as guaranteed by the schedule.
+unsafe impl Send for Node {}
+unsafe impl Sync for Node {}
+
+struct Schedule {
+    nodes: Vec<Node>,
+    pending: Vec<AtomicUsize>,
+    ready: Mutex<Vec<usize>>,
+    remaining: AtomicUsize,
+}
+
+impl Schedule {
+    fn new(addees: Vec<(View, Arc<AddeeStats>, Option<Vec<String>>)>) -> Self {
+        let mut nodes = Vec::<Node>::with_capacity(addees.len());
+        let mut last = HashMap::<String, usize>::new();
+        let mut last_barrier: Option<usize> = None;
+        let mut since_barrier = Vec::<usize>::new();
+        for (i, (view, stats, touches)) in addees.into_iter().enumerate() {
+            let mut deps = Vec::<usize>::new();
+            match touches {
+                Some(touches) => {
+                    deps.extend(last_barrier);
+                    for touch in touches {
+                        if let Some(j) = last.insert(touch, i) {
+                            deps.push(j);
+                        }
+                    }
+                    since_barrier.push(i);
+                }
+                None => {
+                    deps.extend(last_barrier);
+                    deps.append(&mut since_barrier);
+                    last.clear();
+                    last_barrier = Some(i);
+                }
+            }
+            deps.sort_unstable();
+            deps.dedup();
+            for &j in &deps {
+                nodes[j].dependents.push(i);
+            }
+            nodes.push(Node {
+                view,
+                stats,
+                deps: deps.len(),
+                dependents: vec![],
+            });
+        }
+        let pending = nodes.iter().map(|_| AtomicUsize::new(0)).collect();
+        let ready = Mutex::new(Vec::with_capacity(nodes.len()));
+        Self {
+            nodes,
+            pending,
+            ready,
+            remaining: AtomicUsize::new(0),
+        }
+    }
+
+    // Make every node pending again, and the ones with no deps ready.
+    fn arm(&self) {
+        let mut ready = self.ready.lock().unwrap();
+        for (i, node) in self.nodes.iter().enumerate() {
+            self.pending[i].store(node.deps, Ordering::Relaxed);
+            if node.deps == 0 {
+                ready.push(i);
+            }
+        }
+        self.remaining.store(self.nodes.len(), Ordering::Release);
+    }
+
+    // Run ready nodes until all have run, or until quit.
+    fn work(&self, quit: &AtomicBool) {
+        loop {
+            if self.remaining.load(Ordering::Acquire) == 0 || quit.load(Ordering::Acquire) {
+                return;
+            }
+            let i = match self.ready.lock().unwrap().pop() {
+                Some(i) => i,
+                None => {
+                    // let threads with ready work use this CPU
+                    thread::yield_now();
+                    continue;
+                }
+            };
+            let node = &self.nodes[i];
+            let start = Instant::now();
+            node.view.run();
+            node.stats.run.record(elapsed_ns(start));
+            for &j in &node.dependents {
+                if self.pending[j].fetch_sub(1, Ordering::AcqRel) == 1 {
+                    self.ready.lock().unwrap().push(j);
+                }
+            }
+            self.remaining.fetch_sub(1, Ordering::AcqRel);
+        }
+    }
+}
+
+fn pin_to_cpu(cpu: usize) {
+    #[cfg(target_os = "linux")]
+    unsafe {
+        let cpus = libc::sysconf(libc::_SC_NPROCESSORS_ONLN).max(1) as usize;
+        let mut set: libc::cpu_set_t = std::mem::zeroed();
+        libc::CPU_SET(cpu % cpus, &mut set);
+        libc::sched_setaffinity(0, std::mem::size_of::<libc::cpu_set_t>(), &set);
+    }
+    #[cfg(not(target_os = "linux"))]
+    let _ = cpu;
+}
+
+// State shared between the audio thread and the workers.
+// Commands swap in a new schedule, and workers pick it up when the next run starts a new epoch.
+#[derive(Default)]
+struct Shared {
+    schedule: Mutex<Option<Arc<Schedule>>>,
+    epoch: AtomicUsize,
+    quit: AtomicBool,
+}
+
+fn worker(shared: Arc<Shared>) {
+    let mut epoch = 0;
+    loop {
+        let mut spins = 0;
+        while shared.epoch.load(Ordering::Acquire) == epoch {
+            if shared.quit.load(Ordering::Acquire) {
+                return;
+            }
+            if spins < 1 << 8 {
+                thread::yield_now();
+                spins += 1;
+            } else {
+                thread::park_timeout(Duration::from_millis(10));
+            }
+        }
+        epoch = shared.epoch.load(Ordering::Acquire);
+        let schedule = shared.schedule.lock().unwrap().clone();
+        if let Some(schedule) = schedule {
+            schedule.work(&shared.quit);
+        }
+    }
+}
+
+// A pool of threads - 1 workers, each pinned to a CPU, which lives until the number of threads changes.
+// The parallel command can arrive in the middle of a run (from a comm), so a new number of threads is requested, and applied by the audio thread at the start of the next run.
+#[derive(Default)]
+struct Parallel {
+    threads: usize,
+    requested: Option<usize>,
+    touches: HashMap<String, Vec<String>>,
+    shared: Arc<Shared>,
+    workers: Vec<thread::JoinHandle<()>>,
+}
+
+impl Parallel {
+    fn set_threads(&mut self, threads: usize) {
+        if threads == self.threads {
+            return;
+        }
+        self.stop();
+        self.threads = threads;
+        self.shared = Arc::new(Shared::default());
+        for i in 1..threads {
+            let shared = self.shared.clone();
+            self.workers.push(thread::spawn(move || {
+                pin_to_cpu(i);
+                worker(shared);
+            }));
+        }
+    }
+
+    fn stop(&mut self) {
+        self.shared.quit.store(true, Ordering::Release);
+        for worker in self.workers.drain(..) {
+            worker.thread().unpark();
+            worker.join().ok();
+        }
+    }
+
+    // Build a schedule for the current addees and touches, and swap it in for the next run.
+    fn schedule(&self, addees: &[Vec<View>], addee_stats: &[Vec<Arc<AddeeStats>>]) {
+        let schedule = if self.threads > 1 {
+            let addees = addees
+                .iter()
+                .rev()
+                .flatten()
+                .zip(addee_stats.iter().rev().flatten())
+                .map(|(view, stats)| {
+                    let name = stats.name.clone();
+                    let touches = self.touches.get(&name).map(|touches| {
+                        let mut touches = touches.clone();
+                        touches.push(name);
+                        touches
+                    });
+                    (view.clone(), stats.clone(), touches)
+                })
+                .collect();
+            Some(Arc::new(Schedule::new(addees)))
+        } else {
+            None
+        };
+        *self.shared.schedule.lock().unwrap() = schedule;
+    }
+
+    // Returns false if there's no schedule, so addees should run serially.
+    fn run(&self) -> bool {
+        // held for the whole run, in case a command swaps in a new schedule meanwhile
+        let schedule = match self.shared.schedule.lock().unwrap().clone() {
+            Some(schedule) => schedule,
+            None => return false,
+        };
+        if schedule.nodes.is_empty() {
+            return true;
+        }
+        schedule.arm();
+        self.shared.epoch.fetch_add(1, Ordering::Release);
+        for worker in &self.workers {
+            worker.thread().unpark();
+        }
+        schedule.work(&self.shared.quit);
+        true
+    }
+}
+
+impl Drop for Parallel {
+    fn drop(&mut self) {
+        self.stop();
+    }
 }
 
 component!(
@@ -73,13 +421,16 @@ component!(
         "run_size",
         "sample_rate",
         {"name": "field_helpers", "fields": ["run_size", "sample_rate"], "kinds": ["rw", "json"]},
-        {"name": "field_helpers", "fields": ["profiles"], "kinds": ["r"]},
     ],
     {
         addees: Vec<Vec<View>>,
         stream: Stream,
         audio: Audio,
-        profiles: Vec<Vec<Profile>>,
+        addee_stats: Vec<Vec<Arc<AddeeStats>>>, // same shape as addees
+        // addee_stats in run order, for the stats commands, which can be called from other threads
+        addee_stats_published: Mutex<Arc<Vec<Arc<AddeeStats>>>>,
+        stats: Stats,
+        parallel: Parallel,
     },
     {
         "add": {"args": ["component", "command", "audio", "midi", "run"]},
@@ -88,6 +439,33 @@ component!(
         "start_input_only": {},
         "stop": {},
         "run": {},
+        "run_many": {
+            "args": [
+                {
+                    "name": "n",
+                    "desc": "number of runs",
+                },
+                {
+                    "name": "capture",
+                    "optional": true,
+                    "desc": "pointer to f32 buffer of n * run_size samples, as a string, to receive the output",
+                },
+            ],
+        },
+        "parallel": {
+            "args": [
+                {
+                    "name": "threads",
+                    "desc": "number of threads to run addees on, including the calling thread, 0 or 1 to run serially",
+                },
+                {
+                    "name": "touches",
+                    "optional": true,
+                    "desc": "map from addee name to names of components it's connected to, addees not in it run alone",
+                },
+            ],
+            "desc": "Takes effect at the start of the next run.",
+        },
         "run_explain": {},
         "addee_order": {},
         "addee_move": {
@@ -102,7 +480,13 @@ component!(
         },
         "version": {},
         "list_devices": {},
-        "profile": {},
+        "profile": {
+            "desc": "Same as start. Run times are always collected, see stats.",
+        },
+        "stats": {
+            "desc": "Run-time histograms of the whole run and of each addee, and xrun counts, since the last stats_reset.",
+        },
+        "stats_reset": {},
     },
 );
 
@@ -134,11 +518,35 @@ impl ComponentTrait for Component {
 
 impl Component {
     fn run_addees(&mut self) {
-        for slot in self.addees.iter().rev() {
-            for i in slot {
-                i.run();
+        let start = Instant::now();
+        if let Some(threads) = self.parallel.requested.take() {
+            self.parallel.set_threads(threads);
+            self.addees_changed();
+        }
+        if !self.parallel.run() {
+            for (slot, slot_stats) in self.addees.iter().zip(&self.addee_stats).rev() {
+                for (i, stats) in slot.iter().zip(slot_stats) {
+                    let start = Instant::now();
+                    i.run();
+                    stats.run.record(elapsed_ns(start));
+                }
             }
         }
+        let ns = elapsed_ns(start);
+        self.stats.run.record(ns);
+        if ns > self.budget_ns() {
+            self.stats.overruns.fetch_add(1, Ordering::Relaxed);
+        }
+    }
+
+    fn addees_changed(&mut self) {
+        self.parallel.schedule(&self.addees, &self.addee_stats);
+        let published = self.addee_stats.iter().rev().flatten().cloned().collect();
+        *self.addee_stats_published.lock().unwrap() = Arc::new(published);
+    }
+
+    fn budget_ns(&self) -> u64 {
+        self.run_size as u64 * 1_000_000_000 / self.sample_rate.max(1) as u64
     }
 
     fn run_addees_explain(&mut self) {
@@ -151,21 +559,6 @@ impl Component {
         }
     }
 
-    fn run_addees_profile(&mut self) {
-        let mut profiles = Vec::<Profile>::new();
-        for slot in self.addees.iter().rev() {
-            for i in slot {
-                let start = Instant::now();
-                i.run();
-                profiles.push(Profile {
-                    name: i.name(),
-                    duration: Instant::now() - start,
-                });
-            }
-        }
-        self.profiles.push(profiles);
-    }
-
     fn explain(&self) {
         for slot in self.addees.iter().rev() {
             for i in slot {
@@ -200,8 +593,14 @@ impl Component {
         }
         if slot >= self.addees.len() {
             self.addees.resize(slot + 1, vec![]);
+            self.addee_stats.resize(slot + 1, vec![]);
         }
+        self.addee_stats[slot].push(Arc::new(AddeeStats {
+            name: view.name(),
+            ..Default::default()
+        }));
         self.addees[slot].push(view);
+        self.addees_changed();
         Ok(None)
     }
 
@@ -210,6 +609,8 @@ impl Component {
         for slot in 0..self.addees.len() {
             if let Some(index) = self.addees[slot].iter().position(|i| i.raw == view.raw) {
                 self.addees[slot].remove(index);
+                self.addee_stats[slot].remove(index);
+                self.addees_changed();
                 break;
             }
             if slot == self.addees.len() - 1 {
@@ -258,6 +659,7 @@ impl Component {
                     for output_sample in args.out_buffer.iter_mut() {
                         *output_sample = 0.0;
                     }
+                    self_scoped.stats.callback_flags(args.flags);
                     self_scoped.audio.i = args.in_buffer.as_ptr();
                     self_scoped.audio.o = args.out_buffer.as_mut_ptr();
                     self_scoped.run_addees();
@@ -270,55 +672,8 @@ impl Component {
         Ok(None)
     }
 
-    fn profile_cmd(&mut self, _body: serde_json::Value) -> CmdResult {
-        const CHANNELS: i32 = 1;
-        const INTERLEAVED: bool = true;
-        let pa = pa::PortAudio::new()?;
-        let input_device = match env::var("DLAL_AUDIO_INPUT_DEVICE") {
-            Ok(v) => pa::DeviceIndex(v.parse()?),
-            Err(_) => pa.default_input_device()?,
-        };
-        let input_params = pa::StreamParameters::<f32>::new(
-            input_device,
-            CHANNELS,
-            INTERLEAVED,
-            default_input_latency(pa.device_info(input_device)?),
-        );
-        let output_device = match env::var("DLAL_AUDIO_OUTPUT_DEVICE") {
-            Ok(v) => pa::DeviceIndex(v.parse()?),
-            Err(_) => pa.default_output_device()?,
-        };
-        let output_params = pa::StreamParameters::<f32>::new(
-            output_device,
-            CHANNELS,
-            INTERLEAVED,
-            default_output_latency(pa.device_info(output_device)?),
-        );
-        pa.is_duplex_format_supported(input_params, output_params, self.sample_rate.into())?;
-        let self_scoped = unsafe { std::mem::transmute::<&mut Component, &mut Component>(self) };
-        self.stream = Stream::Duplex({
-            let mut stream = pa.open_non_blocking_stream(
-                pa::DuplexStreamSettings::new(
-                    input_params,
-                    output_params,
-                    self.sample_rate.into(),
-                    self.run_size as u32,
-                ),
-                move |args| {
-                    assert!(args.frames == self_scoped.run_size);
-                    for output_sample in args.out_buffer.iter_mut() {
-                        *output_sample = 0.0;
-                    }
-                    self_scoped.audio.i = args.in_buffer.as_ptr();
-                    self_scoped.audio.o = args.out_buffer.as_mut_ptr();
-                    self_scoped.run_addees_profile();
-                    pa::Continue
-                },
-            )?;
-            stream.start()?;
-            stream
-        });
-        Ok(None)
+    fn profile_cmd(&mut self, body: serde_json::Value) -> CmdResult {
+        self.start_cmd(body)
     }
 
     fn start_input_only_cmd(&mut self, _body: serde_json::Value) -> CmdResult {
@@ -345,6 +700,7 @@ impl Component {
                 ),
                 move |args| {
                     assert!(args.frames == self_scoped.run_size);
+                    self_scoped.stats.callback_flags(args.flags);
                     self_scoped.audio.i = args.buffer.as_ptr();
                     self_scoped.run_addees();
                     pa::Continue
@@ -376,6 +732,41 @@ impl Component {
         Ok(None)
     }
 
+    fn run_many_cmd(&mut self, body: serde_json::Value) -> CmdResult {
+        let n: usize = body.arg(0)?;
+        let mut capture = if body.has_arg(1) {
+            let data = json_to_ptr!(body.arg::<serde_json::Value>(1)?, *mut f32);
+            Some(unsafe { from_raw_parts_mut(data, n * self.run_size) })
+        } else {
+            None
+        };
+        let mut vec: Vec<f32> = Vec::new();
+        vec.resize(self.run_size, 0.0);
+        for i in 0..n {
+            let audio_o = match capture.as_mut() {
+                Some(capture) => &mut capture[i * self.run_size..(i + 1) * self.run_size],
+                None => vec.as_mut_slice(),
+            };
+            for j in audio_o.iter_mut() {
+                *j = 0.0;
+            }
+            self.audio.o = audio_o.as_mut_ptr();
+            self.run_addees();
+        }
+        Ok(None)
+    }
+
+    fn parallel_cmd(&mut self, body: serde_json::Value) -> CmdResult {
+        self.parallel.requested = Some(body.arg(0)?);
+        self.parallel.touches = if body.has_arg(1) {
+            body.arg(1)?
+        } else {
+            HashMap::new()
+        };
+        self.addees_changed();
+        Ok(None)
+    }
+
     fn run_explain_cmd(&mut self, _body: serde_json::Value) -> CmdResult {
         let mut vec: Vec<f32> = Vec::new();
         vec.resize(self.run_size, 0.0);
@@ -418,6 +809,7 @@ impl Component {
         let spot1 = spot1.ok_or(err!("no component named {}", name1))?;
         spot2.ok_or(err!("no component named {}", name2))?;
         let component1 = self.addees[spot1.0].remove(spot1.1);
+        let stats1 = self.addee_stats[spot1.0].remove(spot1.1);
         let mut spot2: Option<(usize, usize)> = None;
         for (i_slot, slot) in self.addees.iter().enumerate() {
             for (i_component, component) in slot.iter().enumerate() {
@@ -428,6 +820,40 @@ impl Component {
         }
         let spot2 = spot2.unwrap();
         self.addees[spot2.0].insert(spot2.1, component1);
+        self.addee_stats[spot2.0].insert(spot2.1, stats1);
+        self.addees_changed();
+        Ok(None)
+    }
+
+    fn stats_cmd(&mut self, _body: serde_json::Value) -> CmdResult {
+        let budget_ns = self.budget_ns();
+        let run = self.stats.run.snapshot();
+        let utilization = |ns: u64| ns as f64 / budget_ns.max(1) as f64;
+        let count = run["count"].as_u64().unwrap_or(0);
+        let total_ns = run["total_ns"].as_u64().unwrap_or(0);
+        let max_ns = run["max_ns"].as_u64().unwrap_or(0);
+        let addee_stats = self.addee_stats_published.lock().unwrap().clone();
+        let addees = addee_stats
+            .iter()
+            .map(|i| json!({"name": i.name, "run": i.run.snapshot()}))
+            .collect::<Vec<_>>();
+        Ok(Some(json!({
+            "budget_ns": budget_ns,
+            "utilization": {
+                "mean": if count != 0 { utilization(total_ns / count) } else { 0.0 },
+                "max": utilization(max_ns),
+            },
+            "run": run,
+            "xruns": self.stats.xruns_json(),
+            "addees": addees,
+        })))
+    }
+
+    fn stats_reset_cmd(&mut self, _body: serde_json::Value) -> CmdResult {
+        self.stats.reset();
+        for i in self.addee_stats_published.lock().unwrap().iter() {
+            i.run.reset();
+        }
         Ok(None)
     }
 
@@ -20,6 +20,7 @@ pub trait ComponentTrait {
 pub struct Component {
     name: String,
     result: std::ffi::CString,
+    typed_result: Vec<f32>,
     {{#if (or features.run_size features.audio)}}
         run_size: usize,
     {{/if}}
@@ -347,6 +348,9 @@ pub unsafe extern "C" fn command(component: *mut Component, text: *const std::os
                 {
                     "name": "{{this.name}}",
                     "info": {{this.info}},
+                    {{#if this.typed}}
+                        "typed": "{{this.typed}}",
+                    {{/if}}
                 },
             {{/each}}
             {
@@ -443,6 +447,46 @@ pub unsafe extern "C" fn command(component: *mut Component, text: *const std::os
     }
 }
 
+#[no_mangle]
+pub unsafe extern "C" fn command_typed(
+    component: *mut Component,
+    name: *const std::os::raw::c_char,
+    args: *const f32,
+    args_len: usize,
+    result: *mut *const f32,
+    result_len: *mut usize,
+) -> *const std::os::raw::c_char {
+    let component = unsafe { &mut *component };
+    let name = unsafe { std::ffi::CStr::from_ptr(name) }.to_str().expect("CStr::to_str failed");
+    let args = if args_len == 0 {
+        &[]
+    } else {
+        unsafe { std::slice::from_raw_parts(args, args_len) }
+    };
+    if std::option_env!("DLAL_SNOOP_COMMAND").is_some() {
+        println!("{} command_typed {} {:?}", component, name, args);
+    }
+    let mut typed_result = std::mem::take(&mut component.typed_result);
+    typed_result.clear();
+    let status: dlal_component_base::TypedResult = match name {
+        {{#each commands}}
+            {{#if this.typed}}
+                "{{this.name}}" => component.{{this.name}}_typed(args, &mut typed_result),
+            {{/if}}
+        {{/each}}
+        _ => Err(dlal_component_base::err!(r#"no such typed command "{}""#, name).into()),
+    };
+    component.typed_result = typed_result;
+    unsafe {
+        *result = component.typed_result.as_ptr();
+        *result_len = component.typed_result.len();
+    }
+    match status {
+        Ok(()) => std::ptr::null(),
+        Err(err) => component.set_result(&dlal_component_base::json!({"error": err.to_string()}).to_string()),
+    }
+}
+
 #[no_mangle]
 pub unsafe extern "C" fn midi(component: *mut Component, msg: *const u8, size: usize) {
     let component = unsafe { &mut *component };
@@ -21,6 +21,7 @@ fn get_features(input: TokenStream) -> serde_json::Value {
     let mut field_helpers_rw = Vec::<String>::new();
     let mut field_helpers_r = Vec::<String>::new();
     let mut field_helpers_json = Vec::<String>::new();
+    let mut typed = serde_json::Map::new();
     for i in (0..tokens.len()).step_by(2) {
         let features = serde_json::from_str::<serde_json::Value>(&tokens[i].to_string())
             .expect("feature isn't valid JSON");
@@ -52,6 +53,18 @@ fn get_features(input: TokenStream) -> serde_json::Value {
                             }
                         }
                     }
+                    "typed" => {
+                        let returns = feature["returns"].as_str().expect("returns isn't a string");
+                        match returns {
+                            "none" | "scalar" | "array" => (),
+                            _ => panic!("unknown typed returns {}", returns),
+                        }
+                        let commands = feature["commands"].as_array().expect("commands isn't an array");
+                        for command in commands {
+                            let command = command.as_str().expect("command isn't a string");
+                            typed.insert(command.to_string(), json!(returns));
+                        }
+                    }
                     _ => {
                         panic!("unknown complex feature \"{}\"", feature["name"]);
                     }
@@ -66,6 +79,7 @@ fn get_features(input: TokenStream) -> serde_json::Value {
         "r": field_helpers_r,
         "json": field_helpers_json,
     });
+    result["typed"] = json!(typed);
     result
 }
 
@@ -138,6 +152,18 @@ pub fn component(input: TokenStream) -> TokenStream {
                 "info": info.to_string(),
             }));
         }
+        let typed = features["typed"].as_object().expect("typed isn't an object");
+        for command in commands.iter_mut() {
+            let name = command["name"].as_str().expect("command has no name").to_string();
+            if let Some(returns) = typed.get(&name) {
+                command["typed"] = returns.clone();
+            }
+        }
+        for name in typed.keys() {
+            if !commands.iter().any(|i| i["name"] == json!(name)) {
+                panic!("typed command \"{}\" isn't a command", name);
+            }
+        }
     }
     // render
     let mut hbs = handlebars::Handlebars::new();
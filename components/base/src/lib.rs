@@ -15,6 +15,10 @@ use std::slice::from_raw_parts_mut;
 // ===== CmdResult ===== //
 pub type CmdResult = Result<Option<serde_json::Value>, Box<dyn StdError>>;
 
+// ===== TypedResult ===== //
+// Typed commands take f32 args and push f32 results, skipping JSON entirely.
+pub type TypedResult = Result<(), Box<dyn StdError>>;
+
 // ===== Error ===== //
 #[derive(Debug)]
 pub struct Error {
@@ -254,10 +258,48 @@ impl Body for serde_json::Value {
 
 // ===== View ===== //
 pub type CommandView = extern "C" fn(*const c_void, *const c_char) -> *const c_char;
+pub type CommandTypedView = extern "C" fn(
+    *const c_void,
+    *const c_char,
+    *const f32,
+    usize,
+    *mut *const f32,
+    *mut usize,
+) -> *const c_char;
 pub type MidiView = extern "C" fn(*const c_void, *const u8, usize);
 pub type AudioView = extern "C" fn(*const c_void) -> *mut f32;
 pub type EvaluateView = extern "C" fn(*const c_void);
 
+// Calls a typed command, ignoring its result. Returns the error message if it fails.
+pub fn typed_command(
+    command_typed_view: CommandTypedView,
+    raw: *const c_void,
+    name: &CStr,
+    args: &[f32],
+) -> Option<String> {
+    let mut result = std::ptr::null();
+    let mut result_len = 0;
+    let error = command_typed_view(
+        raw,
+        name.as_ptr(),
+        args.as_ptr(),
+        args.len(),
+        &mut result,
+        &mut result_len,
+    );
+    if error.is_null() {
+        return None;
+    }
+    let error = unsafe { CStr::from_ptr(error) }.to_string_lossy();
+    let message = serde_json::from_str::<serde_json::Value>(&error)
+        .ok()
+        .and_then(|i| {
+            i.get("error")
+                .map(|e| e.as_str().map_or_else(|| e.to_string(), String::from))
+        });
+    Some(message.unwrap_or_else(|| error.into()))
+}
+
 #[derive(Clone, Debug, PartialEq)]
 pub struct View {
     pub raw: *const c_void,
@@ -329,3 +371,48 @@ impl View {
             .into()
     }
 }
+
+// ===== Glide ===== //
+// Linear interpolation of a parameter vector from one keyframe to the next.
+#[derive(Debug, Default)]
+pub struct Glide {
+    start: Vec<f32>,
+    end: Vec<f32>,
+    duration: usize,
+    elapsed: usize,
+}
+
+impl Glide {
+    // Start gliding from `start` to `end` over `duration` samples.
+    pub fn start(&mut self, start: &[f32], end: &[f32], duration: usize) {
+        self.start.clear();
+        self.start.extend_from_slice(start);
+        self.end.clear();
+        self.end.extend_from_slice(end);
+        self.duration = duration;
+        self.elapsed = 0;
+    }
+
+    pub fn stop(&mut self) {
+        self.duration = 0;
+        self.elapsed = 0;
+    }
+
+    pub fn active(&self) -> bool {
+        self.elapsed < self.duration
+    }
+
+    // Advance by `samples` and write the interpolated values to `value`.
+    // Returns false without writing if not gliding.
+    pub fn advance(&mut self, samples: usize, value: &mut [f32]) -> bool {
+        if !self.active() {
+            return false;
+        }
+        self.elapsed = (self.elapsed + samples).min(self.duration);
+        let t = self.elapsed as f32 / self.duration as f32;
+        for ((v, a), b) in value.iter_mut().zip(&self.start).zip(&self.end) {
+            *v = a + (b - a) * t;
+        }
+        true
+    }
+}
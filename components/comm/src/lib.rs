@@ -1,33 +1,192 @@
-use dlal_component_base::{component, err, serde_json, Body, CmdResult, View};
+use dlal_component_base::{
+    component, err, json, json_to_ptr, serde_json, Body, CmdResult, CommandTypedView,
+    CommandView,
+};
 
-use std::sync::mpsc::{Receiver, sync_channel, SyncSender};
+use std::cell::UnsafeCell;
+use std::collections::{HashMap, HashSet};
+use std::io::Write;
+use std::os::raw::{c_char, c_void};
+use std::sync::atomic::{AtomicUsize, Ordering};
 
-#[derive(Debug)]
-enum QueuedItem {
-    Command {
-        view: View,
-        body: Box<serde_json::Value>,
-        detach: bool,
-    },
-    Wait(usize),
+// ===== Ring ===== //
+// Single-producer single-consumer ring of preallocated slots.
+// The producer is the control thread calling commands, the consumer is the audio thread calling run.
+// Python's Comm holds a lock around every queueing command, so there's one producer at a time.
+struct Ring<T> {
+    slots: Vec<UnsafeCell<T>>,
+    head: AtomicUsize, // next slot to read, owned by the consumer
+    tail: AtomicUsize, // next slot to write, owned by the producer
+}
+
+impl<T> Ring<T> {
+    fn new(size: usize, f: impl Fn() -> T) -> Self {
+        Self {
+            slots: (0..size.max(1)).map(|_| UnsafeCell::new(f())).collect(),
+            head: AtomicUsize::new(0),
+            tail: AtomicUsize::new(0),
+        }
+    }
+
+    // Producer side: returns the slot `offset` past the next one to fill, or None if the ring is full.
+    // Slots become visible to the consumer only once `push` is called, so several can be published at once.
+    fn slot_to_push(&self, offset: usize) -> Option<&mut T> {
+        let tail = self.tail.load(Ordering::Relaxed) + offset;
+        if tail - self.head.load(Ordering::Acquire) >= self.slots.len() {
+            return None;
+        }
+        Some(unsafe { &mut *self.slots[tail % self.slots.len()].get() })
+    }
+
+    fn push(&self, n: usize) {
+        self.tail.fetch_add(n, Ordering::Release);
+    }
+
+    // Consumer side: returns the slot to read, or None if the ring is empty.
+    fn slot_to_pop(&self) -> Option<&mut T> {
+        let head = self.head.load(Ordering::Relaxed);
+        if head == self.tail.load(Ordering::Acquire) {
+            return None;
+        }
+        Some(unsafe { &mut *self.slots[head % self.slots.len()].get() })
+    }
+
+    fn pop(&self) {
+        self.head.fetch_add(1, Ordering::Release);
+    }
+}
+
+// ===== records ===== //
+#[derive(PartialEq)]
+enum RecordKind {
+    Wait,
+    Command,
+    Typed,
+}
+
+// A command, decoded on the producer side, ready for the audio thread to dispatch.
+// Its buffers are grown by the producer and keep their capacity as the slot is reused.
+// Typed records are fully decoded. Command records are the fallback for commands without a typed form:
+// components only take JSON text through their command export, so the callee still parses it on the audio thread.
+struct Record {
+    kind: RecordKind,
+    seq: usize,
+    raw: *const c_void,
+    command_view: Option<CommandView>,
+    command_typed_view: Option<CommandTypedView>,
+    text: Vec<u8>, // nul-terminated JSON body for Command, name for Typed
+    args: Vec<f32>,
+    wait: usize,
+    detach: bool,
 }
 
+impl Record {
+    fn new() -> Self {
+        Self {
+            kind: RecordKind::Wait,
+            seq: 0,
+            raw: std::ptr::null(),
+            command_view: None,
+            command_typed_view: None,
+            text: Vec::new(),
+            args: Vec::new(),
+            wait: 0,
+            detach: false,
+        }
+    }
+
+    fn set_text(&mut self, text: &[u8]) {
+        self.text.clear();
+        self.text.extend_from_slice(text);
+        self.text.push(0);
+    }
+
+    // item: [component, command, audio, midi, run, body]
+    fn fill_command(&mut self, item: &[serde_json::Value]) -> CmdResult {
+        if item.len() < 6 {
+            return Err(err!("command item must have 6 elements").into());
+        }
+        self.kind = RecordKind::Command;
+        self.raw = json_to_ptr!(&item[0], *const c_void);
+        self.command_view = Some(json_to_ptr!(&item[1], CommandView));
+        self.set_text(item[5].to_string().as_bytes());
+        Ok(None)
+    }
+
+    // item: [component, command_typed, name, args, args_len]
+    fn fill_typed(&mut self, item: &[serde_json::Value]) -> CmdResult {
+        if item.len() < 5 {
+            return Err(err!("typed item must have 5 elements").into());
+        }
+        self.kind = RecordKind::Typed;
+        self.raw = json_to_ptr!(&item[0], *const c_void);
+        self.command_typed_view = Some(json_to_ptr!(&item[1], CommandTypedView));
+        self.set_text(item[2].to::<String>()?.as_bytes());
+        let args = json_to_ptr!(&item[3], *const f32);
+        let args_len: usize = item[4].to()?;
+        self.args.clear();
+        if args_len != 0 {
+            self.args.extend_from_slice(unsafe { std::slice::from_raw_parts(args, args_len) });
+        }
+        Ok(None)
+    }
+}
+
+#[derive(PartialEq)]
+enum ReplyKind {
+    Null,
+    Json,
+    Typed,
+}
+
+// The result of dispatching a record, copied into preallocated buffers by the audio thread.
+struct Reply {
+    kind: ReplyKind,
+    seq: usize,
+    text: Vec<u8>,
+    values: Vec<f32>,
+}
+
+impl Reply {
+    fn new() -> Self {
+        Self {
+            kind: ReplyKind::Null,
+            seq: 0,
+            text: Vec::with_capacity(TEXT_CAPACITY),
+            values: Vec::with_capacity(VALUES_CAPACITY),
+        }
+    }
+}
+
+const TEXT_CAPACITY: usize = 1024;
+const VALUES_CAPACITY: usize = 1024;
+
+// Replaces results that don't fit in a reply, so the audio thread never reallocates.
+const OVERSIZE_ERROR: &[u8] = b"{\"error\": \"result too big for a comm reply\"}";
+
+// Replies are only produced for attached commands, whose callers wait on them,
+// so the reply ring doesn't need to scale with the record ring.
+const REPLY_SLOTS: usize = 128;
+
 struct Queues {
-    to_audio_send: SyncSender<QueuedItem>,
-    to_audio_recv: Receiver<QueuedItem>,
-    fro_audio_send: SyncSender<Box<Option<serde_json::Value>>>,
-    fro_audio_recv: Receiver<Box<Option<serde_json::Value>>>,
+    to_audio: Ring<Record>,
+    fro_audio: Ring<Reply>,
+    seq: usize,
+    // producer side: replies are moved out of the ring as they arrive, and kept until taken if someone's waiting on them
+    awaited: HashSet<usize>,
+    received: HashMap<usize, Option<serde_json::Value>>,
+    replied: usize, // seq of the latest reply moved out of the ring
 }
 
 impl Queues {
     fn new(size: usize) -> Self {
-        let (to_audio_send, to_audio_recv) = sync_channel(size);
-        let (fro_audio_send, fro_audio_recv) = sync_channel(size);
         Self {
-            to_audio_send,
-            to_audio_recv,
-            fro_audio_send,
-            fro_audio_recv,
+            to_audio: Ring::new(size, Record::new),
+            fro_audio: Ring::new(size.min(REPLY_SLOTS), Reply::new),
+            seq: 0,
+            awaited: HashSet::new(),
+            received: HashMap::new(),
+            replied: 0,
         }
     }
 }
@@ -43,55 +202,159 @@ component!(
     [
         "run_size",
         "uni",
-        {"name": "field_helpers", "fields": ["last_error"], "kinds": ["r"]},
         {"name": "field_helpers", "fields": ["pause"], "kinds": ["rw"]},
     ],
     {
         queues: Queues,
         wait: usize,
         pause: bool,
-        last_error: String,
+        detach_error: Vec<u8>,
     },
     {
-        "queue": {"args": ["component", "command", "audio", "midi", "run", "body", "timeout_ms", "detach"]},
+        "queue": {
+            "args": ["component", "command", "audio", "midi", "run", "body", "timeout_ms", "detach"],
+            "desc": "If timeout_ms is null, returns the command's seq without waiting, see reply.",
+        },
+        "queue_typed": {
+            "args": [
+                "component",
+                "command_typed",
+                "name",
+                {"name": "args", "desc": "pointer to f32 args"},
+                "args_len",
+                "timeout_ms",
+                "detach",
+            ],
+            "return": "array of f32 results, or null",
+            "desc": "If timeout_ms is null, returns the command's seq without waiting, see reply.",
+        },
+        "queue_many": {
+            "args": [
+                {
+                    "name": "items",
+                    "desc": "each either [\"command\", ...queue args through body] or [\"typed\", ...queue_typed args through args_len]",
+                },
+                {"name": "wait", "desc": "samples to wait after the batch, or null"},
+                "timeout_ms",
+                "detach",
+            ],
+            "return": "array of results, or null if detached",
+            "desc": "If timeout_ms is null, returns the seq of the first command without waiting, see reply.",
+        },
+        "reply": {
+            "args": ["seq"],
+            "return": "{\"result\": result} once the reply to the attached command has arrived, otherwise null",
+        },
+        "forget": {
+            "args": ["seq"],
+            "desc": "Stop waiting for a reply.",
+        },
         "wait": {"args": ["samples"]},
         "pause": {"args": ["enable"]},
         "resize": {"args": ["size"]},
+        "last_error": {},
     },
 );
 
 impl ComponentTrait for Component {
+    fn init(&mut self) {
+        self.detach_error.reserve(TEXT_CAPACITY);
+    }
+
     fn run(&mut self) {
         if self.pause {
             return;
         }
-        'outer: loop {
+        loop {
             if self.wait > self.run_size {
                 self.wait -= self.run_size;
                 return;
             }
-            while let Ok(item) = self.queues.to_audio_recv.try_recv() {
-                match item {
-                    QueuedItem::Wait(wait) => {
-                        self.wait += wait;
-                        continue 'outer;
+            let record = match self.queues.to_audio.slot_to_pop() {
+                Some(record) => record,
+                None => break,
+            };
+            if record.kind == RecordKind::Wait {
+                self.wait += record.wait;
+                self.queues.to_audio.pop();
+                continue;
+            }
+            let reply = if record.detach {
+                None
+            } else {
+                let reply = self.queues.fro_audio.slot_to_push(0);
+                if reply.is_none() {
+                    // the caller sees a later reply, or times out; last_error says why
+                    self.detach_error.clear();
+                    let _ = write!(
+                        self.detach_error,
+                        "{{\"error\": \"reply to command {} dropped, all reply slots are full\"}}",
+                        record.seq,
+                    );
+                }
+                reply
+            };
+            let mut typed_result: *const f32 = std::ptr::null();
+            let mut typed_result_len: usize = 0;
+            let result = match record.kind {
+                RecordKind::Command => (record.command_view.unwrap())(
+                    record.raw,
+                    record.text.as_ptr() as *const c_char,
+                ),
+                _ => (record.command_typed_view.unwrap())(
+                    record.raw,
+                    record.text.as_ptr() as *const c_char,
+                    record.args.as_ptr(),
+                    record.args.len(),
+                    &mut typed_result,
+                    &mut typed_result_len,
+                ),
+            };
+            let result = if result.is_null() {
+                None
+            } else {
+                Some(unsafe { std::ffi::CStr::from_ptr(result) }.to_bytes())
+            };
+            if let Some(reply) = reply {
+                reply.seq = record.seq;
+                reply.text.clear();
+                reply.values.clear();
+                reply.kind = match (result, &record.kind) {
+                    (Some(result), _) => {
+                        if result.len() > TEXT_CAPACITY {
+                            reply.text.extend_from_slice(OVERSIZE_ERROR);
+                        } else {
+                            reply.text.extend_from_slice(result);
+                        }
+                        ReplyKind::Json
                     }
-                    QueuedItem::Command { view, body, detach } => {
-                        let result = view.command(&*body);
-                        if !detach {
-                            self.queues
-                                .fro_audio_send
-                                .try_send(Box::new(result))
-                                .expect("try_send failed");
-                        } else if let Some(result) = result {
-                            if let Some(error) = result.get("error") {
-                                self.last_error = error.as_str().unwrap_or(&error.to_string()).into();
-                            }
+                    (None, RecordKind::Typed) if typed_result_len > VALUES_CAPACITY => {
+                        reply.text.extend_from_slice(OVERSIZE_ERROR);
+                        ReplyKind::Json
+                    }
+                    (None, RecordKind::Typed) => {
+                        if typed_result_len != 0 {
+                            reply.values.extend_from_slice(unsafe {
+                                std::slice::from_raw_parts(typed_result, typed_result_len)
+                            });
                         }
+                        ReplyKind::Typed
+                    }
+                    (None, _) => ReplyKind::Null,
+                };
+                self.queues.fro_audio.push(1);
+            } else if let Some(result) = result {
+                // parsed lazily by the last_error command
+                if result.starts_with(b"{\"error\":") {
+                    self.detach_error.clear();
+                    if result.len() > TEXT_CAPACITY {
+                        self.detach_error.extend_from_slice(OVERSIZE_ERROR);
+                    } else {
+                        self.detach_error.extend_from_slice(result);
                     }
                 }
             }
-            break;
+            self.queues.to_audio.pop();
         }
     }
 
@@ -105,39 +368,213 @@ impl ComponentTrait for Component {
 }
 
 impl Component {
+    // Fills consecutive slots with `fill`, then publishes them together.
+    // Returns the sequence number of the first record.
+    fn push_records(
+        &mut self,
+        n: usize,
+        mut fill: impl FnMut(usize, &mut Record) -> CmdResult,
+    ) -> Result<usize, Box<dyn std::error::Error>> {
+        let seq = self.queues.seq + 1;
+        for i in 0..n {
+            let record = match self.queues.to_audio.slot_to_push(i) {
+                Some(record) => record,
+                None => return Err(err!("queue full").into()),
+            };
+            record.seq = seq + i;
+            record.command_view = None;
+            record.command_typed_view = None;
+            record.detach = false;
+            fill(i, record)?;
+        }
+        self.queues.to_audio.push(n);
+        self.queues.seq += n;
+        Ok(seq)
+    }
+
+    // Moves replies out of the ring, keeping the ones someone's waiting on.
+    fn collect_replies(&mut self) {
+        while let Some(reply) = self.queues.fro_audio.slot_to_pop() {
+            if self.queues.awaited.remove(&reply.seq) {
+                let result = match reply.kind {
+                    ReplyKind::Null => None,
+                    ReplyKind::Json => Some(
+                        serde_json::from_slice(&reply.text)
+                            .unwrap_or_else(|e| json!({"error": e.to_string()})),
+                    ),
+                    ReplyKind::Typed => Some(json!(reply.values)),
+                };
+                self.queues.received.insert(reply.seq, result);
+            }
+            self.queues.replied = reply.seq;
+            self.queues.fro_audio.pop();
+        }
+    }
+
+    // Ok(None) if the reply to `seq` hasn't arrived yet.
+    fn take_reply(
+        &mut self,
+        seq: usize,
+    ) -> Result<Option<Option<serde_json::Value>>, Box<dyn std::error::Error>> {
+        self.collect_replies();
+        if let Some(result) = self.queues.received.remove(&seq) {
+            return Ok(Some(result));
+        }
+        if self.queues.replied >= seq {
+            // replies are in order, so ours was dropped for lack of a slot
+            self.queues.awaited.remove(&seq);
+            return Err(err!("reply to command {} dropped, all reply slots are full", seq).into());
+        }
+        Ok(None)
+    }
+
+    fn recv_reply(&mut self, seq: usize, deadline: std::time::Instant) -> CmdResult {
+        loop {
+            if let Some(result) = self.take_reply(seq)? {
+                return Ok(result);
+            }
+            if std::time::Instant::now() >= deadline {
+                self.queues.awaited.remove(&seq);
+                return Err(err!("timed out waiting for reply").into());
+            }
+            std::thread::sleep(std::time::Duration::from_micros(100));
+        }
+    }
+
+    // None if the caller will poll for replies with the reply command instead of waiting.
+    fn deadline(timeout_ms: &serde_json::Value) -> Option<std::time::Instant> {
+        timeout_ms
+            .as_u64()
+            .map(|ms| std::time::Instant::now() + std::time::Duration::from_millis(ms))
+    }
+
+    // Waits for the replies to `n` attached commands starting at `seq`.
+    fn await_replies(&mut self, seq: usize, n: usize, timeout_ms: &serde_json::Value) -> CmdResult {
+        self.queues.awaited.extend(seq..seq + n);
+        let deadline = match Self::deadline(timeout_ms) {
+            Some(deadline) => deadline,
+            None => return Ok(Some(json!(seq))),
+        };
+        let mut results = Vec::with_capacity(n);
+        for i in 0..n {
+            match self.recv_reply(seq + i, deadline) {
+                Ok(result) => results.push(result),
+                Err(e) => {
+                    for j in i..n {
+                        self.queues.awaited.remove(&(seq + j));
+                        self.queues.received.remove(&(seq + j));
+                    }
+                    return Err(e);
+                }
+            }
+        }
+        Ok(Some(json!(results)))
+    }
+
     fn queue_cmd(&mut self, body: serde_json::Value) -> CmdResult {
+        let args = body.at::<Vec<serde_json::Value>>("args")?;
         let detach = body.arg(7)?;
-        if let Err(e) = self
-            .queues
-            .to_audio_send
-            .try_send(QueuedItem::Command {
-                view: View::new(&body.at("args")?)?,
-                body: Box::new(body.arg(5)?),
-                detach,
-            })
-        {
-            return Err(err!("try_send failed: {}", e).into());
+        let seq = self.push_records(1, |_, record| {
+            record.fill_command(&args)?;
+            record.detach = detach;
+            Ok(None)
+        })?;
+        if detach {
+            return Ok(None);
         }
+        Self::only_result(self.await_replies(seq, 1, &body.arg(6)?)?)
+    }
+
+    fn queue_typed_cmd(&mut self, body: serde_json::Value) -> CmdResult {
+        let args = body.at::<Vec<serde_json::Value>>("args")?;
+        let detach = body.arg(6)?;
+        let seq = self.push_records(1, |_, record| {
+            record.fill_typed(&args)?;
+            record.detach = detach;
+            Ok(None)
+        })?;
         if detach {
             return Ok(None);
         }
-        let t = std::time::Duration::from_millis(body.arg(6)?);
-        Ok(*self.queues.fro_audio_recv.recv_timeout(t)?)
+        Self::only_result(self.await_replies(seq, 1, &body.arg(5)?)?)
     }
 
-    fn wait_cmd(&mut self, body: serde_json::Value) -> CmdResult {
-        if let Err(e) = self
-            .queues
-            .to_audio_send
-            .try_send(QueuedItem::Wait(body.arg(0)?))
-        {
-            return Err(err!("try_send failed: {}", e).into());
+    // Unwraps the result of waiting on a single reply, leaving a seq as is.
+    fn only_result(results: Option<serde_json::Value>) -> CmdResult {
+        Ok(match results {
+            Some(serde_json::Value::Array(mut results)) => results.pop().filter(|result| !result.is_null()),
+            results => results,
+        })
+    }
+
+    fn queue_many_cmd(&mut self, body: serde_json::Value) -> CmdResult {
+        let items = body.arg::<Vec<Vec<serde_json::Value>>>(0)?;
+        let wait = body.arg::<serde_json::Value>(1)?.as_u64().map(|i| i as usize);
+        let timeout_ms = body.arg::<serde_json::Value>(2)?;
+        let detach: bool = body.arg(3)?;
+        if !detach && items.len() > self.queues.fro_audio.slots.len() {
+            return Err(err!("can't wait on more than {} results", self.queues.fro_audio.slots.len()).into());
         }
+        let n = items.len() + wait.is_some() as usize;
+        let seq = self.push_records(n, |i, record| {
+            if i == items.len() {
+                record.kind = RecordKind::Wait;
+                record.wait = wait.unwrap();
+                return Ok(None);
+            }
+            let item = &items[i];
+            match item.first().and_then(|kind| kind.as_str()) {
+                Some("command") => record.fill_command(&item[1..])?,
+                Some("typed") => record.fill_typed(&item[1..])?,
+                _ => return Err(err!("item {} has no valid kind", i).into()),
+            };
+            record.detach = detach;
+            Ok(None)
+        })?;
+        if detach {
+            return Ok(None);
+        }
+        self.await_replies(seq, items.len(), &timeout_ms)
+    }
+
+    fn wait_cmd(&mut self, body: serde_json::Value) -> CmdResult {
+        let wait = body.arg(0)?;
+        self.push_records(1, |_, record| {
+            record.kind = RecordKind::Wait;
+            record.wait = wait;
+            Ok(None)
+        })?;
         Ok(None)
     }
 
     fn resize_cmd(&mut self, body: serde_json::Value) -> CmdResult {
+        // replies still awaited are lost, so keep counting from where we were to report them dropped
+        let seq = self.queues.seq;
         self.queues = Queues::new(body.arg(0)?);
+        self.queues.seq = seq;
+        self.queues.replied = seq;
+        Ok(None)
+    }
+
+    fn reply_cmd(&mut self, body: serde_json::Value) -> CmdResult {
+        Ok(self.take_reply(body.arg(0)?)?.map(|result| json!({"result": result})))
+    }
+
+    fn forget_cmd(&mut self, body: serde_json::Value) -> CmdResult {
+        let seq = body.arg(0)?;
+        self.queues.awaited.remove(&seq);
+        self.queues.received.remove(&seq);
         Ok(None)
     }
+
+    fn last_error_cmd(&mut self, _body: serde_json::Value) -> CmdResult {
+        if self.detach_error.is_empty() {
+            return Ok(Some(json!("")));
+        }
+        let result: serde_json::Value = serde_json::from_slice(&self.detach_error)?;
+        Ok(Some(match result.get("error") {
+            Some(error) => json!(error.as_str().unwrap_or(&error.to_string())),
+            None => json!(""),
+        }))
+    }
 }
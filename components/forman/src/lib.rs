@@ -1,4 +1,4 @@
-use dlal_component_base::{component, json, serde_json, Arg, Body, CmdResult};
+use dlal_component_base::{component, err, json, serde_json, Arg, Body, CmdResult, Glide, TypedResult};
 
 #[derive(Clone, Debug)]
 struct Formant {
@@ -24,13 +24,17 @@ impl Arg for Formant {
 component!(
     {"in": ["cmd"], "out": ["cmd"]},
     [
+        "run_size",
         "uni",
         {"name": "field_helpers", "fields": ["freq_per_bin"], "kinds": ["rw", "json"]},
+        {"name": "typed", "commands": ["keyframe", "zero"], "returns": "none"},
     ],
     {
         formants: Vec<Formant>,
         formants_e: Vec<Formant>,
         formants_f: Vec<Formant>,
+        glide: Glide,
+        glide_value: Vec<f32>,
         spectrum: Vec<f32>,
         freq_per_bin: f32,
     },
@@ -38,6 +42,14 @@ component!(
         "formants": {
             "args": [{"name": "formants"}],
         },
+        "keyframe": {
+            "args": [{
+                "name": "keyframe",
+                "type": "array",
+                "element": "float",
+                "desc": "Glide duration in samples, followed by freq, amp pairs to glide linearly to. A duration of 0 sets the formants immediately.",
+            }],
+        },
         "zero": {
             "args": [],
         },
@@ -53,6 +65,13 @@ impl ComponentTrait for Component {
         if self.formants.is_empty() {
             return;
         }
+        // glide to keyframe
+        if self.glide.advance(self.run_size, &mut self.glide_value) {
+            for (i, formant) in self.formants_f.iter_mut().enumerate() {
+                formant.freq = self.glide_value[2 * i + 0];
+                formant.amp = self.glide_value[2 * i + 1];
+            }
+        }
         // smooth formants
         for i in 0..self.formants.len() {
             self.formants_e[i].smooth(&self.formants_f[i], 0.8);
@@ -86,7 +105,13 @@ impl ComponentTrait for Component {
 
 impl Component {
     fn formants_cmd(&mut self, body: serde_json::Value) -> CmdResult {
+        self.glide.stop();
         self.formants_f = body.arg(0)?;
+        self.formants_set();
+        Ok(None)
+    }
+
+    fn formants_set(&mut self) {
         if self.formants.len() != self.formants_f.len() {
             self.formants = self.formants_f.clone();
             self.formants_e = self.formants_f.clone();
@@ -97,13 +122,56 @@ impl Component {
                 self.formants_e[i].freq = self.formants_f[i].freq;
             }
         }
+    }
+
+    fn keyframe_cmd(&mut self, body: serde_json::Value) -> CmdResult {
+        let keyframe = body.arg::<Vec<f32>>(0)?;
+        self.keyframe_typed(&keyframe, &mut vec![])?;
         Ok(None)
     }
 
+    fn keyframe_typed(&mut self, args: &[f32], _result: &mut Vec<f32>) -> TypedResult {
+        if args.len() % 2 != 1 {
+            return Err(err!("keyframe must be a glide duration followed by freq, amp pairs").into());
+        }
+        let duration = args[0] as usize;
+        let values = &args[1..];
+        if duration == 0 || self.formants_f.len() != values.len() / 2 {
+            self.glide.stop();
+            self.formants_f.clear();
+            for i in values.chunks(2) {
+                self.formants_f.push(Formant { freq: i[0], amp: i[1] });
+            }
+            self.formants_set();
+            return Ok(());
+        }
+        self.glide_value.clear();
+        for i in &self.formants_f {
+            self.glide_value.push(i.freq);
+            self.glide_value.push(i.amp);
+        }
+        if self.formants.iter().all(|i| i.amp < 1e-2) {
+            // silent, so jump to the new frequencies like formants does
+            for i in 0..self.formants_f.len() {
+                self.glide_value[2 * i] = values[2 * i];
+                self.formants[i].freq = values[2 * i];
+                self.formants_e[i].freq = values[2 * i];
+            }
+        }
+        self.glide.start(&self.glide_value, values, duration);
+        Ok(())
+    }
+
     fn zero_cmd(&mut self, _body: serde_json::Value) -> CmdResult {
+        self.zero_typed(&[], &mut vec![])?;
+        Ok(None)
+    }
+
+    fn zero_typed(&mut self, _args: &[f32], _result: &mut Vec<f32>) -> TypedResult {
+        self.glide.stop();
         for i in &mut self.formants_f {
             i.amp = 0.0;
         }
-        Ok(None)
+        Ok(())
     }
 }
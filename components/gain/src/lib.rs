@@ -1,4 +1,4 @@
-use dlal_component_base::{component, json, serde_json, Body, CmdResult};
+use dlal_component_base::{component, err, json, serde_json, Body, CmdResult, TypedResult};
 
 component!(
     {"in": ["midi"], "out": ["audio"]},
@@ -10,6 +10,8 @@ component!(
             "fields": ["amount_dst", "smooth"],
             "kinds": ["rw", "json"]
         },
+        {"name": "typed", "commands": ["set"], "returns": "none"},
+        {"name": "typed", "commands": ["get"], "returns": "scalar"},
     ],
     {
         amount: f32,
@@ -63,4 +65,21 @@ impl Component {
     fn get_cmd(&mut self, _body: serde_json::Value) -> CmdResult {
         Ok(Some(json!(self.amount)))
     }
+
+    fn set_typed(&mut self, args: &[f32], _result: &mut Vec<f32>) -> TypedResult {
+        if args.is_empty() {
+            return Err(err!("missing arg 0").into());
+        }
+        self.amount_dst = args[0];
+        self.smooth = args.get(1).copied().unwrap_or(0.0);
+        if self.smooth == 0.0 {
+            self.amount = self.amount_dst;
+        }
+        Ok(())
+    }
+
+    fn get_typed(&mut self, _args: &[f32], result: &mut Vec<f32>) -> TypedResult {
+        result.push(self.amount);
+        Ok(())
+    }
 }
@@ -1,6 +1,10 @@
-use dlal_component_base::{component, err, json, json_to_ptr, serde_json, Body, CmdResult};
+use dlal_component_base::{
+    component, err, json, json_to_ptr, serde_json, Body, CmdResult, TypedResult,
+};
 
-use std::collections::{hash_map, HashMap};
+use rand::Rng;
+
+use std::collections::HashMap;
 use std::time::{Duration, Instant};
 
 //===== Registers =====//
@@ -44,14 +48,6 @@ fn category_exclude(category: &mut Category, duration: f32, sample_rate: u32, ru
     }
 }
 
-fn category_distance(category: &Category, registers: &Registers) -> f32 {
-    let mut distance: f32 = f32::MAX;
-    for i in category {
-        distance = distance.min(registers_distance(i, registers));
-    }
-    distance
-}
-
 fn category_amp(category: &Category) -> f32 {
     let mut amp: f32 = f32::MIN;
     for registers in category {
@@ -60,6 +56,160 @@ fn category_amp(category: &Category) -> f32 {
     amp
 }
 
+//===== CategoryIndex =====//
+// A vantage-point tree over a category's registers, for exact nearest-neighbor search under registers_distance.
+// Each node's inside subtree holds registers closer to its own than threshold, its outside subtree the rest.
+// Nodes are indices into the category.
+
+const NONE: usize = usize::MAX;
+const PRUNE_SLACK: f32 = 1e-4; // relative, so float rounding can't prune the nearest registers
+
+struct VpNode {
+    threshold: f32,
+    inside: usize,
+    outside: usize,
+}
+
+struct CategoryIndex {
+    nodes: Vec<VpNode>,
+    root: usize,
+    built_len: usize,
+    generation: u64, // of categories when built, see Component::categories_replaced
+    amp: f32,
+}
+
+impl CategoryIndex {
+    fn new(category: &Category, generation: u64) -> Self {
+        let mut index = Self {
+            nodes: Vec::with_capacity(category.len()),
+            root: NONE,
+            built_len: category.len(),
+            generation,
+            amp: category_amp(category),
+        };
+        for _ in 0..category.len() {
+            index.nodes.push(VpNode {
+                threshold: 0.0,
+                inside: NONE,
+                outside: NONE,
+            });
+        }
+        if category.is_empty() {
+            return index;
+        }
+        // iterative median-split build, work items are (parent slot, indices)
+        let mut work: Vec<(Option<(usize, bool)>, Vec<usize>)> = vec![(None, (0..category.len()).collect())];
+        let mut distances = Vec::<(f32, usize)>::new();
+        while let Some((parent, mut points)) = work.pop() {
+            let vantage = points.swap_remove(0);
+            match parent {
+                None => index.root = vantage,
+                Some((p, true)) => index.nodes[p].inside = vantage,
+                Some((p, false)) => index.nodes[p].outside = vantage,
+            }
+            if points.is_empty() {
+                continue;
+            }
+            distances.clear();
+            distances.extend(
+                points
+                    .iter()
+                    .map(|&i| (registers_distance(&category[vantage], &category[i]), i)),
+            );
+            let mid = distances.len() / 2;
+            distances.select_nth_unstable_by(mid, |a, b| a.0.total_cmp(&b.0));
+            let threshold = distances[mid].0;
+            index.nodes[vantage].threshold = threshold;
+            let inside = distances.iter().filter(|i| i.0 < threshold).map(|i| i.1).collect::<Vec<_>>();
+            let outside = distances.iter().filter(|i| !(i.0 < threshold)).map(|i| i.1).collect::<Vec<_>>();
+            if !inside.is_empty() {
+                work.push((Some((vantage, true)), inside));
+            }
+            work.push((Some((vantage, false)), outside));
+        }
+        index
+    }
+
+    fn is_current(&self, category: &Category, generation: u64) -> bool {
+        self.generation == generation && self.nodes.len() == category.len()
+    }
+
+    // Index registers appended to the category since this was last current.
+    // Returns false if the category changed some other way, or the tree has grown lopsided enough to rebuild.
+    fn update(&mut self, category: &Category, generation: u64) -> bool {
+        if self.generation != generation || category.len() < self.nodes.len() {
+            return false;
+        }
+        if category.len() > 2 * self.built_len.max(16) {
+            return false;
+        }
+        for i in self.nodes.len()..category.len() {
+            self.insert(category, i);
+        }
+        true
+    }
+
+    fn insert(&mut self, category: &Category, i: usize) {
+        self.nodes.push(VpNode {
+            threshold: 0.0,
+            inside: NONE,
+            outside: NONE,
+        });
+        self.amp = self.amp.max(registers_amp(&category[i]));
+        if self.root == NONE {
+            self.root = i;
+            return;
+        }
+        let mut node = self.root;
+        loop {
+            let d = registers_distance(&category[node], &category[i]);
+            let n = &mut self.nodes[node];
+            if n.inside == NONE && n.outside == NONE {
+                // leaf, first child sets the threshold
+                n.threshold = d;
+                n.outside = i;
+                return;
+            }
+            let child = if d < n.threshold { &mut n.inside } else { &mut n.outside };
+            if *child == NONE {
+                *child = i;
+                return;
+            }
+            node = *child;
+        }
+    }
+
+    // Exact distance from registers to the nearest in category.
+    fn distance(&self, category: &Category, registers: &Registers, stack: &mut Vec<(usize, f32)>) -> f32 {
+        let mut best = f32::MAX;
+        if self.root == NONE {
+            return best;
+        }
+        stack.clear();
+        stack.push((self.root, 0.0));
+        while let Some((node, bound)) = stack.pop() {
+            if bound * (1.0 - PRUNE_SLACK) > best {
+                continue;
+            }
+            let d = registers_distance(&category[node], registers);
+            best = best.min(d);
+            let n = &self.nodes[node];
+            let (near, far, far_bound) = if d < n.threshold {
+                (n.inside, n.outside, n.threshold - d)
+            } else {
+                (n.outside, n.inside, d - n.threshold)
+            };
+            if far != NONE {
+                stack.push((far, far_bound));
+            }
+            if near != NONE {
+                stack.push((near, 0.0));
+            }
+        }
+        best
+    }
+}
+
 //===== Component =====//
 component!(
     {"in": ["cmd"], "out": ["cmd"]},
@@ -82,6 +232,7 @@ component!(
             ],
             "kinds": ["rw", "json"]
         },
+        {"name": "field_helpers", "fields": ["category_capacity"], "kinds": ["rw"]},
         {
             "name": "field_helpers",
             "fields": [
@@ -99,6 +250,7 @@ component!(
             ],
             "kinds": ["r"]
         },
+        {"name": "typed", "commands": ["stft"], "returns": "none"},
     ],
     {
         registers: Registers,
@@ -107,12 +259,18 @@ component!(
         register_width_factor: f32,
         smoothness: f32,
         categories: HashMap<String, Category>,
+        category_indices: HashMap<String, CategoryIndex>,
+        category_capacity: usize, // max registers per category, 0 for no limit
+        category_seen: HashMap<String, u64>, // registers offered to each category, for reservoir sampling
+        categories_generation: u64,
+        search_stack: Vec<(usize, f32)>,
         category_detect_count: HashMap<String, u32>,
         category_sampling: Option<Category>,
         category_detected: Option<String>,
         category_distances: HashMap<String, f32>,
         category_detected_unknown_at: Option<Instant>,
         categories_recent: HashMap<String, u32>,
+        categories_recent_amp: HashMap<String, f32>, // max registers amp of each detection
         known_category_cmd_rate: f32,
         unknown_category_threshold: f32,
         unknown_category_cooldown: f32,
@@ -162,7 +320,13 @@ component!(
             "args": ["name"],
         },
         "category_take_recent": {
-            "args": [],
+            "args": [
+                {
+                    "name": "amps",
+                    "optional": true,
+                    "desc": "if true, values are [count, max amp] instead of count",
+                },
+            ],
             "desc": "Return categories detected since this was last called.",
         },
         "category_list": {
@@ -180,15 +344,32 @@ impl ComponentTrait for Component {
         self.smoothness = 0.9;
         self.unknown_category_threshold = 20.0;
         self.unknown_category_cooldown = 10.0;
+        self.category_capacity = 1024;
+    }
+
+    fn command(&mut self, body: &serde_json::Value) {
+        let name = body["name"].as_str();
+        if name == Some("from_json") || name == Some("categories") && body.has_arg(0) {
+            self.categories_replaced();
+        }
     }
 }
 
 impl Component {
     fn stft_cmd(&mut self, body: serde_json::Value) -> CmdResult {
-        // stft to registers
         let data = json_to_ptr!(body.arg::<serde_json::Value>(0)?, *const f32);
         let len = body.arg(1)?;
-        let stft = unsafe { std::slice::from_raw_parts(data, len) };
+        self.stft(unsafe { std::slice::from_raw_parts(data, len) });
+        Ok(None)
+    }
+
+    fn stft_typed(&mut self, args: &[f32], _result: &mut Vec<f32>) -> TypedResult {
+        self.stft(args);
+        Ok(())
+    }
+
+    fn stft(&mut self, stft: &[f32]) {
+        // stft to registers
         if self.register_count != self.registers.len() {
             self.registers.resize(self.register_count, -10.0);
         }
@@ -211,14 +392,25 @@ impl Component {
         self.detect_unknown_category();
         if let Some(category) = &self.category_detected {
             *self.categories_recent.entry(category.clone()).or_insert(0) += 1;
+            let amp = registers_amp(&self.registers);
+            let amp_max = self.categories_recent_amp.entry(category.clone()).or_insert(amp);
+            *amp_max = amp_max.max(amp);
         }
-        //
-        Ok(None)
     }
 
-    fn category_take_recent_cmd(&mut self, _body: serde_json::Value) -> CmdResult {
-        let j = json!(self.categories_recent);
+    fn category_take_recent_cmd(&mut self, body: serde_json::Value) -> CmdResult {
+        let amps: bool = body.arg(0).unwrap_or(false);
+        let j = if amps {
+            json!(self
+                .categories_recent
+                .iter()
+                .map(|(k, v)| (k, (v, self.categories_recent_amp.get(k))))
+                .collect::<HashMap<_, _>>())
+        } else {
+            json!(self.categories_recent)
+        };
         self.categories_recent.clear();
+        self.categories_recent_amp.clear();
         Ok(Some(j))
     }
 
@@ -249,14 +441,7 @@ impl Component {
         let duration: f32 = body.arg(1).unwrap_or(1.0);
         category_exclude(&mut category_sampling, duration, self.sample_rate, self.run_size);
         let registers = category_avg(&category_sampling);
-        match self.categories.entry(name) {
-            hash_map::Entry::Vacant(i) => {
-                i.insert(vec![registers]);
-            }
-            hash_map::Entry::Occupied(mut i) => {
-                i.get_mut().push(registers);
-            }
-        }
+        self.category_push(name, registers);
         Ok(None)
     }
 
@@ -275,6 +460,7 @@ impl Component {
 
     fn category_create_cmd(&mut self, body: serde_json::Value) -> CmdResult {
         let name: String = body.arg(0)?;
+        self.category_replaced(&name);
         self.categories.insert(name, Vec::new());
         Ok(None)
     }
@@ -282,27 +468,87 @@ impl Component {
     fn category_merge_cmd(&mut self, body: serde_json::Value) -> CmdResult {
         let src: String = body.arg(0)?;
         let dst: String = body.arg(1)?;
-        {
-            let src = self.categories.get(&src).ok_or_else(|| err!("no such src category \"{}\"", src))?.clone();
-            let dst = self.categories.get_mut(&dst).ok_or_else(|| err!("no such dst category \"{}\"", dst))?;
-            dst.extend_from_slice(&src);
+        if !self.categories.contains_key(&dst) {
+            return Err(err!("no such dst category \"{}\"", dst).into());
+        }
+        let src_category = self.categories.remove(&src).ok_or_else(|| err!("no such src category \"{}\"", src))?;
+        self.category_replaced(&src);
+        for registers in src_category {
+            self.category_push(dst.clone(), registers);
         }
-        self.categories.remove(&src);
         Ok(None)
     }
 
     fn category_remove_cmd(&mut self, body: serde_json::Value) -> CmdResult {
         let name: String = body.arg(0)?;
         self.categories.remove(&name);
+        self.category_replaced(&name);
         Ok(None)
     }
 
+    // Forget what's known about a category that's been removed or replaced.
+    fn category_replaced(&mut self, name: &str) {
+        self.category_seen.remove(name);
+        self.category_indices.remove(name);
+    }
+
+    // Categories have been replaced wholesale, by the categories or from_json commands.
+    // Indices from before are stale even if their categories happen to be the same size.
+    fn categories_replaced(&mut self) {
+        self.category_seen.clear();
+        self.categories_generation += 1;
+    }
+
+    // Add registers to a category, keeping at most category_capacity of them, as a uniform sample of all added.
+    fn category_push(&mut self, name: String, registers: Registers) {
+        let category = self.categories.entry(name.clone()).or_insert_with(Vec::new);
+        let seen = self.category_seen.entry(name.clone()).or_insert(category.len() as u64);
+        *seen += 1;
+        let capacity = self.category_capacity;
+        if capacity == 0 || category.len() < capacity {
+            category.push(registers);
+            return;
+        }
+        if category.len() > capacity {
+            // capacity was lowered, keep a random subset
+            for i in 0..capacity {
+                let j = rand::thread_rng().gen_range(i..category.len());
+                category.swap(i, j);
+            }
+            category.truncate(capacity);
+            self.category_indices.remove(&name);
+        }
+        let j = rand::thread_rng().gen_range(0..*seen);
+        if (j as usize) < capacity {
+            category[j as usize] = registers;
+            self.category_indices.remove(&name);
+        }
+    }
+
+    // Bring indices up to date with categories, which can be changed wholesale by the categories and from_json commands.
+    fn index_categories(&mut self) {
+        if self.category_indices.len() != self.categories.len() {
+            let categories = &self.categories;
+            self.category_indices.retain(|name, _| categories.contains_key(name));
+        }
+        for (name, category) in self.categories.iter() {
+            if let Some(index) = self.category_indices.get_mut(name) {
+                let generation = self.categories_generation;
+                if index.is_current(category, generation) || index.update(category, generation) {
+                    continue;
+                }
+            }
+            self.category_indices.insert(name.clone(), CategoryIndex::new(category, self.categories_generation));
+        }
+    }
+
     fn detect_known_category(&mut self) {
+        self.index_categories();
         let mut distance_silence: Option<f32> = None;
         let mut distance_min: Option<f32> = None;
         let mut category_min: Option<&String> = None;
         for (name, category) in self.categories.iter() {
-            let distance = category_distance(category, &self.registers);
+            let distance = self.category_indices[name].distance(category, &self.registers, &mut self.search_stack);
             match self.category_distances.get_mut(name) {
                 Some(d) => {
                     *d = distance;
@@ -373,8 +619,8 @@ impl Component {
             return;
         }
         // Assert we're not near silence.
-        let amp_silence = match self.categories.get("silence") {
-            Some(silence) => category_amp(silence),
+        let amp_silence = match self.category_indices.get("silence") {
+            Some(silence) => silence.amp,
             None => return, // Can't decide there's sound without knowing silence.
         };
         if registers_amp(&self.registers) < amp_silence + self.unknown_category_threshold {
@@ -382,6 +628,7 @@ impl Component {
         }
         // There's an unknown sound. Make a category.
         let name = format!("unknown_{}", chrono::Utc::now().format("%Y-%m-%d_%H-%M-%SZ"));
+        self.category_replaced(&name);
         self.categories.insert(
             name.clone(),
             vec![self.registers.clone()],
@@ -1,4 +1,4 @@
-use dlal_component_base::{component, err, json_to_ptr, serde_json, Body, CmdResult};
+use dlal_component_base::{component, err, json_to_ptr, serde_json, Body, CmdResult, Glide, TypedResult};
 
 use rand::random;
 use rustfft::{num_complex::Complex, FftPlanner};
@@ -69,12 +69,14 @@ component!(
         "uni",
         "check_audio",
         {"name": "field_helpers", "fields": ["smooth"], "kinds": ["rw", "json"]},
+        {"name": "typed", "commands": ["spectrum", "keyframe"], "returns": "none"},
     ],
     {
         joined: bool,
         bins: Vec<NoiseBin>,
         spectrum_e: Vec<f32>,
         spectrum_f: Vec<f32>,
+        glide: Glide,
         smooth: f32,
     },
     {
@@ -92,6 +94,14 @@ component!(
                 "element": "float",
             }],
         },
+        "keyframe": {
+            "args": [{
+                "name": "keyframe",
+                "type": "array[1 + n_bins]",
+                "element": "float",
+                "desc": "Glide duration in samples, followed by the spectrum to glide linearly to. A duration of 0 sets the spectrum immediately.",
+            }],
+        },
         "stft": {
             "args": [{
                 "name": "stft",
@@ -125,6 +135,11 @@ impl ComponentTrait for Component {
     }
 
     fn run(&mut self) {
+        if self.glide.advance(self.run_size, &mut self.spectrum_f) && self.smooth == 0.0 {
+            for i in 0..self.bins.len() {
+                self.bins[i].vol = self.spectrum_f[i];
+            }
+        }
         let output = match self.output.as_ref() {
             Some(v) => v,
             None => return,
@@ -192,6 +207,7 @@ impl Component {
         if spectrum.len() != self.bins.len() {
             return Err(err!("spectrum must be length {}", self.bins.len()).into());
         }
+        self.glide.stop();
         if self.smooth != 0.0 {
             self.spectrum_f = spectrum;
             self.spectrum_e.resize(self.bins.len(), 0.0);
@@ -203,10 +219,55 @@ impl Component {
         Ok(None)
     }
 
+    fn spectrum_typed(&mut self, args: &[f32], _result: &mut Vec<f32>) -> TypedResult {
+        if args.len() != self.bins.len() {
+            return Err(err!("spectrum must be length {}", self.bins.len()).into());
+        }
+        self.glide.stop();
+        if self.smooth != 0.0 {
+            self.spectrum_f.clear();
+            self.spectrum_f.extend_from_slice(args);
+            self.spectrum_e.resize(self.bins.len(), 0.0);
+        } else {
+            for i in 0..self.bins.len() {
+                self.bins[i].vol = args[i];
+            }
+        }
+        Ok(())
+    }
+
+    fn keyframe_cmd(&mut self, body: serde_json::Value) -> CmdResult {
+        let keyframe = body.arg::<Vec<f32>>(0)?;
+        self.keyframe_typed(&keyframe, &mut vec![])?;
+        Ok(None)
+    }
+
+    fn keyframe_typed(&mut self, args: &[f32], result: &mut Vec<f32>) -> TypedResult {
+        if args.len() != 1 + self.bins.len() {
+            return Err(err!("keyframe must be length {}", 1 + self.bins.len()).into());
+        }
+        let duration = args[0] as usize;
+        let spectrum = &args[1..];
+        if duration == 0 {
+            return self.spectrum_typed(spectrum, result);
+        }
+        self.spectrum_f.resize(self.bins.len(), 0.0);
+        if self.smooth == 0.0 {
+            for i in 0..self.bins.len() {
+                self.spectrum_f[i] = self.bins[i].vol;
+            }
+        } else {
+            self.spectrum_e.resize(self.bins.len(), 0.0);
+        }
+        self.glide.start(&self.spectrum_f, spectrum, duration);
+        Ok(())
+    }
+
     fn stft_cmd(&mut self, body: serde_json::Value) -> CmdResult {
         let data = json_to_ptr!(body.arg::<serde_json::Value>(0)?, *const f32);
         let len = body.arg(1)?;
         let stft = unsafe { std::slice::from_raw_parts(data, len) };
+        self.glide.stop();
         for bin in &mut self.bins {
             bin.vol = 0.0;
         }
@@ -227,6 +288,7 @@ impl Component {
     fn piecewise_cmd(&mut self, body: serde_json::Value) -> CmdResult {
         let freqs = body.arg::<Vec<f32>>(0)?;
         let amps = body.arg::<Vec<f32>>(1)?;
+        self.glide.stop();
         let mut spectrum = vec![0.0; self.bins.len()];
         let mut j = 0;
         for (i, v) in spectrum.iter_mut().enumerate() {
@@ -1,4 +1,4 @@
-use dlal_component_base::{component, err, json, serde_json, Body, CmdResult, Error};
+use dlal_component_base::{component, err, json, serde_json, Body, CmdResult, Error, TypedResult};
 
 use std::f32;
 use std::time;
@@ -62,6 +62,7 @@ component!(
         "check_audio",
         {"name": "field_helpers", "fields": ["bend", "phase"], "kinds": ["rw"]},
         {"name": "field_helpers", "fields": ["stay_on"], "kinds": ["rw", "json"]},
+        {"name": "typed", "commands": ["freq"], "returns": "scalar"},
     ],
     {
         wave_str: String,
@@ -204,6 +205,14 @@ impl Component {
         Ok(Some(json!(self.step * self.sample_rate as f32)))
     }
 
+    fn freq_typed(&mut self, args: &[f32], result: &mut Vec<f32>) -> TypedResult {
+        if let Some(freq) = args.first() {
+            self.step = freq / self.sample_rate as f32;
+        }
+        result.push(self.step * self.sample_rate as f32);
+        Ok(())
+    }
+
     fn wave_cmd(&mut self, body: serde_json::Value) -> CmdResult {
         self.wave_set(&body.arg::<String>(0)?)?;
         Ok(None)
@@ -0,0 +1,416 @@
+use dlal_component_base::{
+    component, err, json, json_to_ptr, serde_json, typed_command, Body, CStr, CmdResult,
+    CommandTypedView, TypedResult, View,
+};
+
+// same as speech.FORMANT_RANGES
+const FORMANT_RANGES: [[f32; 2]; 4] = [
+    [0.0, 200.0],
+    [200.0, 1000.0],
+    [800.0, 2300.0],
+    [1500.0, 3200.0],
+];
+
+// A connected output. If it has the typed commands phonan sends it, args are passed directly, otherwise as JSON.
+struct Output {
+    view: View,
+    command_typed_view: Option<CommandTypedView>,
+}
+
+impl Output {
+    // Returns the error message if the command fails.
+    fn send(
+        &self,
+        name: &CStr,
+        args: &[f32],
+        body: impl FnOnce() -> serde_json::Value,
+    ) -> Option<String> {
+        if let Some(command_typed_view) = self.command_typed_view {
+            return typed_command(command_typed_view, self.view.raw, name, args);
+        }
+        let result = self.view.command(&body())?;
+        let error = result.get("error")?;
+        Some(error.as_str().map_or_else(|| error.to_string(), String::from))
+    }
+}
+
+#[derive(Clone, Copy, Debug, Default)]
+struct Formant {
+    freq: f32,
+    amp: f32,
+}
+
+component!(
+    {"in": ["cmd"], "out": ["cmd"]},
+    [
+        "sample_rate",
+        {
+            "name": "connect_info",
+            "args": "view",
+            "kwargs": {
+                "name": "kind",
+                "default": "tone",
+                "options": ["tone", "formants", "noise", "gain_tone", "gain_noise"]
+            }
+        },
+        {"name": "join_info", "kwargs": ["sample_rate"]},
+        {
+            "name": "field_helpers",
+            "fields": [
+                "tone_factor",
+                "noise_factor",
+                "tone_amp_bin_i",
+                "tone_amp_bin_f",
+                "noise_amp_bin_i",
+                "noise_amp_bin_f",
+                "tone_bins",
+                "noise_bins",
+                "noise_freq_min"
+            ],
+            "kinds": ["rw", "json"]
+        },
+        {"name": "field_helpers", "fields": ["toniness", "last_error"], "kinds": ["r"]},
+        {"name": "typed", "commands": ["stft"], "returns": "none"},
+    ],
+    {
+        outputs_tone: Vec<Output>,
+        outputs_formants: Vec<Output>,
+        outputs_noise: Vec<Output>,
+        outputs_gain_tone: Vec<Output>,
+        outputs_gain_noise: Vec<Output>,
+        last_error: String,
+        tone_factor: f32,
+        noise_factor: f32,
+        tone_amp_bin_i: usize,
+        tone_amp_bin_f: usize,
+        noise_amp_bin_i: usize,
+        noise_amp_bin_f: usize,
+        tone_bins: usize,
+        noise_bins: usize,
+        noise_freq_min: f32,
+        // analysis
+        spectrum: Vec<f32>,
+        scratch: Vec<f32>,
+        toniness: f32,
+        formants: [Formant; 4],
+        formants_prev: Option<[Formant; 4]>,
+        tone_spectrum: Vec<f32>,
+        noise_spectrum: Vec<f32>,
+    },
+    {
+        "stft": {
+            "args": [{
+                "name": "stft",
+                "kind": "norm",
+            }],
+        },
+        "params": {
+            "args": [],
+            "desc": "The parameters from the last analysis, like speech.Model.parameterize.",
+        },
+        "reset": {
+            "args": [],
+            "desc": "Forget the formants being tracked.",
+        },
+    },
+);
+
+impl ComponentTrait for Component {
+    fn init(&mut self) {
+        // same as speech.SpeechSampler and speech.Model
+        self.tone_factor = 2e1;
+        self.noise_factor = 1e2;
+        self.tone_amp_bin_i = 1;
+        self.tone_amp_bin_f = 6;
+        self.noise_amp_bin_i = 32;
+        self.noise_amp_bin_f = 256;
+        self.tone_bins = 64;
+        self.noise_bins = 64;
+        self.noise_freq_min = 1000.0;
+    }
+
+    fn connect(&mut self, body: serde_json::Value) -> CmdResult {
+        let connectee = Output {
+            view: View::new(&body.at("args")?)?,
+            command_typed_view: match body.kwarg::<serde_json::Value>("typed") {
+                Ok(typed) => Some(json_to_ptr!(typed, CommandTypedView)),
+                Err(_) => None,
+            },
+        };
+        match body
+            .kwarg::<String>("kind")
+            .unwrap_or("tone".into())
+            .as_str()
+        {
+            "tone" => self.outputs_tone.push(connectee),
+            "formants" => self.outputs_formants.push(connectee),
+            "noise" => self.outputs_noise.push(connectee),
+            "gain_tone" => self.outputs_gain_tone.push(connectee),
+            "gain_noise" => self.outputs_gain_noise.push(connectee),
+            _ => Err(err!("invalid kind"))?,
+        };
+        Ok(None)
+    }
+
+    fn disconnect(&mut self, body: serde_json::Value) -> CmdResult {
+        let connectee = View::new(&body.at("args")?)?;
+        for outputs in [
+            &mut self.outputs_tone,
+            &mut self.outputs_formants,
+            &mut self.outputs_noise,
+            &mut self.outputs_gain_tone,
+            &mut self.outputs_gain_noise,
+        ] {
+            if let Some(i) = outputs.iter().position(|i| i.view == connectee) {
+                outputs.remove(i);
+            }
+        }
+        Ok(None)
+    }
+}
+
+impl Component {
+    fn analyze(&mut self, window_size: usize) {
+        let freq_per_bin = self.sample_rate as f32 / window_size as f32;
+        let n = self.spectrum.len();
+        // toniness
+        let amp_tone = self.tone_factor * band_energy(&self.spectrum, self.tone_amp_bin_i, self.tone_amp_bin_f).sqrt();
+        let amp_noise = self.noise_factor * band_energy(&self.spectrum, self.noise_amp_bin_i, self.noise_amp_bin_f).sqrt();
+        let amp = amp_tone + amp_noise;
+        self.toniness = if amp != 0.0 { amp_tone / amp } else { 0.0 };
+        // formants, tracked from the last run
+        let mut formant_below_freq = 0.0;
+        for (i, [freq_i, freq_f]) in FORMANT_RANGES.iter().enumerate() {
+            let formant_prev_freq = self.formants_prev.map_or(0.0, |f| f[i].freq);
+            self.formants[i] = self.find_formant(
+                freq_per_bin,
+                *freq_i,
+                *freq_f,
+                formant_below_freq,
+                formant_prev_freq,
+            );
+            formant_below_freq = self.formants[i].freq;
+        }
+        self.formants_prev = Some(self.formants);
+        // tone spectrum, bins with amplitudes above twice median
+        self.scratch.clear();
+        self.scratch.extend_from_slice(&self.spectrum);
+        let (_, median, _) = self.scratch.select_nth_unstable_by(n / 2, |a, b| a.total_cmp(b));
+        let median = *median;
+        self.tone_spectrum.resize(self.tone_bins, 0.0);
+        for (i, v) in self.tone_spectrum.iter_mut().enumerate() {
+            *v = match self.spectrum.get(i) {
+                Some(&x) if x > 2.0 * median => x,
+                _ => 0.0,
+            };
+        }
+        // noise spectrum, bins above noise_freq_min summed into noise_bins
+        self.noise_spectrum.clear();
+        self.noise_spectrum.resize(self.noise_bins, 0.0);
+        for (i, x) in self.spectrum.iter().enumerate() {
+            if (i as f32) * freq_per_bin < self.noise_freq_min {
+                continue;
+            }
+            let j = (i as f32 / n as f32 * self.noise_bins as f32) as usize;
+            if j < self.noise_bins {
+                self.noise_spectrum[j] += x;
+            }
+        }
+    }
+
+    // Port of speech.Model.find_formant for a single spectrum.
+    fn find_formant(
+        &self,
+        freq_per_bin: f32,
+        freq_i: f32,
+        freq_f: f32,
+        formant_below_freq: f32,
+        formant_prev_freq: f32,
+    ) -> Formant {
+        let n = self.spectrum.len() as isize;
+        let has_prev = formant_prev_freq != 0.0;
+        // look for formant near where it was before
+        let e = 200.0;
+        let (freq_i, freq_f) = if has_prev {
+            (freq_i.max(formant_prev_freq - e), freq_f.min(formant_prev_freq + e))
+        } else {
+            (freq_i, freq_f)
+        };
+        // convert freq range to bins
+        let bin_f = (freq_f / freq_per_bin).floor() as isize;
+        // make sure above formant below, and non-empty window
+        let formant_below_bin = (formant_below_freq / freq_per_bin).floor() as isize;
+        let bin_i = ((freq_i / freq_per_bin).floor() as isize)
+            .max(formant_below_bin + 4)
+            .min(bin_f - 1);
+        // avoid below formant
+        let spread = 3;
+        let avoid = |i: isize| {
+            formant_below_freq != 0.0
+                && i >= formant_below_bin - spread
+                && i <= formant_below_bin + spread
+        };
+        let value = |i: isize| {
+            if i < 0 || i >= n || avoid(i) {
+                0.0
+            } else {
+                self.spectrum[i as usize]
+            }
+        };
+        // find peak
+        let spread = 2;
+        let mut e_peak = 0.0;
+        let mut bin_max = None;
+        let mut e_min = f32::INFINITY;
+        for i in bin_i.max(0)..bin_f.min(n) {
+            let mut e_window = 0.0;
+            for j in i - spread..=i + spread {
+                e_window += value(j) * value(j);
+            }
+            if e_window > e_peak {
+                e_peak = e_window;
+                bin_max = Some(i);
+            }
+            e_min = e_min.min(e_window);
+        }
+        let bin_peak = match bin_max {
+            Some(i) => i,
+            None if has_prev => (formant_prev_freq / freq_per_bin) as isize,
+            None => (bin_i + bin_f).div_euclid(2),
+        };
+        // adjust based on neighboring bin amps
+        let mut bin_formant = bin_peak as f32;
+        if bin_peak >= spread && bin_peak < n - spread {
+            let mut s = 0.0;
+            let mut centroid = 0.0;
+            for i in bin_peak - spread..=bin_peak + spread {
+                let v2 = value(i) * value(i);
+                s += v2;
+                centroid += i as f32 * v2;
+            }
+            if s != 0.0 {
+                bin_formant = (centroid / s).max(bin_i as f32).min(bin_f as f32);
+            }
+        }
+        // inertia, don't lose prev formant too quickly if there's no strong peak
+        if has_prev && e_min < e_peak && e_min != 0.0 {
+            let t = (e_peak / e_min - 1.0).min(1.0);
+            bin_formant = t * bin_formant + (1.0 - t) * formant_prev_freq / freq_per_bin;
+        }
+        Formant {
+            freq: bin_formant * freq_per_bin,
+            amp: e_peak.sqrt(),
+        }
+    }
+
+    // Send the analysis to outputs, as speech.SpeechSynth.synthesize does.
+    fn send(&mut self) {
+        let (gain_tone, gain_noise) = if self.toniness < 0.2 {
+            (5.0 * self.toniness, 1.0 - 5.0 * self.toniness)
+        } else {
+            (1.0, 0.0)
+        };
+        let mut error = None;
+        for output in &self.outputs_gain_tone {
+            error = output
+                .send(c"set", &[gain_tone], || json!({"name": "set", "args": [gain_tone]}))
+                .or(error);
+        }
+        for output in &self.outputs_gain_noise {
+            error = output
+                .send(c"set", &[gain_noise], || json!({"name": "set", "args": [gain_noise]}))
+                .or(error);
+        }
+        for output in &self.outputs_tone {
+            error = output
+                .send(c"spectrum", &self.tone_spectrum, || {
+                    json!({"name": "spectrum", "args": [self.tone_spectrum]})
+                })
+                .or(error);
+        }
+        if self.formants.iter().all(|i| i.amp < 1e-2) {
+            for output in &self.outputs_formants {
+                error = output
+                    .send(c"zero", &[], || json!({"name": "zero", "args": []}))
+                    .or(error);
+            }
+        } else {
+            // a keyframe with no glide, like the formants command
+            let mut keyframe = [0.0; 1 + 2 * FORMANT_RANGES.len()];
+            for (i, formant) in self.formants.iter().enumerate() {
+                keyframe[1 + 2 * i] = formant.freq;
+                keyframe[2 + 2 * i] = formant.amp;
+            }
+            for output in &self.outputs_formants {
+                error = output
+                    .send(c"keyframe", &keyframe, || {
+                        json!({"name": "formants", "args": [self.formants_json()]})
+                    })
+                    .or(error);
+            }
+        }
+        for output in &self.outputs_noise {
+            error = output
+                .send(c"spectrum", &self.noise_spectrum, || {
+                    json!({"name": "spectrum", "args": [self.noise_spectrum]})
+                })
+                .or(error);
+        }
+        if let Some(error) = error {
+            self.last_error = error;
+        }
+    }
+
+    fn formants_json(&self) -> serde_json::Value {
+        json!(self
+            .formants
+            .iter()
+            .map(|i| json!({"freq": i.freq, "amp": i.amp}))
+            .collect::<Vec<_>>())
+    }
+
+    fn stft(&mut self, stft: &[f32]) {
+        self.spectrum.clear();
+        self.spectrum.extend_from_slice(&stft[..stft.len() / 2 + 1]);
+        self.analyze(stft.len());
+        self.send();
+    }
+
+    fn stft_cmd(&mut self, body: serde_json::Value) -> CmdResult {
+        let data = json_to_ptr!(body.arg::<serde_json::Value>(0)?, *const f32);
+        let len: usize = body.arg(1)?;
+        self.stft(unsafe { std::slice::from_raw_parts(data, len) });
+        Ok(None)
+    }
+
+    fn stft_typed(&mut self, args: &[f32], _result: &mut Vec<f32>) -> TypedResult {
+        self.stft(args);
+        Ok(())
+    }
+
+    fn params_cmd(&mut self, _body: serde_json::Value) -> CmdResult {
+        Ok(Some(json!({
+            "toniness": self.toniness,
+            "tone": {
+                "formants": self.formants_json(),
+                "spectrum": self.tone_spectrum,
+            },
+            "noise": {
+                "spectrum": self.noise_spectrum,
+            },
+        })))
+    }
+
+    fn reset_cmd(&mut self, _body: serde_json::Value) -> CmdResult {
+        self.formants_prev = None;
+        Ok(None)
+    }
+}
+
+fn band_energy(spectrum: &[f32], bin_i: usize, bin_f: usize) -> f32 {
+    let bin_f = bin_f.min(spectrum.len());
+    if bin_i >= bin_f {
+        return 0.0;
+    }
+    spectrum[bin_i..bin_f].iter().map(|i| i * i).sum()
+}
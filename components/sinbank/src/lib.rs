@@ -1,4 +1,4 @@
-use dlal_component_base::{component, json_to_ptr, serde_json, Body, CmdResult};
+use dlal_component_base::{component, err, json_to_ptr, serde_json, Body, CmdResult, Glide, TypedResult};
 
 use std::f32;
 use std::f32::consts::PI;
@@ -18,12 +18,14 @@ component!(
         "check_audio",
         {"name": "field_helpers", "fields": ["bend", "phase"], "kinds": ["rw"]},
         {"name": "field_helpers", "fields": ["bin_size", "smooth"], "kinds": ["json", "rw"]},
+        {"name": "typed", "commands": ["spectrum", "keyframe"], "returns": "none"},
     ],
     {
         harmonics: u32,
         spectrum: Vec<f32>,
         spectrum_e: Vec<f32>,
         spectrum_f: Vec<f32>,
+        glide: Glide,
         bin_size: f32,
         bend: f32,
         step: f32,
@@ -42,6 +44,14 @@ component!(
                 "desc": "An array of bin amplitudes. Bins are 100 Hz by default.",
             }],
         },
+        "keyframe": {
+            "args": [{
+                "name": "keyframe",
+                "type": "array",
+                "element": "float",
+                "desc": "Glide duration in samples, followed by the spectrum to glide linearly to. A duration of 0 sets the spectrum immediately.",
+            }],
+        },
         "stft": {
             "args": [{
                 "name": "stft",
@@ -66,6 +76,11 @@ impl ComponentTrait for Component {
     }
 
     fn run(&mut self) {
+        if self.smooth != 0.0 {
+            self.glide.advance(self.run_size, &mut self.spectrum_f);
+        } else {
+            self.glide.advance(self.run_size, &mut self.spectrum);
+        }
         let output = match self.output.as_ref() {
             Some(v) => v,
             None => return,
@@ -133,6 +148,7 @@ impl ComponentTrait for Component {
 
 impl Component {
     fn spectrum_cmd(&mut self, body: serde_json::Value) -> CmdResult {
+        self.glide.stop();
         if self.smooth != 0.0 {
             self.spectrum_f = body.arg(0)?;
             if self.spectrum.len() != self.spectrum_f.len() {
@@ -145,16 +161,58 @@ impl Component {
         Ok(None)
     }
 
+    fn spectrum_typed(&mut self, args: &[f32], _result: &mut Vec<f32>) -> TypedResult {
+        self.glide.stop();
+        if self.smooth != 0.0 {
+            self.spectrum_f.clear();
+            self.spectrum_f.extend_from_slice(args);
+            if self.spectrum.len() != self.spectrum_f.len() {
+                self.spectrum_e.resize(self.spectrum_f.len(), 0.0);
+                self.spectrum.resize(self.spectrum_f.len(), 0.0);
+            }
+        } else {
+            self.spectrum.clear();
+            self.spectrum.extend_from_slice(args);
+        }
+        Ok(())
+    }
+
+    fn keyframe_cmd(&mut self, body: serde_json::Value) -> CmdResult {
+        let keyframe = body.arg::<Vec<f32>>(0)?;
+        self.keyframe_typed(&keyframe, &mut vec![])?;
+        Ok(None)
+    }
+
+    fn keyframe_typed(&mut self, args: &[f32], result: &mut Vec<f32>) -> TypedResult {
+        if args.is_empty() {
+            return Err(err!("keyframe must start with a glide duration").into());
+        }
+        let duration = args[0] as usize;
+        let spectrum = &args[1..];
+        let current = if self.smooth != 0.0 {
+            &self.spectrum_f
+        } else {
+            &self.spectrum
+        };
+        if duration == 0 || current.len() != spectrum.len() {
+            return self.spectrum_typed(spectrum, result);
+        }
+        self.glide.start(current, spectrum, duration);
+        Ok(())
+    }
+
     fn stft_cmd(&mut self, body: serde_json::Value) -> CmdResult {
         let data = json_to_ptr!(body.arg::<serde_json::Value>(0)?, *const f32);
         let len = body.arg(1)?;
         let stft = unsafe { std::slice::from_raw_parts(data, len) };
+        self.glide.stop();
         self.spectrum.resize(len, 0.0);
         self.spectrum.copy_from_slice(stft);
         Ok(None)
     }
 
     fn zero_cmd(&mut self, _body: serde_json::Value) -> CmdResult {
+        self.glide.stop();
         for i in self.spectrum.iter_mut() { *i = 0.0; }
         for i in self.spectrum_e.iter_mut() { *i = 0.0; }
         for i in self.spectrum_f.iter_mut() { *i = 0.0; }
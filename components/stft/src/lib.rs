@@ -1,10 +1,19 @@
-use dlal_component_base::{component, err, json, serde_json, Body, CmdResult, View};
+use dlal_component_base::{
+    component, err, json, json_to_ptr, serde_json, typed_command, Body, CmdResult,
+    CommandTypedView, TypedResult, View,
+};
 
 use rustfft::{num_complex::Complex, Fft, FftPlanner};
 
 use std::f32::consts::PI;
 use std::sync::Arc;
 
+// A connected output. If it has a typed stft command, the spectrum is passed to it directly, otherwise as a pointer in a JSON command.
+struct Output {
+    view: View,
+    command_typed_view: Option<CommandTypedView>,
+}
+
 component!(
     {"in": ["audio"], "out": ["cmd"]},
     [
@@ -20,11 +29,16 @@ component!(
         },
         {"name": "join_info", "kwargs": ["run_size"]},
         {"name": "field_helpers", "fields": ["last_error"], "kinds": ["r"]},
-        {"name": "field_helpers", "fields": ["smooth"], "kinds": ["rw", "json"]},
+        {"name": "field_helpers", "fields": ["smooth", "hop_size"], "kinds": ["rw", "json"]},
+        {"name": "typed", "commands": ["spectrum"], "returns": "array"},
     ],
     {
-        outputs_norm: Vec<View>,
-        input: Vec<f32>,
+        outputs_norm: Vec<Output>,
+        input: Vec<f32>, // ring buffer, oldest sample at input_pos
+        input_pos: usize,
+        window: Vec<f32>,
+        hop_size: usize, // samples between FFTs, 0 for every run
+        since_hop: usize,
         fft: Option<Arc<dyn Fft<f32>>>,
         buffer: Vec<Complex<f32>>,
         scratch: Vec<Complex<f32>>,
@@ -41,7 +55,12 @@ component!(
 
 impl Component {
     fn set_window_size(&mut self, size: usize) {
+        self.input.clear();
         self.input.resize(size, 0.0);
+        self.input_pos = 0;
+        self.window = (0..size)
+            .map(|i| 1.0 - (2.0 * PI * i as f32 / (size as f32 - 1.0)).cos())
+            .collect();
         self.fft = Some(FftPlanner::new().plan_fft_forward(size));
         self.buffer.resize(size, Complex { re: 0.0, im: 0.0 });
         self.scratch.resize(
@@ -65,59 +84,45 @@ impl ComponentTrait for Component {
     }
 
     fn run(&mut self) {
-        let window_size = self.input.len();
-        for i in 0..window_size - self.run_size {
-            self.input[i] = self.input[i + self.run_size];
+        self.write_input();
+        for i in &mut self.audio {
+            *i = 0.0;
         }
-        for i in 0..self.run_size {
-            self.input[window_size - self.run_size + i] = self.audio[i];
+        self.since_hop += self.run_size;
+        if self.since_hop < self.hop_size {
+            return;
         }
-        for i in 0..window_size {
-            let w = 1.0 - (2.0 * PI * i as f32 / (window_size as f32 - 1.0)).cos();
-            self.buffer[i] = Complex {
-                re: self.input[i] * w,
-                im: 0.0,
-            };
+        self.since_hop = if self.hop_size == 0 { 0 } else { self.since_hop % self.hop_size };
+        self.transform();
+        if self.outputs_norm.is_empty() {
+            return;
         }
-        self.fft
-            .as_ref()
-            .unwrap()
-            .process_with_scratch(&mut self.buffer, &mut self.scratch);
-        if !self.outputs_norm.is_empty() {
-            for i in 0..window_size {
-                self.output_norm[i] *= self.smooth;
-                self.output_norm[i] +=
-                    (1.0 - self.smooth) * (self.buffer[i].norm() / window_size as f32);
-            }
-        }
-        for output in &self.outputs_norm {
-            let body = json!({
-                "name": "stft",
-                "args": [
-                    (self.output_norm.as_ptr() as usize).to_string(),
-                    window_size,
-                ],
-            });
-            if let Some(result) = output.command(&body) {
-                if let Some(error) = result.get("error") {
-                    self.last_error = error.as_str().unwrap_or(&error.to_string()).into();
-                }
-            }
+        let window_size = self.input.len();
+        for (o, b) in self.output_norm.iter_mut().zip(&self.buffer) {
+            *o *= self.smooth;
+            *o += (1.0 - self.smooth) * (b.norm() / window_size as f32);
         }
-        for i in &mut self.audio {
-            *i = 0.0;
+        for i in 0..self.outputs_norm.len() {
+            self.send_norm(i);
         }
     }
 
     fn connect(&mut self, body: serde_json::Value) -> CmdResult {
         let connectee = View::new(&body.at("args")?)?;
+        let command_typed_view = match body.kwarg::<serde_json::Value>("typed") {
+            Ok(typed) => Some(json_to_ptr!(typed, CommandTypedView)),
+            Err(_) => None,
+        };
         match body
             .kwarg::<String>("kind")
             .unwrap_or("norm".into())
             .as_str()
         {
             "norm" => {
-                self.outputs_norm.push(connectee);
+                self.outputs_norm.push(Output {
+                    view: connectee,
+                    command_typed_view,
+                });
             }
             _ => Err(err!("invalid kind"))?,
         };
@@ -126,7 +131,7 @@ impl ComponentTrait for Component {
 
     fn disconnect(&mut self, body: serde_json::Value) -> CmdResult {
         let connectee = View::new(&body.at("args")?)?;
-        if let Some(i) = self.outputs_norm.iter().position(|i| i == &connectee) {
+        if let Some(i) = self.outputs_norm.iter().position(|i| i.view == connectee) {
             self.outputs_norm.remove(i);
         }
         Ok(None)
@@ -146,13 +151,65 @@ impl ComponentTrait for Component {
 }
 
 impl Component {
+    // Copy this run's audio into the ring buffer, overwriting the oldest samples.
+    fn write_input(&mut self) {
+        let window_size = self.input.len();
+        let audio = &self.audio[self.run_size.saturating_sub(window_size)..self.run_size];
+        let first = audio.len().min(window_size - self.input_pos);
+        self.input[self.input_pos..self.input_pos + first].copy_from_slice(&audio[..first]);
+        self.input[..audio.len() - first].copy_from_slice(&audio[first..]);
+        self.input_pos = (self.input_pos + audio.len()) % window_size;
+    }
+
+    // Window the ring buffer, oldest sample first, and FFT it into buffer.
+    fn transform(&mut self) {
+        let (new, old) = self.input.split_at(self.input_pos);
+        for ((b, x), w) in self
+            .buffer
+            .iter_mut()
+            .zip(old.iter().chain(new))
+            .zip(&self.window)
+        {
+            *b = Complex { re: x * w, im: 0.0 };
+        }
+        self.fft
+            .as_ref()
+            .unwrap()
+            .process_with_scratch(&mut self.buffer, &mut self.scratch);
+    }
+
+    fn send_norm(&mut self, i: usize) {
+        let output = &self.outputs_norm[i];
+        let window_size = self.output_norm.len();
+        if let Some(command_typed_view) = output.command_typed_view {
+            if let Some(error) =
+                typed_command(command_typed_view, output.view.raw, c"stft", &self.output_norm)
+            {
+                self.last_error = error;
+            }
+            return;
+        }
+        let body = json!({
+            "name": "stft",
+            "args": [
+                (self.output_norm.as_ptr() as usize).to_string(),
+                window_size,
+            ],
+        });
+        if let Some(result) = output.view.command(&body) {
+            if let Some(error) = result.get("error") {
+                self.last_error = error.as_str().unwrap_or(&error.to_string()).into();
+            }
+        }
+    }
+
     fn window_size_cmd(&mut self, body: serde_json::Value) -> CmdResult {
         self.set_window_size(body.arg(0)?);
         Ok(None)
     }
 
     fn spectrum_cmd(&mut self, _body: serde_json::Value) -> CmdResult {
-        let window_size = self.input.len();
+        let window_size = self.buffer.len();
         Ok(Some(json!(
             self.buffer[..window_size / 2 + 1]
                 .iter()
@@ -161,8 +218,18 @@ impl Component {
         )))
     }
 
+    fn spectrum_typed(&mut self, _args: &[f32], result: &mut Vec<f32>) -> TypedResult {
+        let window_size = self.buffer.len();
+        result.extend(
+            self.buffer[..window_size / 2 + 1]
+                .iter()
+                .map(|i| i.norm() / window_size as f32)
+        );
+        Ok(())
+    }
+
     fn cepstrum_cmd(&mut self, _body: serde_json::Value) -> CmdResult {
-        let window_size = self.input.len();
+        let window_size = self.buffer.len();
         let mut buffer = self.buffer
             .iter()
             .map(|i| Complex {
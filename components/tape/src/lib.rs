@@ -1,4 +1,4 @@
-use dlal_component_base::{component, err, json, serde_json, Body, CmdResult};
+use dlal_component_base::{component, err, json, json_to_ptr, serde_json, Body, CmdResult};
 
 use multiqueue2::{MPMCSender, MPMCUniReceiver};
 
@@ -18,6 +18,21 @@ component!(
         "resize": {"args": ["size"]},
         "clear": {},
         "read": {"args": ["size"]},
+        "read_into": {
+            "args": [
+                {
+                    "name": "buffer",
+                    "desc": "pointer to f32 buffer, as a string",
+                },
+                "size",
+                {
+                    "name": "block",
+                    "default": false,
+                    "desc": "wait until size samples have been read",
+                },
+            ],
+            "return": "number of samples read",
+        },
     },
 );
 
@@ -94,4 +109,29 @@ impl Component {
         };
         Ok(Some(json!(audio)))
     }
+
+    fn read_into_cmd(&mut self, body: serde_json::Value) -> CmdResult {
+        let recv = match self.recv.as_ref() {
+            Some(recv) => recv,
+            None => return Err(err!("not initialized").into()),
+        };
+        let data = json_to_ptr!(body.arg::<serde_json::Value>(0)?, *mut f32);
+        let size = body.arg(1)?;
+        let block = body.arg(2).unwrap_or(false);
+        let buffer = unsafe { std::slice::from_raw_parts_mut(data, size) };
+        let mut read = 0;
+        for i in buffer.iter_mut() {
+            let x = if block {
+                recv.recv().ok()
+            } else {
+                recv.try_recv().ok()
+            };
+            match x {
+                Some(x) => *i = x,
+                None => break,
+            }
+            read += 1;
+        }
+        Ok(Some(json!(read)))
+    }
 }
@@ -0,0 +1,85 @@
+'''Asyncio front end.
+
+Calls into components are made from a single dispatcher thread, so coroutines can drive many subsystems concurrently without blocking their event loops or needing a thread per producer.
+
+Calls that wait on the audio thread, like attached comm queues, return a `Poll` instead of blocking, and the dispatcher checks on it between other calls.'''
+
+import asyncio
+import queue
+import threading
+
+POLL_PERIOD = 0.0005
+
+class Poll:
+    '''Returned by a dispatched call that finishes later. The dispatcher calls `f` until it returns something other than `Poll.pending`, which becomes the result.'''
+
+    pending = object()
+
+    def __init__(self, f):
+        self.f = f
+
+class Dispatcher:
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.polls = []
+        self.thread = threading.Thread(target=self._main, name='dlal-dispatcher', daemon=True)
+        self.thread.start()
+
+    def submit(self, f, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.queue.put((f, args, kwargs, loop, future))
+        return future
+
+    def _main(self):
+        while True:
+            try:
+                f, args, kwargs, loop, future = self.queue.get(timeout=POLL_PERIOD if self.polls else None)
+            except queue.Empty:
+                pass
+            else:
+                self._call(lambda: f(*args, **kwargs), loop, future)
+            polls = self.polls
+            self.polls = []
+            for poll, loop, future in polls:
+                self._call(poll.f, loop, future)
+
+    def _call(self, f, loop, future):
+        try:
+            result = f()
+        except Exception as e:
+            _reply(loop, future, None, e)
+            return
+        if isinstance(result, Poll):
+            self.polls.append((result, loop, future))
+        elif result is Poll.pending:
+            self.polls.append((Poll(f), loop, future))
+        else:
+            _reply(loop, future, result, None)
+
+def _reply(loop, future, result, exception):
+    try:
+        loop.call_soon_threadsafe(_settle, future, result, exception)
+    except RuntimeError:
+        pass  # the loop closed, nobody's waiting
+
+def _settle(future, result, exception):
+    if future.cancelled(): return
+    if exception:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher == None:
+            _dispatcher = Dispatcher()
+        return _dispatcher
+
+async def dispatch(f, *args, **kwargs):
+    '''Call `f` on the dispatcher thread and await its result. If `f` returns a `Poll`, its eventual result is awaited.'''
+    return await dispatcher().submit(f, *args, **kwargs)
@@ -0,0 +1,113 @@
+import numpy as np
+
+import contextlib
+import hashlib
+import json
+import os
+from pathlib import Path
+
+CACHE_DIR = Path(os.environ.get('DLAL_CACHE_DIR', Path.home() / '.cache' / 'dlal'))
+
+def file_hash(path):
+    '''SHA-256 of a file's contents, for keying results derived from it.'''
+    h = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+class DiskCache:
+    '''Content-addressed cache of float32 arrays, stored as .npy files.
+
+    Keys are JSON-serializable values. When the files total more than `max_bytes`, the least recently used are evicted.'''
+
+    suffix = '.npy'
+
+    def __init__(self, name, max_bytes=1 << 28):
+        self.path = CACHE_DIR / name
+        self.max_bytes = max_bytes
+
+    def file_path(self, key):
+        text = json.dumps(key, sort_keys=True)
+        return self.path / (hashlib.sha256(text.encode('utf-8')).hexdigest()[:32] + self.suffix)
+
+    def get(self, key):
+        path = self.file_path(key)
+        try:
+            with open(path, 'rb') as file:
+                result = self.load(file)
+        except (OSError, ValueError):
+            return
+        with contextlib.suppress(OSError):
+            os.utime(path)  # mark as recently used
+        return result
+
+    def put(self, key, value):
+        value = self.prepare(value)
+        self.path.mkdir(parents=True, exist_ok=True)
+        path = self.file_path(key)
+        tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp_path, 'wb') as file:
+            self.save(file, value)
+        os.replace(tmp_path, path)
+        self.evict()
+        return value
+
+    def prepare(self, value):
+        return np.asarray(value, dtype=np.float32)
+
+    def load(self, file):
+        return np.load(file)
+
+    def save(self, file, value):
+        np.save(file, value)
+
+    def evict(self):
+        entries = []
+        for path in self.path.glob('*' + self.suffix):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes: break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        for path in self.path.glob('*' + self.suffix):
+            path.unlink()
+
+class JsonDiskCache(DiskCache):
+    '''Like `DiskCache`, for JSON-serializable values, stored as .json files.'''
+
+    suffix = '.json'
+
+    def prepare(self, value):
+        return value
+
+    def load(self, file):
+        return json.loads(file.read().decode('utf-8'))
+
+    def save(self, file, value):
+        file.write(json.dumps(value).encode('utf-8'))
+
+class NpzDiskCache(DiskCache):
+    '''Like `DiskCache`, for dicts of arrays, stored as uncompressed .npz files.'''
+
+    suffix = '.npz'
+
+    def prepare(self, value):
+        return {k: np.asarray(v) for k, v in value.items()}
+
+    def load(self, file):
+        with np.load(file) as npz:
+            return {k: npz[k] for k in npz.files}
+
+    def save(self, file, value):
+        np.savez(file, **value)
@@ -1,6 +1,8 @@
 from . import _logging
+from ._async import dispatch
 from ._utils import DIR, JsonEncoder
 
+import numpy as np
 import obvious
 
 import collections
@@ -38,6 +40,7 @@ class Component:
     _libs = {}
     _components = {}
     _connections = collections.defaultdict(dict)
+    _connections_version = 0
     _driver = None
     _comm = None
     _detach = False
@@ -64,7 +67,9 @@ class Component:
             def typical_command(self, *args, **kwargs):
                 return self.command(name, args, kwargs)
             return types.MethodType(typical_command, self)
+        self._typed = {}
         for item in self.command_immediate('list'):
+            if 'typed' in item: self._typed[item['name']] = item['typed']
             if hasattr(self, item['name']): continue
             setattr(
                 self,
@@ -102,8 +107,20 @@ class Component:
         else:
             return self.command_immediate(name, args, kwargs)
 
+    async def acommand(self, name, args=[], kwargs={}, timeout_ms=40):
+        '''Like `command`, but awaitable; the command is issued from the dispatcher thread.'''
+        comm = Component._comm
+        if comm:
+            log('debug', f'{self.name} queue {name} {args} {kwargs}')
+            return await comm.aqueue(self, name, args, kwargs, timeout_ms=timeout_ms, detach=self._detach)
+        return await dispatch(self.command_immediate, name, args, kwargs)
+
     def command_immediate(self, name, args=[], kwargs={}):
         log('debug', f'{self.name} {name} {args} {kwargs}')
+        if name in self._typed and not kwargs:
+            typed_args = Component._typed_args(args)
+            if typed_args is not None:
+                return self.command_typed(name, typed_args)
         body = json.dumps(
             {
                 'name': name,
@@ -119,6 +136,31 @@ class Component:
             raise Exception(result['error'])
         return result
 
+    def command_typed(self, name, args):
+        '''Call a typed command, passing `args` as a contiguous float32 array.
+
+        The result is unpacked according to the command's declared `typed` return kind.
+        '''
+        result = ctypes.POINTER(ctypes.c_float)()
+        result_len = ctypes.c_size_t()
+        error = self._lib.command_typed(
+            self._raw,
+            name.encode('utf-8'),
+            args.ctypes.data,
+            args.size,
+            ctypes.byref(result),
+            ctypes.byref(result_len),
+        )
+        if error:
+            raise Exception(json.loads(error.decode('utf-8'))['error'])
+        returns = self._typed[name]
+        if returns == 'scalar':
+            if not result_len.value: return
+            return float(result[0])
+        elif returns == 'array':
+            if not result_len.value: return []
+            return np.ctypeslib.as_array(result, (result_len.value,)).tolist()
+
     def list(self):
         def py(command):
             spec = inspect.getfullargspec(command)
@@ -158,20 +200,43 @@ class Component:
         else:
             log('debug', f'connect {self.name} {other.name}')
         if toggle and other.name in Component._connections.get(self.name, {}):
-            result = self.command('disconnect', other._view())
-            del Component._connections[self.name][other.name]
-        else:
-            result = self.command('connect', other._view(), extra)
-            Component._connections[self.name][other.name] = extra
-        return result
+            return self.disconnect(other)
+        # a parallel driver must know about the connection before it's made
+        connections = Component._connections[self.name]
+        old_connections = dict(connections)
+        connections[other.name] = extra
+        Component._connections_version += 1
+        Component._parallel_sync()
+        try:
+            return self.command('connect', other._view(), self._connect_kwargs(other, extra))
+        except:
+            Component._connections[self.name] = old_connections
+            Component._connections_version += 1
+            Component._parallel_sync()
+            raise
 
     def disconnect(self, other):
         log('debug', f'disconnect {self.name} {other.name}')
         result = self.command('disconnect', other._view())
         connections = Component._connections[self.name]
         if other.name in connections: del connections[other.name]
+        Component._connections_version += 1
+        Component._parallel_sync()
         return result
 
+    def _parallel_sync():
+        '''Keep a parallel driver's schedule in step with connections, so components that share a connection never run concurrently.'''
+        driver = Component._driver
+        if driver and getattr(driver, 'parallel_threads', 0) > 1:
+            driver.parallel_sync()
+
+    def _connect_kwargs(self, other, extra):
+        '''Kwargs for the connect command. Only `extra` is recorded in `_connections`, so these can hold pointers.'''
+        return extra
+
+    def _typed_view(self):
+        return str(ctypes.cast(self._lib.command_typed, ctypes.c_void_p).value)
+
     def midi(self, msg):
         if isinstance(msg, list) and len(msg) and hasattr(msg[0], '__iter__'):
             return [self.command('midi', [list(i)]) for i in msg]
@@ -188,9 +253,30 @@ class Component:
         obvious.set_ffi_types(lib.construct, 'void*', str)
         obvious.set_ffi_types(lib.destruct, None, 'void*')
         obvious.set_ffi_types(lib.command, str, 'void*', str)
+        obvious.set_ffi_types(
+            lib.command_typed,
+            str,
+            'void*',
+            str,
+            'void*',
+            ctypes.c_size_t,
+            ctypes.POINTER(ctypes.POINTER(ctypes.c_float)),
+            ctypes.POINTER(ctypes.c_size_t),
+        )
         Component._libs[kind] = lib
         return lib
 
+    def _typed_args(args):
+        try:
+            if len(args) == 1 and hasattr(args[0], '__len__'):
+                typed_args = np.ascontiguousarray(args[0], dtype=np.float32)
+            else:
+                typed_args = np.array(args, dtype=np.float32)
+        except (TypeError, ValueError):
+            return
+        if typed_args.ndim != 1: return
+        return typed_args
+
     def _view(self):
         return [
             str(self._raw),
@@ -1,3 +1,5 @@
+import numpy as _np
+
 import math as _math
 import random as _random
 
@@ -85,6 +87,57 @@ class Delay:
         self.buf.insert(0, y)
         return y
 
+#===== block helpers =====#
+# Array counterparts of the generator and helpers above, for rendering whole sounds at once.
+def times(duration, sample_rate):
+    '''Sample times, matching the samples `Generator.generate` produces.'''
+    n = _np.arange(int(duration * sample_rate) + 2)
+    return n[n / sample_rate <= duration] / sample_rate
+
+def ramp(a, b, t):
+    return a + (b - a) * _np.clip(t, 0, 1)
+
+def phase(freq, sample_rate):
+    '''Accumulated phase of a `Generator.Phase` advanced by `freq` each sample.'''
+    return _np.cumsum(freq / sample_rate) % 1
+
+def recurrence(a, c):
+    '''Solve y[n] = a[n] * y[n-1] + c[n], with y[-1] = 0.
+
+    Uses a parallel prefix scan, so it takes log2(len) array operations instead of a Python loop.'''
+    a = _np.array(a, dtype=float)
+    c = _np.array(c, dtype=float)
+    shift = 1
+    while shift < len(c):
+        c[shift:] = c[shift:] + a[shift:] * c[:-shift]
+        a[shift:] = a[shift:] * a[:-shift]
+        shift *= 2
+    return c
+
+def lpf(x, lowness):
+    '''Block version of `Lpf`; `lowness` can vary per sample.'''
+    lowness = _np.broadcast_to(lowness, x.shape)
+    return recurrence(lowness, (1 - lowness) * x)
+
+def hpf(x, highness):
+    '''Block version of `Hpf`; `highness` can vary per sample.'''
+    highness = _np.broadcast_to(highness, x.shape)
+    return recurrence(1 - highness, (1 - highness) * _np.diff(x, prepend=0))
+
+def delay(x, amt, decay):
+    '''Block version of `Delay`; `amt` can vary per sample.
+
+    The output doubles as the delay line, so there's no per-sample buffer growth.'''
+    amt = _np.broadcast_to(_np.asarray(amt, dtype=float), x.shape)
+    a = amt.astype(int).tolist()
+    t = (amt - amt.astype(int)).tolist()
+    y = _np.array(x, dtype=float).tolist()
+    for n in range(len(y)):
+        i = n - 1 - a[n]  # index of buf[a], where buf[0] is the previous sample
+        if i - 1 < 0: continue  # buf[b] must exist
+        y[n] += decay * ((1 - t[n]) * y[i] + t[n] * y[i - 1])
+    return _np.array(y)
+
 #===== instruments =====#
 #----- drums -----#
 def drum(
@@ -98,32 +151,19 @@ def drum(
     hi_i=0,
     hi_f=0,
 ):
-    class Drum(Generator):
-        def init(self):
-            self.duration = duration
-            self.bodies = [[*body, self.Phase()] for body in bodies]
-            self.lpf1 = Lpf()
-            self.lpf2 = Lpf()
-            self.hpf1 = Hpf()
-            self.hpf2 = Hpf()
-
-        def amp(self, t):
-            envelope = 0.01 ** self.ramp(0, 1, t / self.duration)
-            x = tail_amp * self.rand() * envelope
-            for freq_i, freq_f, amp, duration, phase in self.bodies:
-                if t > duration: continue
-                phase += self.ramp(freq_i, freq_f, t / duration)
-                envelope = 0.01 ** self.ramp(0, 1, t / duration)
-                x += amp * self.sin(phase) * envelope
-            lowness = self.ramp(lo_i, lo_f, t / self.duration)
-            x = self.lpf1(x, lowness)
-            x = self.lpf2(x, lowness)
-            highness = self.ramp(hi_i, hi_f, t / self.duration)
-            x = self.hpf1(x, highness)
-            x = self.hpf2(x, highness)
-            return self.clamp(x)
-
-    return Drum(sample_rate).generate()
+    t = times(duration, sample_rate)
+    u = t / duration
+    x = tail_amp * (_np.random.random(len(t)) * 2 - 1) * 0.01 ** ramp(0, 1, u)
+    for freq_i, freq_f, amp, body_duration in bodies:
+        n = t <= body_duration
+        t_body = t[n] / body_duration
+        phase_body = phase(ramp(freq_i, freq_f, t_body), sample_rate)
+        x[n] += amp * _np.sin(_math.tau * phase_body) * 0.01 ** ramp(0, 1, t_body)
+    lowness = ramp(lo_i, lo_f, u)
+    x = lpf(lpf(x, lowness), lowness)
+    highness = ramp(hi_i, hi_f, u)
+    x = hpf(hpf(x, highness), highness)
+    return _np.clip(x, -1, 1).tolist()
 
 def kick(
     *,
@@ -250,36 +290,14 @@ def hat(
     delay2_decay=0.5,
     lowness=0.2,
 ):
-    class Hat(Generator):
-        def init(self):
-            self.duration = duration
-            self.hpf1 = Hpf()
-            self.hpf2 = Hpf()
-            self.hpf3 = Hpf()
-            self.hpf4 = Hpf()
-            self.delay = Delay()
-            self.delay2 = Delay()
-            self.lpf1 = Lpf()
-            self.lpf2 = Lpf()
-            self.lpf3 = Lpf()
-            self.lpf4 = Lpf()
-
-        def amp(self, t):
-            envelope = 0.005 ** self.ramp(0, 1, t / duration)
-            delay1_freq = self.ramp(delay1_freq_i, delay1_freq_f, t / duration)
-            delay2_freq = self.ramp(delay2_freq_i, delay2_freq_f, t / duration)
-            highness = self.ramp(highness_i, highness_f, t / duration)
-            x = amp * self.rand() * envelope
-            x = self.delay(x, sample_rate // delay1_freq, delay1_decay)
-            x = self.delay2(x, sample_rate // delay2_freq, delay2_decay)
-            x = self.lpf1(x, lowness)
-            x = self.lpf2(x, lowness)
-            x = self.lpf3(x, lowness)
-            x = self.lpf4(x, lowness)
-            x = self.hpf1(x, highness)
-            x = self.hpf2(x, highness)
-            x = self.hpf3(x, highness)
-            x = self.hpf4(x, highness)
-            return self.clamp(x)
-
-    return Hat(sample_rate).generate()
+    t = times(duration, sample_rate)
+    u = t / duration
+    highness = ramp(highness_i, highness_f, u)
+    x = amp * (_np.random.random(len(t)) * 2 - 1) * 0.005 ** ramp(0, 1, u)
+    x = delay(x, sample_rate // ramp(delay1_freq_i, delay1_freq_f, u), delay1_decay)
+    x = delay(x, sample_rate // ramp(delay2_freq_i, delay2_freq_f, u), delay2_decay)
+    for i in range(4):
+        x = lpf(x, lowness)
+    for i in range(4):
+        x = hpf(x, highness)
+    return _np.clip(x, -1, 1).tolist()
@@ -78,6 +78,7 @@ class Server:
 
     server = None
     audio_broadcast = None
+    stats_broadcast = None
 
 def pack_for_broadcast(topic, message):
     log('verbose', lambda: f'broadcast {topic} {message}')
@@ -149,25 +150,40 @@ def audio_broadcast_start(tape):
     if not isinstance(tape, weakref.ProxyType):
         tape = weakref.proxy(tape)
     def broadcast():
-        digits = (
+        import numpy as np
+        digits = np.frombuffer((
             './'
             '0123456789'
             'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
             'abcdefghijklmnopqrstuvwxyz'
-        )
-        def encode(f):
-            if f < -1:
-                f = -1
-            elif f > 1:
-                f = 1
-            i = int((f + 1) * ((1 << 11) - 1))
-            return digits[i & 0x3f] + digits[i >> 6]
+        ).encode(), dtype=np.uint8)
+        def encode(samples):
+            i = ((np.clip(samples, -1, 1) + 1) * ((1 << 11) - 1)).astype(np.int32)
+            return np.stack([digits[i & 0x3f], digits[i >> 6]], axis=1).tobytes().decode()
         while True:
             time.sleep(0.25)
-            server.send('audio', ''.join(encode(i) for i in tape.read(size)))
+            server.send('audio', encode(tape.read_numpy(size)))
     thread = threading.Thread(target=broadcast)
     tape.clear()
     time.sleep(1)
     thread.start()
     Server.audio_broadcast = AudioBroadcast(tape, size, thread)
     return size
+
+def stats_broadcast_start(audio=None, period=1):
+    'Broadcast `audio.stats()` on the `audio_stats` topic every `period` seconds.'
+    if not Server.server: raise Exception('nothing to broadcast stats to')
+    if Server.stats_broadcast: raise Exception('already broadcasting')
+    from ._component import Component
+    if audio == None: audio = Component._driver
+    server = weakref.proxy(Server.server)
+    if not isinstance(audio, weakref.ProxyType):
+        audio = weakref.proxy(audio)
+    def broadcast():
+        while True:
+            time.sleep(period)
+            server.send('audio_stats', audio.stats())
+    thread = threading.Thread(target=broadcast)
+    thread.daemon = True
+    thread.start()
+    Server.stats_broadcast = thread
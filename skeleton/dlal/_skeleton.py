@@ -5,7 +5,7 @@
 It serves as an interface to such logic.'''
 
 from ._component import Component as _Component, component_kinds
-from ._server import audio_broadcast_start, serve
+from ._server import audio_broadcast_start, serve, stats_broadcast_start
 from . import _sound
 from ._utils import (
     snake_to_upper_camel_case as _snake_to_upper_camel_case,
@@ -294,10 +294,16 @@ def disconnect(*args):
 def typical_setup(
     *,
     duration=None,
-    out_path='out.i16le',
+    out_path=None,
     flac_path=True,
     callback=None,
+    callback_period=None,
 ):
+    '''Run interactively if Python is interactive, otherwise render `duration` seconds offline.
+    When rendering, the tape is streamed to `out_path` (raw i16le, WAV, or FLAC, by extension) and to `flac_path` as FLAC.
+    `flac_path=True` names the FLAC after the running script.
+    Runs are batched into as few commands as the tape allows.
+    `callback(t)` is called after each batch, batches being limited to `callback_period` seconds of audio, or one run if unspecified.'''
     import atexit
     import os
     from pathlib import Path
@@ -317,33 +323,50 @@ def typical_setup(
         assert tape, 'No tape. For live audio, run Python interactively.'
         assert audio
         assert duration, 'No duration specified. For live audio, run Python interactively.'
+        assert out_path or flac_path, 'No output specified.'
         sample_rate = audio.sample_rate()
         run_size = audio.run_size()
         runs = int(duration * sample_rate / run_size)
         n = tape.size() // audio.run_size()
-        with open(out_path, 'wb') as file:
-            print(f'running, outputting to {out_path}')
-            for i in range(runs):
-                audio.run()
+        assert n, 'Tape is smaller than one run.'
+        if flac_path == True:
+            flip = os.environ.get('DLAL_PAN_FLIP')
+            if flip != None:
+                if int(flip):
+                    channel = 'l'
+                else:
+                    channel = 'r'
+            else:
+                channel = ''
+            flac_path = Path(sys.argv[0]).stem + channel + '.flac'
+        writers = []
+        if out_path:
+            writers.append(_sound.Writer(out_path, sample_rate))
+        if flac_path:
+            writers.append(_sound.Writer(flac_path, sample_rate, format='flac'))
+        print(f'running, outputting to {", ".join(str(i.file_path) for i in writers)}')
+        if callback:
+            if callback_period:
+                n = min(n, max(int(callback_period * sample_rate / run_size), 1))
+            else:
+                n = 1
+        try:
+            i = 0
+            while i < runs:
+                k = min(n, runs - i)
+                audio.run_many(k)
+                i += k
                 if callback:
-                    t = i * run_size / sample_rate
+                    t = (i - 1) * run_size / sample_rate
                     callback(t)
-                if i % n == n - 1 or i == runs - 1: tape.to_file_i16le(file)
-                print(f'{100*(i+1)/runs:5.1f} %', end='\r')
+                samples = tape.read_numpy()
+                for writer in writers:
+                    writer.write(samples)
+                print(f'{100*i/runs:5.1f} %', end='\r')
             print()
-        if flac_path:
-            if flac_path == True:
-                flip = os.environ.get('DLAL_PAN_FLIP')
-                if flip != None:
-                    if int(flip):
-                        channel = 'l'
-                    else:
-                        channel = 'r'
-                else:
-                    channel = ''
-                flac_path = Path(sys.argv[0]).stem + channel + '.flac'
-            print(f'converting to FLAC {flac_path}')
-            _sound.i16le_to_flac(out_path, flac_path)
+        finally:
+            for writer in writers:
+                writer.close()
 
 def system_info():
     return {
@@ -2,22 +2,19 @@ import soundfile as sf
 
 import numpy as _np
 
+import itertools as _itertools
+from pathlib import Path as _Path
 import re as _re
-import struct as _struct
 import subprocess as _subprocess
 
 class Sound:
     def __init__(self, samples, sample_rate=44100):
-        self.samples = samples
+        self.samples = _np.asarray(samples, dtype=_np.float32)
         self.sample_rate = sample_rate
 
     def to_i16le(self, file_path='out.i16le'):
-        with open(file_path, 'wb') as file:
-            for sample in self.samples:
-                i = int(sample * 0x7fff)
-                if i > 0x7fff: i = 0x7fff
-                elif i < -0x8000: i = -0x8000
-                file.write(_struct.pack('<h', i))
+        with Writer(file_path, self.sample_rate, format='i16le') as writer:
+            writer.write(self.samples)
 
     def to_flac(self, file_path='out.flac'):
         sf.write(file_path, self.samples, self.sample_rate, format='FLAC')
@@ -35,44 +32,19 @@ class Sound:
             raise Exception(f'ffmpeg returned non-zero exit status {p.returncode}\nstderr:\n{p.stderr.decode()}')
 
     def normalize(self):
-        m = 1 / max(abs(i) for i in self.samples)
-        self.samples = [i * m for i in self.samples]
+        self.samples = self.samples * (1 / _np.abs(self.samples).max())
         return self
 
     def split(self, threshold=0, window_backward=400, window_forward=400):
         '''
         Split sound at each sample where window is entirely below threshold (discard the quiet parts).
-        Yielded sounds will have start_sample and start_time set.
+        Yielded sounds will have start_sample and start_time set, and their samples are views into this sound's.
+        See `split_indices` for the window.
         '''
-        # find where the window is below threshold
-        silence = [{True: 1, False: 0}[abs(i) <= threshold] for i in self.samples]
-        windowed_silence = []
-        w = sum(silence[:window_forward-1]) + window_backward
-        for i, v in enumerate(silence):
-            if i + window_forward < len(silence):
-                w += silence[i + window_forward]
-            else:
-                w += 1
-            if i - window_backward >= 0:
-                w -= silence[i - window_backward]
-            else:
-                w -= 1
-            windowed_silence.append(w == window_backward + window_forward - 1)
-        # yield sounds
-        sound = None
-        for i, v in enumerate(self.samples):
-            if not windowed_silence[i]:
-                # sound
-                if not sound:
-                    sound = Sound([], self.sample_rate)
-                    sound.start_sample = i
-                    sound.start_time = i / self.sample_rate
-                sound.samples.append(v)
-            elif sound:
-                # silence, sound until now
-                yield sound
-                sound = None
-        if sound:
+        for start, end in split_indices(self.samples, threshold, window_backward, window_forward):
+            sound = Sound(self.samples[start:end], self.sample_rate)
+            sound.start_sample = start
+            sound.start_time = start / self.sample_rate
             yield sound
 
     def copy(self, start=0, end=-1):
@@ -83,7 +55,7 @@ class Sound:
             end *= self.sample_rate
         start = int(start)
         end = int(end)
-        return Sound(self.samples[start:end], self.sample_rate)
+        return Sound(self.samples[start:end].copy(), self.sample_rate)
 
     def play(self):
         self.to_i16le('tmp.i16le')
@@ -91,11 +63,128 @@ class Sound:
 
     def plot(self):
         import dansplotcore as dpc
-        dpc.plot(self.samples)
+        dpc.plot(self.samples.tolist())
+
+def _quiet(silence, size):
+    'Whether each run of `size` consecutive `silence` flags is entirely silent.'
+    cumsum = _np.concatenate([[0], _np.cumsum(silence, dtype=_np.int64)])
+    return cumsum[size:] - cumsum[:-size] == size
+
+def split_indices(samples, threshold=0, window_backward=400, window_forward=400):
+    '''
+    Find the `(start, end)` sample ranges that `Sound.split` yields.
+    A sample is quiet when the window from `window_backward - 1` samples before it to `window_forward` samples after it is entirely below threshold; samples beyond the ends count as quiet.
+    '''
+    silence = _np.concatenate([
+        _np.ones(window_backward - 1, dtype=bool),
+        _np.abs(_np.asarray(samples)) <= threshold,
+        _np.ones(window_forward, dtype=bool),
+    ])
+    quiet = _quiet(silence, window_backward + window_forward)
+    edges = _np.diff(_np.concatenate([[1], quiet.astype(_np.int8), [1]]))
+    starts = _np.flatnonzero(edges == -1)
+    ends = _np.flatnonzero(edges == 1)
+    return list(zip(starts.tolist(), ends.tolist()))
+
+def stream_split(file_path, threshold=0, window_backward=400, window_forward=400, *, channel=0, block_size=1 << 16):
+    '''
+    Like `read(file_path, channel).split(...)`, but reads the file block by block, so only the sound being yielded is entirely in memory.
+    '''
+    history = _np.ones(window_backward - 1, dtype=bool)  # silence of the samples before pending
+    pending = _np.zeros(0, dtype=_np.float32)  # samples waiting for lookahead
+    pending_start = 0
+    parts = []
+    part_start = None
+    with sf.SoundFile(file_path) as file:
+        sample_rate = file.samplerate
+        blocks = (i[:, channel] for i in file.blocks(block_size, dtype='float32', always_2d=True))
+        for block in _itertools.chain(blocks, [None]):
+            if block is None:
+                samples = pending
+                lookahead = _np.ones(window_forward, dtype=bool)
+                n = len(samples)
+            else:
+                samples = _np.concatenate([pending, block])
+                lookahead = _np.zeros(0, dtype=bool)
+                n = len(samples) - window_forward
+                if n <= 0:
+                    pending = samples
+                    continue
+            silence = _np.concatenate([history, _np.abs(samples) <= threshold, lookahead])
+            loud = ~_quiet(silence, window_backward + window_forward)[:n]
+            changes = _np.flatnonzero(_np.diff(loud.astype(_np.int8))) + 1
+            bounds = [0, *changes.tolist(), n]
+            for a, b in zip(bounds[:-1], bounds[1:]):
+                if a == b: continue
+                if loud[a]:
+                    if part_start == None:
+                        part_start = pending_start + a
+                    parts.append(samples[a:b])
+                elif part_start != None:
+                    yield _stream_split_sound(parts, sample_rate, part_start)
+                    parts = []
+                    part_start = None
+            history = silence[n:n+window_backward-1]
+            pending = samples[n:]
+            pending_start += n
+    if part_start != None:
+        yield _stream_split_sound(parts, sample_rate, part_start)
+
+def _stream_split_sound(parts, sample_rate, start):
+    sound = Sound(_np.concatenate(parts), sample_rate)
+    sound.start_sample = start
+    sound.start_time = start / sample_rate
+    return sound
+
+def quantize_i16(samples):
+    'Scale, truncate, and clip float samples to little-endian 16-bit integers.'
+    samples = _np.asarray(samples, dtype=_np.float64) * 0x7fff
+    return _np.clip(samples, -0x8000, 0x7fff).astype('<i2')
+
+class Writer:
+    '''Streaming sink for rendered audio.
+    Blocks of float samples are quantized to 16 bits and written as they arrive, no intermediate file.
+    `format` is one of 'i16le', 'wav', or 'flac'; by default it's taken from the extension of `file_path`, falling back to 'i16le'.'''
+
+    def __init__(self, file_path, sample_rate=44100, *, format=None):
+        self.file_path = file_path
+        if format == None:
+            format = {
+                '.flac': 'flac',
+                '.wav': 'wav',
+            }.get(_Path(file_path).suffix.lower(), 'i16le')
+        self.format = format
+        if format == 'i16le':
+            self.file = open(file_path, 'wb')
+        else:
+            self.file = sf.SoundFile(
+                file_path,
+                mode='w',
+                samplerate=int(sample_rate),
+                channels=1,
+                format=format.upper(),
+                subtype='PCM_16',
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, samples):
+        data = quantize_i16(samples)
+        if self.format == 'i16le':
+            self.file.write(data.tobytes())
+        else:
+            self.file.write(data)
+
+    def close(self):
+        self.file.close()
 
 def read(file_path, channel=0):
-    data, sample_rate = sf.read(file_path, always_2d=True)
-    return Sound([float(i[channel]) for i in data], sample_rate)
+    data, sample_rate = sf.read(file_path, dtype='float32', always_2d=True)
+    return Sound(_np.ascontiguousarray(data[:, channel]), sample_rate)
 
 def i16le_to_flac(i16le_file_path, flac_file_path=None):
     if flac_file_path == None:
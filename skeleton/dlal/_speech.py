@@ -6,10 +6,15 @@
 `info` - `frames` and prior information for a `phonetic`
 '''
 
-from . import _utils
-from ._skeleton import connect as _connect, Detach as _Detach
+from . import _cache
+from . import _sound
+from ._skeleton import connect as _connect
 from ._subsystem import Subsystem
 
+import numpy as _np
+
+import collections.abc as _abc
+import concurrent.futures as _futures
 import json as _json
 import math as _math
 import os as _os
@@ -96,6 +101,66 @@ NOISE_PIECES = [
     14000,
 ]
 
+def spectrogram(samples, window_size=512, run_size=64):
+    '''Magnitude spectra of `samples`, one per run, as the `stft` component reports them after each run.
+
+    Returns a `[runs x (window_size // 2 + 1)]` array. The last run is the one that reaches the end of `samples`.'''
+    samples = _np.asarray(samples, dtype=float)
+    runs = len(samples) // run_size + 1
+    padded = _np.zeros(window_size - run_size + runs * run_size)
+    padded[window_size - run_size:][:len(samples)] = samples
+    windows = _np.lib.stride_tricks.sliding_window_view(padded, window_size)[::run_size]
+    window = 1 - _np.cos(2 * _np.pi * _np.arange(window_size) / (window_size - 1))
+    return _np.abs(_np.fft.rfft(windows * window, axis=1)) / window_size
+
+def bounded_least_squares(a, b, lo=0, hi=1, iterations=100, tolerance=1e-9):
+    '''For each row `y` of `b`, the `x` minimizing `|a @ x - y|` with `lo <= x <= hi`.
+
+    Solved by cyclic coordinate descent on the normal equations, all rows at once; meant for a few unknowns.'''
+    b = _np.atleast_2d(b)
+    gram = a.T @ a
+    rhs = b @ a
+    x = _np.clip(rhs @ _np.linalg.pinv(gram).T, lo, hi)
+    for _ in range(iterations):
+        change = 0
+        for j in range(gram.shape[0]):
+            x_j = (rhs[:, j] - x @ gram[j] + x[:, j] * gram[j, j]) / gram[j, j]
+            x_j = _np.clip(x_j, lo, hi)
+            change = max(change, _np.abs(x_j - x[:, j]).max(initial=0))
+            x[:, j] = x_j
+        if change < tolerance: break
+    return x
+
+def resample(samples, sample_rate_from, sample_rate_to):
+    '''Nearest-sample rate conversion, as done by `afr`.'''
+    samples = _np.asarray(samples, dtype=float)
+    if sample_rate_from == sample_rate_to: return samples
+    ratio = sample_rate_from / sample_rate_to
+    indices = (_np.arange(_math.ceil(len(samples) / ratio)) * ratio).astype(int)
+    return samples[indices[indices < len(samples)]]
+
+def analyze(
+    samples,
+    stft_bins=512,
+    tone_bins=[1, 6],
+    tone_factor=2e1,
+    noise_bins=[32, 256],
+    noise_factor=1e2,
+    run_size=64,
+):
+    '''Offline equivalent of running `SpeechSampler.sample` after every run of `samples`.
+
+    Returns `(spectra, amps_tone, amps_noise)` arrays.'''
+    spectra = spectrogram(samples, stft_bins, run_size)
+    amps_tone = tone_factor * _np.sqrt((spectra[:, tone_bins[0]:tone_bins[1]] ** 2).sum(axis=1))
+    amps_noise = noise_factor * _np.sqrt((spectra[:, noise_bins[0]:noise_bins[1]] ** 2).sum(axis=1))
+    return spectra, amps_tone, amps_noise
+
+def analyze_file(file_path, sample_rate=44100, **kwargs):
+    '''Like `analyze`, for the first channel of an audio file.'''
+    sound = _sound.read(file_path)
+    return analyze(resample(sound.samples, sound.sample_rate, sample_rate), **kwargs)
+
 class SpeechSampler(Subsystem):
     def init(
         self,
@@ -132,6 +197,15 @@ class SpeechSampler(Subsystem):
             self.noise_factor * _math.sqrt(sum(i ** 2 for i in spectrum[self.noise_bins[0]:self.noise_bins[1]])),
         )
 
+    def analysis_kwargs(self):
+        return {
+            'stft_bins': self.stft_bins,
+            'tone_bins': self.tone_bins,
+            'tone_factor': self.tone_factor,
+            'noise_bins': self.noise_bins,
+            'noise_factor': self.noise_factor,
+        }
+
     def sampleses(self, path, afr, driver, only=None):
         sampleses = {}
         for k in PHONETICS:
@@ -169,6 +243,158 @@ class SpeechSampler(Subsystem):
         afr.disconnect(self.buf)
         return frames
 
+    def sampleses_offline(self, path, only=None, sample_rate=44100, run_size=64, processes=None):
+        '''Like `sampleses`, but reads and analyzes each whole file at once, without a driver.
+
+        With `processes`, files are analyzed in that many worker processes.'''
+        phonetics = [k for k in PHONETICS if not only or k in only]
+        file_paths = [_os.path.join(path, f'{k}.flac') for k in phonetics]
+        kwargs = {
+            **self.analysis_kwargs(),
+            'sample_rate': sample_rate,
+            'run_size': run_size,
+        }
+        if processes:
+            with _futures.ProcessPoolExecutor(processes) as executor:
+                futures = [executor.submit(analyze_file, i, **kwargs) for i in file_paths]
+                analyses = [i.result() for i in futures]
+        else:
+            analyses = [analyze_file(i, **kwargs) for i in file_paths]
+        sampleses = {}
+        for k, (spectra, amps_tone, amps_noise) in zip(phonetics, analyses):
+            sampleses[k] = list(zip(spectra, amps_tone.tolist(), amps_noise.tolist()))
+        return sampleses
+
+    def frames_offline(self, file_path, model=None):
+        '''Like `frames`, but reads and analyzes the whole file at once, without a driver.'''
+        return file_to_frames_offline(file_path, model, **self.analysis_kwargs())
+
+MODEL_FORMAT_VERSION = 1
+
+def frames_to_arrays(frames):
+    '''Convert a list of frames to a dict of float32 arrays, one row per frame.'''
+    arrays = {
+        'toniness': [i['toniness'] for i in frames],
+        'formants': [[[j['freq'], j['amp']] for j in i['tone']['formants']] for i in frames],
+        'tone_spectrum': [i['tone']['spectrum'] for i in frames],
+        'noise_pieces': [i['noise']['pieces'] for i in frames],
+        'noise_spectrum': [i['noise']['spectrum'] for i in frames],
+        'amp': [i['amp'] for i in frames],
+    }
+    if frames and all('f' in i for i in frames):
+        arrays['f'] = [i['f'] for i in frames]
+    if frames and 'formants' in frames[0]:
+        arrays['formants_initial'] = [[i['freq'], i['amp']] for i in frames[0]['formants']]
+    return {k: _np.array(v, dtype=_np.float32) for k, v in arrays.items()}
+
+class Frames(_abc.Sequence):
+    '''Read-only list of frames backed by arrays, as produced by `frames_to_arrays`. Frame dicts are built on access.'''
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+
+    def __len__(self):
+        return len(self.arrays['toniness'])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0: i += len(self)
+        if not 0 <= i < len(self): raise IndexError('frame index out of range')
+        a = self.arrays
+        frame = {
+            'toniness': float(a['toniness'][i]),
+            'tone': {
+                'formants': [{'freq': freq, 'amp': amp} for freq, amp in a['formants'][i].tolist()],
+                'spectrum': a['tone_spectrum'][i].tolist(),
+            },
+            'noise': {
+                'pieces': a['noise_pieces'][i].tolist(),
+                'spectrum': a['noise_spectrum'][i].tolist(),
+            },
+        }
+        if 'f' in a:
+            frame['f'] = float(a['f'][i])
+        frame['amp'] = float(a['amp'][i])
+        if i == 0 and 'formants_initial' in a:
+            frame['formants'] = [{'freq': freq, 'amp': amp} for freq, amp in a['formants_initial'].tolist()]
+        return frame
+
+class BinaryPhonetics(_abc.MutableMapping):
+    '''Phonetic infos of a binary model file, loaded lazily on first access.
+
+    The file is an uncompressed `.npz` with a JSON `header` member, and per-phonetic members named `<phonetic>/<array>`.'''
+
+    def __init__(self, path):
+        self.npz = _np.load(path)
+        header = _json.loads(self.npz['header'].tobytes().decode('utf-8'))
+        if header['version'] != MODEL_FORMAT_VERSION:
+            raise Exception(f'unsupported model format version {header["version"]}')
+        self.header = header['phonetics']
+        self.infos = {}
+
+    def __getitem__(self, phonetic):
+        if phonetic not in self.infos:
+            header = self.header[phonetic]
+            self.infos[phonetic] = {
+                'type': header['type'],
+                'voiced': header['voiced'],
+                'fricative': header['fricative'],
+                'frames': Frames({
+                    k: self.npz[f'{phonetic}/{k}']
+                    for k in header['arrays']
+                }),
+            }
+        return self.infos[phonetic]
+
+    def __setitem__(self, phonetic, info):
+        self.header[phonetic] = {k: info[k] for k in ['type', 'voiced', 'fricative']}
+        self.infos[phonetic] = info
+
+    def __delitem__(self, phonetic):
+        del self.header[phonetic]
+        self.infos.pop(phonetic, None)
+
+    def __iter__(self):
+        return iter(self.header)
+
+    def __len__(self):
+        return len(self.header)
+
+def save_binary_phonetics(phonetics, path):
+    header = {}
+    arrays = {}
+    for phonetic, info in phonetics.items():
+        frames = info['frames']
+        if isinstance(frames, Frames):
+            phonetic_arrays = frames.arrays
+        else:
+            phonetic_arrays = frames_to_arrays(frames)
+        header[phonetic] = {
+            'type': info['type'],
+            'voiced': info['voiced'],
+            'fricative': info['fricative'],
+            'arrays': list(phonetic_arrays),
+        }
+        for k, v in phonetic_arrays.items():
+            arrays[f'{phonetic}/{k}'] = _np.asarray(v, dtype=_np.float32)
+    header = _json.dumps({'version': MODEL_FORMAT_VERSION, 'phonetics': header})
+    arrays['header'] = _np.frombuffer(header.encode('utf-8'), dtype=_np.uint8)
+    # write to a temporary file first, in case phonetics are being read lazily from `path`
+    tmp_path = f'{path}.{_os.getpid()}.tmp.npz'
+    _np.savez(tmp_path, **arrays)
+    _os.replace(tmp_path, path)
+
+def phonetics_to_json(phonetics):
+    return {
+        phonetic: {**info, 'frames': list(info['frames'])}
+        for phonetic, info in phonetics.items()
+    }
+
+def convert_model(path_from, path_to):
+    '''Convert a model between JSON and binary formats, as chosen by extension (`.npz` for binary).'''
+    Model(path_from).save(path_to)
+
 class Model:
     def mean(l):
         return sum(l) / len(l)
@@ -187,6 +413,17 @@ class Model:
                 m = Model.mean(x2)
         return m
 
+    def aggregate_columns(x, reject_outliers=False):
+        '''Like `aggregate`, for each column of a `[paramses x values]` array.'''
+        x = _np.asarray(x, dtype=float)
+        m = x.mean(axis=0)
+        if reject_outliers:
+            r = x.max(axis=0) - x.min(axis=0)
+            kept = _np.abs(x - m) <= r / 4
+            n = kept.sum(axis=0)
+            m = _np.where(n != 0, (x * kept).sum(axis=0) / _np.maximum(n, 1), m)
+        return m
+
     def __init__(
         self,
         path=None,
@@ -207,195 +444,222 @@ class Model:
         self.formant_path_plot_data = {}
         if path: self.load(path)
 
+    def unzip(samples):
+        '''Convert a list of `(spectrum, amp_tone, amp_noise)` samples to arrays.'''
+        if not len(samples):
+            return _np.zeros((0, 0)), _np.zeros(0), _np.zeros(0)
+        spectra, amps_tone, amps_noise = zip(*samples)
+        return _np.array(spectra, dtype=float), _np.array(amps_tone, dtype=float), _np.array(amps_noise, dtype=float)
+
     def find_formant(
         self,
-        spectrum,
+        spectra,
         freq_i,
         freq_f,
         formant_below_freq=0,
         formant_prev_freq=None,
     ):
+        '''Find a formant in each row of `spectra`, a `[frames x bins]` matrix.
+        `formant_below_freq` and `formant_prev_freq` are per frame, or scalars.
+        Returns arrays of formant frequencies and amplitudes.'''
+        n_frames, n_bins = spectra.shape
+        rows = _np.arange(n_frames)[:, None]
+        cols = _np.arange(n_bins)[None, :]
+        formant_below_freq = _np.broadcast_to(_np.asarray(formant_below_freq, dtype=float), (n_frames,))
+        if formant_prev_freq is None:
+            formant_prev_freq = 0
+        formant_prev_freq = _np.broadcast_to(_np.asarray(formant_prev_freq, dtype=float), (n_frames,))
+        has_prev = formant_prev_freq != 0
         # look for formant near where it was before
-        if formant_prev_freq:
-            e = 200
-            freq_i = max(freq_i, formant_prev_freq - e)
-            freq_f = min(freq_f, formant_prev_freq + e)
+        e = 200
+        freq_i = _np.where(has_prev, _np.maximum(freq_i, formant_prev_freq - e), freq_i)
+        freq_f = _np.where(has_prev, _np.minimum(freq_f, formant_prev_freq + e), freq_f)
         # convert freq range to bins
-        bin_i = _math.floor(freq_i / self.freq_per_bin)
-        bin_f = _math.floor(freq_f / self.freq_per_bin)
+        bin_i = _np.floor(freq_i / self.freq_per_bin).astype(int)
+        bin_f = _np.floor(freq_f / self.freq_per_bin).astype(int)
         # make sure above formant below, and non-empty window
-        bin_i = min(
-            max(
-                bin_i,
-                _math.floor(formant_below_freq / self.freq_per_bin) + 4
-            ),
-            bin_f - 1,
-        )
+        formant_below_bin = _np.floor(formant_below_freq / self.freq_per_bin).astype(int)
+        bin_i = _np.minimum(_np.maximum(bin_i, formant_below_bin + 4), bin_f - 1)
         # avoid below formant
         spread = 3
-        spectrum = spectrum[:]
-        if formant_below_freq:
-            formant_below_bin = _math.floor(formant_below_freq / self.freq_per_bin)
-            a = max(formant_below_bin - spread, 0)
-            b = min(formant_below_bin + spread + 1, len(spectrum))
-            for i in range(a, b):
-                spectrum[i] = 0
+        avoid = (
+            (formant_below_freq != 0)[:, None]
+            & (cols >= (formant_below_bin - spread)[:, None])
+            & (cols <= (formant_below_bin + spread)[:, None])
+        )
+        spectra = _np.where(avoid, 0, spectra)
         # find peak
+        # windowed energy is accumulated over shifted copies, in the same order as summing each window
+        # (cumulative sums would be just as fast, but their rounding can break ties between equal windows differently)
         spread = 2
-        e_peak = 0
-        e_min = _math.inf
-        if formant_prev_freq:
-            bin_peak = int(formant_prev_freq / self.freq_per_bin)
-        else:
-            bin_peak = (bin_i + bin_f) // 2
-        for i in range(bin_i, bin_f):
-            a = max(i-spread, 0)
-            b = min(i+spread+1, len(spectrum))
-            for j in range(a, b):
-                window = spectrum[a:b]
-                e_window = sum(i ** 2 for i in window)
-                if e_window > e_peak:
-                    e_peak = e_window
-                    bin_peak = i
-                if e_window < e_min:
-                    e_min = e_window
+        energy = _np.pad(spectra ** 2, ((0, 0), (spread, spread)))
+        e_window = _np.zeros((n_frames, n_bins))
+        for i in range(2 * spread + 1):
+            e_window = e_window + energy[:, i:i+n_bins]
+        in_range = (cols >= bin_i[:, None]) & (cols < bin_f[:, None])
+        e_in_range = _np.where(in_range, e_window, 0)
+        bin_max = _np.argmax(e_in_range, axis=1)
+        e_peak = e_in_range[rows[:, 0], bin_max]
+        e_min = _np.where(in_range, e_window, _np.inf).min(axis=1)
+        bin_peak = _np.where(
+            has_prev,
+            (formant_prev_freq / self.freq_per_bin).astype(int),
+            (bin_i + bin_f) // 2,
+        )
+        bin_peak = _np.where(e_peak > 0, bin_max, bin_peak)
         # adjust based on neighboring bin amps
-        bin_formant = bin_peak
+        bin_formant = bin_peak.astype(float)
         spread = 2
-        if bin_peak >= spread and bin_peak < len(spectrum) - spread:
-            bins = [
-                (i, spectrum[i])
-                for i in range(bin_peak - spread, bin_peak + spread + 1)
-            ]
-            s = sum(v ** 2 for i, v in bins)
-            if s != 0:
-                bin_formant = sum(i * v ** 2 for i, v in bins) / s
-                bin_formant = max(bin_formant, bin_i)
-                bin_formant = min(bin_formant, bin_f)
+        centerable = (bin_peak >= spread) & (bin_peak < n_bins - spread)
+        neighbors = _np.clip(bin_peak[:, None] + _np.arange(-spread, spread + 1)[None, :], 0, n_bins - 1)
+        v2 = spectra[rows, neighbors] ** 2
+        s = _np.zeros(n_frames)
+        centroid = _np.zeros(n_frames)
+        for i in range(2 * spread + 1):
+            s = s + v2[:, i]
+            centroid = centroid + neighbors[:, i] * v2[:, i]
+        centerable &= s != 0
+        centroid = centroid / _np.where(s != 0, s, 1)
+        centroid = _np.minimum(_np.maximum(centroid, bin_i), bin_f)
+        bin_formant = _np.where(centerable, centroid, bin_formant)
         # inertia, don't lose prev formant too quickly if there's no strong peak
-        if formant_prev_freq and e_min < e_peak and e_min != 0:
-            t = min(e_peak / e_min - 1, 1)
-            bin_formant = t * bin_formant + (1 - t) * formant_prev_freq / self.freq_per_bin
+        inert = has_prev & (e_min < e_peak) & (e_min != 0)
+        t = _np.minimum(e_peak / _np.where(inert, e_min, 1) - 1, 1)
+        bin_formant = _np.where(
+            inert,
+            t * bin_formant + (1 - t) * formant_prev_freq / self.freq_per_bin,
+            bin_formant,
+        )
         #
-        return {
-            'freq': bin_formant * self.freq_per_bin,
-            'amp': _math.sqrt(e_peak),
-        }
+        return bin_formant * self.freq_per_bin, _np.sqrt(e_peak)
 
-    def find_tone(self, spectrum, phonetic=None, formants_prev=None):
+    def find_tone(self, spectra, phonetic=None, formants_prev=None):
+        '''Returns formant frequencies and amplitudes as `[frames x formants]` matrices, and a `[frames x tone_bins]` tone spectrum.'''
+        n_frames = len(spectra)
         # find formants
-        formants = []
+        freqs = _np.zeros((n_frames, len(FORMANT_RANGES)))
+        amps = _np.zeros((n_frames, len(FORMANT_RANGES)))
         formant_below_freq = 0
         for i, [freq_i, freq_f] in enumerate(FORMANT_RANGES):
-            formant = self.find_formant(
-                spectrum,
+            freq, amp = self.find_formant(
+                spectra,
                 freq_i,
                 freq_f,
                 formant_below_freq,
                 formants_prev and formants_prev[i]['freq'],
             )
-            formant_below_freq = formant['freq']
-            if phonetic and phonetic not in VOICED:
-                formant['amp'] = 0
-            formants.append(formant)
+            formant_below_freq = freq
+            freqs[:, i] = freq
+            if not phonetic or phonetic in VOICED:
+                amps[:, i] = amp
         # find tone spectrum
         if not phonetic or phonetic in VOICED:
             # take all bins with amplitudes above twice median
-            spectrum_tone = []
-            median = sorted(spectrum)[len(spectrum) // 2]
-            threshold = 2 * median
-            for i in range(self.tone_bins):
-                v = 0
-                if spectrum[i] > threshold:
-                    v = spectrum[i]
-                spectrum_tone.append(v)
+            median = _np.partition(spectra, spectra.shape[1] // 2, axis=1)[:, spectra.shape[1] // 2]
+            spectrum_tone = spectra[:, :self.tone_bins]
+            spectrum_tone = _np.where(spectrum_tone > 2 * median[:, None], spectrum_tone, 0)
         else:
-            spectrum_tone = [0] * self.tone_bins
+            spectrum_tone = _np.zeros((n_frames, self.tone_bins))
         #
-        return {
-            'formants': formants,
-            'spectrum': spectrum_tone,
-        }
+        return freqs, amps, spectrum_tone
 
-    def find_noise(self, spectrum, phonetic=None):
-        spectrum_noise = [0] * self.noise_bins
-        pieces = [0] * len(NOISE_PIECES)
+    def find_noise(self, spectra, phonetic=None):
+        '''Returns a `[frames x noise_bins]` noise spectrum, and `[frames x pieces]` amplitudes of a piecewise-linear fit to it.'''
+        n_frames, n_bins = spectra.shape
+        spectrum_noise = _np.zeros((n_frames, self.noise_bins))
+        pieces = _np.zeros((n_frames, len(NOISE_PIECES)))
         if not phonetic or phonetic in FRICATIVES:
-            for i, amp in enumerate(spectrum):
-                if i * self.freq_per_bin < 1000: continue
-                spectrum_noise[_math.floor(i / len(spectrum) * self.noise_bins)] += amp
-            # estimate with piecewise function
-            # assume 0 Hz to first noise piece is 0
-            # roughly optimize a piecewise function
-            freq_per_noise_bin = (self.sample_rate / 2) / len(spectrum_noise)
-            def error(x):
-                x = [0, *x]
-                err = 0
-                for i, v in enumerate(spectrum_noise):
-                    f = i * freq_per_noise_bin
-                    u = 0
-                    for f_a, f_b, a, b in zip(NOISE_PIECES, NOISE_PIECES[1:] + [20000], x, x[1:] + [0]):
-                        if f_a < f < f_b:
-                            u = _utils.linear(a, b, (f - f_a) / (f_b - f_a))
-                            break
-                    err += (v - u) ** 2
-                return err
-            pieces = [0, *_utils.minimize(error, [
-                spectrum_noise[_math.floor(i / freq_per_noise_bin)]
-                for i in NOISE_PIECES[1:]
-            ])]
-        return {
-            'pieces': pieces,
-            'spectrum': spectrum_noise,
-        }
+            bins = _np.arange(n_bins)
+            above = bins * self.freq_per_bin >= 1000
+            noise_bin = _np.floor(bins / n_bins * self.noise_bins).astype(int)
+            for i in range(self.noise_bins):
+                spectrum_noise[:, i] = spectra[:, above & (noise_bin == i)].sum(axis=1)
+            # fit a piecewise-linear function with least squares, amplitudes bounded to [0, 1]
+            # assume 0 Hz to first noise piece is 0, and the last piece falls to 0 at 20 kHz
+            pieces[:, 1:] = bounded_least_squares(self._noise_piece_basis(), spectrum_noise)
+        return spectrum_noise, pieces
+
+    def _noise_piece_basis(self):
+        '''Matrix taking piece amplitudes, excluding the first, which is fixed at 0, to a noise spectrum.'''
+        if getattr(self, '_noise_piece_basis_matrix', None) is None:
+            freq_per_noise_bin = (self.sample_rate / 2) / self.noise_bins
+            knots = NOISE_PIECES + [20000]
+            basis = _np.zeros((self.noise_bins, len(NOISE_PIECES)))  # piecewise value as a linear function of pieces
+            for i in range(self.noise_bins):
+                f = i * freq_per_noise_bin
+                for j, (f_a, f_b) in enumerate(zip(knots, knots[1:])):
+                    if f_a < f < f_b:
+                        t = (f - f_a) / (f_b - f_a)
+                        basis[i, j] = 1 - t
+                        if j + 1 < len(NOISE_PIECES): basis[i, j + 1] = t
+                        break
+            self._noise_piece_basis_matrix = basis[:, 1:]
+        return self._noise_piece_basis_matrix
 
     def parameterize(self, spectrum, amp_tone, amp_noise, phonetic=None, formants_prev=None):
+        return self.parameterize_many([spectrum], [amp_tone], [amp_noise], phonetic, formants_prev)[0]
+
+    def parameterize_many(self, spectra, amps_tone, amps_noise, phonetic=None, formants_prev=None):
+        '''Like `parameterize`, but for a `[frames x bins]` spectrogram, returning a list of params.'''
+        spectra = _np.asarray(spectra, dtype=float)
+        if not len(spectra): return []
+        amps_tone = _np.asarray(amps_tone, dtype=float)
+        amps_noise = _np.asarray(amps_noise, dtype=float)
         if phonetic and phonetic not in VOICED:
-            amp_tone = 0
-        tone = self.find_tone(spectrum, phonetic, formants_prev)
-        noise = self.find_noise(spectrum, phonetic)
-        f = _math.sqrt(sum([
-            sum(i ** 2 for i in tone['spectrum']),
-            sum(i ** 2 for i in noise['spectrum']),
-        ]))
-        amp = amp_tone + amp_noise
-        if amp:
-            toniness = amp_tone / amp
-        else:
-            toniness = 0
-        return {
-            'toniness': toniness,
-            'tone': tone,
-            'noise': noise,
-            'f': f,
-        }
+            amps_tone = _np.zeros_like(amps_tone)
+        freqs, amps, spectrum_tone = self.find_tone(spectra, phonetic, formants_prev)
+        spectrum_noise, pieces = self.find_noise(spectra, phonetic)
+        f = _np.sqrt((spectrum_tone ** 2).sum(axis=1) + (spectrum_noise ** 2).sum(axis=1)).tolist()
+        amp = amps_tone + amps_noise
+        toniness = _np.where(amp != 0, amps_tone / _np.where(amp != 0, amp, 1), 0).tolist()
+        return [
+            {
+                'toniness': toniness[i],
+                'tone': {
+                    'formants': [
+                        {'freq': freq, 'amp': amp}
+                        for freq, amp in zip(freqs[i].tolist(), amps[i].tolist())
+                    ],
+                    'spectrum': spectrum_tone[i].tolist(),
+                },
+                'noise': {
+                    'pieces': pieces[i].tolist(),
+                    'spectrum': spectrum_noise[i].tolist(),
+                },
+                'f': f[i],
+            }
+            for i in range(len(spectra))
+        ]
 
     def frames_from_paramses(self, paramses, continuant=True):
         if continuant:
+            formants = _np.array([
+                [[j['freq'], j['amp']] for j in i['tone']['formants'][:len(FORMANT_RANGES)]]
+                for i in paramses
+            ])
+            freqs = Model.aggregate_columns(formants[:, :, 0], True).tolist()
+            amps = Model.aggregate_columns(formants[:, :, 1]).tolist()
             return [{
                 'toniness': Model.aggregate(paramses, ['toniness']),
                 'tone': {
                     'formants': [
-                        {
-                            'freq': Model.aggregate(paramses, ['tone', 'formants', i, 'freq'], True),
-                            'amp': Model.aggregate(paramses, ['tone', 'formants', i, 'amp']),
-                        }
-                        for i in range(len(FORMANT_RANGES))
-                    ],
-                    'spectrum': [
-                        Model.aggregate(paramses, ['tone', 'spectrum', i])
-                        for i in range(self.tone_bins)
+                        {'freq': freq, 'amp': amp}
+                        for freq, amp in zip(freqs, amps)
                     ],
+                    'spectrum': Model.aggregate_columns([
+                        i['tone']['spectrum'][:self.tone_bins]
+                        for i in paramses
+                    ]).tolist(),
                 },
                 'noise': {
-                    'pieces': [
-                        Model.aggregate(paramses, ['noise', 'pieces', i])
-                        for i in range(len(NOISE_PIECES))
-                    ],
-                    'spectrum': [
-                        Model.aggregate(paramses, ['noise', 'spectrum', i])
-                        for i in range(self.noise_bins)
-                    ],
+                    'pieces': Model.aggregate_columns([
+                        i['noise']['pieces'][:len(NOISE_PIECES)]
+                        for i in paramses
+                    ]).tolist(),
+                    'spectrum': Model.aggregate_columns([
+                        i['noise']['spectrum'][:self.noise_bins]
+                        for i in paramses
+                    ]).tolist(),
                 },
                 'amp': 1,
             }]
@@ -424,7 +688,7 @@ class Model:
             start = int((RECORD_DURATION_UNSTRESSED_VOWEL + RECORD_DURATION_TRANSITION + 1) * self.sample_rate / self.run_size)  # in speech samples (not audio samples)
             plot_data = []
             for i_sample in range(0, start, stride):
-                paramses = [self.parameterize(*i, phonetic, formants) for i in samples[i_sample:i_sample+stride]]
+                paramses = self.parameterize_many(*Model.unzip(samples[i_sample:i_sample+stride]), phonetic, formants)
                 frame = self.frames_from_paramses(paramses, True)[0]
                 formants = frame['tone']['formants']
                 plot_data.append({
@@ -433,10 +697,10 @@ class Model:
                 })
             # get this phonetic's formants
             self.formant_path_plot_data[phonetic] = plot_data
-            paramses = [self.parameterize(*i, phonetic, formants) for i in samples[start:]]
+            paramses = self.parameterize_many(*Model.unzip(samples[start:]), phonetic, formants)
             frames = self.frames_from_paramses(paramses, continuant)
         elif voiced and not continuant:
-            paramses = [self.parameterize(*i, phonetic) for i in samples]
+            paramses = self.parameterize_many(*Model.unzip(samples), phonetic)
             frames = self.frames_from_paramses(paramses, continuant)
             # find the isolated rendition of the stop at the end of the recording
             i_start = len(frames) // 2
@@ -459,10 +723,10 @@ class Model:
                     formants = params['tone']['formants']
             frames[0]['formants'] = formants
         elif not voiced and continuant:
-            paramses = [self.parameterize(*i, phonetic) for i in samples]
+            paramses = self.parameterize_many(*Model.unzip(samples), phonetic)
             frames = self.frames_from_paramses(paramses, continuant)
         elif not voiced and not continuant:
-            paramses = [self.parameterize(*i, phonetic) for i in samples]
+            paramses = self.parameterize_many(*Model.unzip(samples), phonetic)
             frames = self.frames_from_paramses(paramses, continuant)
             # take only the first rendition of the stop as frames
             i_start = next(i for i, frame in enumerate(frames) if frame['amp'] > 0.9)
@@ -483,14 +747,22 @@ class Model:
         self.add('0', [[[0] * self.stft_bins, 0, 0]])
 
     def save(self, path):
+        '''Save as binary if `path` ends in `.npz`, otherwise as JSON.'''
+        if str(path).endswith('.npz'):
+            save_binary_phonetics(self.phonetics, path)
+            return
         with open(path, 'w') as f:
-            _json.dump(self.phonetics, f, indent=2)
+            _json.dump(phonetics_to_json(self.phonetics), f, indent=2)
 
     def save_formant_path_plot_data(self, path):
         with open(path, 'w') as f:
             _json.dump(self.formant_path_plot_data, f, indent=2)
 
     def load(self, path):
+        '''Load binary if `path` ends in `.npz`, otherwise JSON. Binary phonetics are loaded lazily.'''
+        if str(path).endswith('.npz'):
+            self.phonetics = BinaryPhonetics(path)
+            return
         with open(path, 'r') as f:
             self.phonetics = _json.load(f)
 
@@ -841,30 +1113,59 @@ class SpeechSynth(Subsystem):
         wait=None,
         pitch=None,
     ):
-        with _Detach():
-            with self.comm:
-                if toniness < 0.2:
-                    self.gain_tone.set(5 * toniness)
-                    self.gain_noise.set(1 - 5 * toniness)
-                else:
-                    self.gain_tone.set(1)
-                    self.gain_noise.set(0)
-                if tone_spectrum:
-                    self.tone.spectrum(tone_spectrum)
-                elif tone_formants:
-                    if all(i['amp'] < 1e-2 for i in tone_formants):
-                        self.forman.zero()
-                    else:
-                        self.forman.formants(tone_formants)
-                if noise_spectrum:
-                    self.noise.spectrum(noise_spectrum)
-                elif noise_pieces:
-                    self.noise.piecewise([0] + NOISE_PIECES + [20000], [0] + noise_pieces + [0])
-                if pitch != None:
-                    self.tone.midi([0x90, pitch, 127])
-                self.comm.wait(wait)
+        commands = self.synthesize_commands(
+            toniness=toniness,
+            tone_spectrum=tone_spectrum,
+            tone_formants=tone_formants,
+            noise_spectrum=noise_spectrum,
+            noise_pieces=noise_pieces,
+            pitch=pitch,
+        )
+        self.comm.queue_many(commands, wait=wait, detach=True)
+
+    def synthesize_commands(
+        self,
+        toniness=None,
+        tone_spectrum=None,
+        tone_formants=None,
+        noise_spectrum=None,
+        noise_pieces=None,
+        pitch=None,
+    ):
+        '''The `(component, name, args)` commands that `synthesize` queues.'''
+        commands = []
+        if toniness < 0.2:
+            commands.append((self.gain_tone, 'set', [5 * toniness]))
+            commands.append((self.gain_noise, 'set', [1 - 5 * toniness]))
+        else:
+            commands.append((self.gain_tone, 'set', [1]))
+            commands.append((self.gain_noise, 'set', [0]))
+        if tone_spectrum:
+            commands.append((self.tone, 'spectrum', [tone_spectrum]))
+        elif tone_formants:
+            if all(i['amp'] < 1e-2 for i in tone_formants):
+                commands.append((self.forman, 'zero', []))
+            else:
+                commands.append((self.forman, 'formants', [tone_formants]))
+        if noise_spectrum:
+            commands.append((self.noise, 'spectrum', [noise_spectrum]))
+        elif noise_pieces:
+            commands.append((self.noise, 'piecewise', [[0] + NOISE_PIECES + [20000], [0] + noise_pieces + [0]]))
+        if pitch != None:
+            commands.append((self.tone, 'midi', [[0x90, pitch, 127]]))
+        return commands
 
     def say(self, phonetic, model, wait=0, pitch=None):
+        for commands, wait in self.say_events(phonetic, model, wait, pitch):
+            self.comm.queue_many(commands, wait=wait, detach=True)
+
+    def say_events(self, phonetic, model, wait=0, pitch=None):
+        '''Yield the `(commands, wait)` batches that `say` queues.'''
+        for kwargs, wait in self.say_frames(phonetic, model, wait, pitch):
+            yield self.synthesize_commands(**kwargs), wait
+
+    def say_frames(self, phonetic, model, wait=0, pitch=None):
+        '''Yield `(kwargs, wait)` for each frame `say` synthesizes, where `kwargs` are for `synthesize_commands`.'''
         info = model.phonetics[phonetic]
         frames = info['frames']
         if info['type'] == 'stop':
@@ -872,33 +1173,214 @@ class SpeechSynth(Subsystem):
         else:
             w = wait
         for i_frame, frame in enumerate(frames):
-            self.synthesize(
-                toniness=frame['toniness'],
-                tone_formants=frame['tone']['formants'],
-                noise_spectrum=frame['noise']['spectrum'],
-                wait=int(w * self.sample_rate),
-                pitch=pitch,
+            yield (
+                {
+                    'toniness': frame['toniness'],
+                    'tone_formants': frame['tone']['formants'],
+                    'noise_spectrum': frame['noise']['spectrum'],
+                    'pitch': pitch,
+                },
+                int(w * self.sample_rate),
             )
             wait -= w
             if wait < 1e-4: return
-        self.say('0', model, wait)
+        yield from self.say_frames('0', model, wait)
+
+    def utter(self, utterance, model=None, *, no_pitch=False, tolerance=None):
+        '''With `tolerance`, only keyframes are sent, see `keyframe_events`.'''
+        for commands, wait in self.utter_events(utterance, model, no_pitch=no_pitch, tolerance=tolerance):
+            self.comm.queue_many(commands, wait=wait, detach=True)
+
+    def utter_events(self, utterance, model=None, *, no_pitch=False, tolerance=None):
+        '''Yield the `(commands, wait)` batches that `utter` queues.'''
+        frames = self.utter_frames(utterance, model, no_pitch=no_pitch)
+        if tolerance != None:
+            yield from self.keyframe_events(frames, tolerance)
+            return
+        for kwargs, wait in frames:
+            yield self.synthesize_commands(**kwargs), wait
 
-    def utter(self, utterance, model=None, *, no_pitch=False):
+    def utter_frames(self, utterance, model=None, *, no_pitch=False):
+        '''Like `say_frames`, for `utter`.'''
         if model:
             for phonetic, wait, pitch in utterance:
                 if no_pitch: pitch = None
-                self.say(phonetic, model, wait, pitch)
+                yield from self.say_frames(phonetic, model, wait, pitch)
         else:
             for frame, wait, pitch in utterance:
                 if no_pitch: pitch = None
-                self.synthesize(
-                    toniness=frame['toniness'],
-                    tone_spectrum=frame['tone']['spectrum'],
-                    noise_spectrum=frame['noise']['spectrum'],
-                    wait=wait,
-                    pitch=pitch,
+                yield (
+                    {
+                        'toniness': frame['toniness'],
+                        'tone_spectrum': frame['tone']['spectrum'],
+                        'noise_spectrum': frame['noise']['spectrum'],
+                        'pitch': pitch,
+                    },
+                    wait,
                 )
 
+    def keyframe_events(self, frames, tolerance=0.05):
+        '''Compress `(kwargs, wait)` frames into `(commands, wait)` batches of keyframes.
+
+        A frame is a keyframe when its toniness, or the norm of the difference of a spectrum or formants, differs from the previous keyframe by more than `tolerance` (relative to the norm for vectors), or when its pitch or kind of tone changes.
+        Tone spectra, formants, and noise spectra glide linearly from one keyframe to the next on the audio thread, using the components' `keyframe` commands.
+        So the number of batches scales with how much the sound changes, rather than with its duration.'''
+        frames = list(frames)
+        if not frames: return
+        times = [0]
+        for _, wait in frames:
+            times.append(times[-1] + (wait or 0))
+        keys = [0]
+        for i in range(1, len(frames)):
+            if SpeechSynth.frames_differ(frames[keys[-1]][0], frames[i][0], tolerance):
+                keys.append(i)
+        if keys[-1] != len(frames) - 1:
+            keys.append(len(frames) - 1)
+        wait = 0
+        for j, i in enumerate(keys):
+            prev = frames[keys[j-1]][0] if j else None
+            prev_wait = wait
+            curr = frames[i][0]
+            if j + 1 < len(keys):
+                upcoming = frames[keys[j+1]][0]
+                wait = times[keys[j+1]] - times[i]
+            else:
+                upcoming = None
+                wait = times[-1] - times[i]
+            yield self.keyframe_commands(prev, curr, upcoming, wait, prev_wait), wait
+
+    def frames_differ(a, b, tolerance):
+        '''Whether frame `b` needs its own keyframe after keyframe `a`, both as `synthesize_commands` kwargs.'''
+        if SpeechSynth.tone_kind(a) != SpeechSynth.tone_kind(b): return True
+        if a.get('pitch') != b.get('pitch'): return True
+        if (a['toniness'] < 0.2) != (b['toniness'] < 0.2): return True
+        if abs(a['toniness'] - b['toniness']) > tolerance: return True
+        for k in ['tone_spectrum', 'noise_spectrum', 'noise_pieces']:
+            if (a.get(k) == None) != (b.get(k) == None): return True
+        vectors = [
+            (SpeechSynth.tone_vector(a), SpeechSynth.tone_vector(b)),
+            (a.get('noise_spectrum'), b.get('noise_spectrum')),
+            (a.get('noise_pieces'), b.get('noise_pieces')),
+        ]
+        for va, vb in vectors:
+            if va == None: continue
+            va = _np.asarray(va, dtype=float)
+            vb = _np.asarray(vb, dtype=float)
+            if va.shape != vb.shape: return True
+            scale = max(_np.linalg.norm(va), _np.linalg.norm(vb))
+            if scale and _np.linalg.norm(va - vb) > tolerance * scale: return True
+        return False
+
+    def tone_kind(kwargs):
+        if kwargs.get('tone_spectrum'): return 'spectrum'
+        formants = kwargs.get('tone_formants')
+        if formants:
+            if all(i['amp'] < 1e-2 for i in formants): return 'zero'
+            return 'formants'
+
+    def tone_vector(kwargs):
+        kind = SpeechSynth.tone_kind(kwargs)
+        if kind == 'spectrum':
+            return kwargs['tone_spectrum']
+        elif kind == 'formants':
+            return [j for i in kwargs['tone_formants'] for j in [i['freq'], i['amp']]]
+
+    def keyframe_commands(self, prev, curr, upcoming, glide, prev_glide=0):
+        '''Commands to reach keyframe `curr`, unless already gliding to it from `prev` over `prev_glide` samples, and then glide to `upcoming` over `glide` samples.'''
+        commands = self.synthesize_commands(toniness=curr['toniness'])
+        # same condition as gliding_out for the previous keyframe
+        gliding_in = prev != None and prev_glide and not SpeechSynth.frames_differ_in_kind(prev, curr)
+        gliding_out = upcoming != None and glide and not SpeechSynth.frames_differ_in_kind(curr, upcoming)
+        # tone
+        kind = SpeechSynth.tone_kind(curr)
+        component = {'spectrum': self.tone, 'formants': self.forman}.get(kind)
+        if kind == 'zero':
+            commands.append((self.forman, 'zero', []))
+        elif component:
+            if not gliding_in:
+                commands.append((component, 'keyframe', [[0] + SpeechSynth.tone_vector(curr)]))
+            if gliding_out:
+                commands.append((component, 'keyframe', [[glide] + SpeechSynth.tone_vector(upcoming)]))
+        # noise
+        if curr.get('noise_spectrum'):
+            if not gliding_in:
+                commands.append((self.noise, 'keyframe', [[0] + list(curr['noise_spectrum'])]))
+            if gliding_out:
+                commands.append((self.noise, 'keyframe', [[glide] + list(upcoming['noise_spectrum'])]))
+        elif curr.get('noise_pieces'):
+            commands.append((self.noise, 'piecewise', [[0] + NOISE_PIECES + [20000], [0] + curr['noise_pieces'] + [0]]))
+        # pitch
+        if curr.get('pitch') != None and (prev == None or prev.get('pitch') != curr['pitch']):
+            commands.append((self.tone, 'midi', [[0x90, curr['pitch'], 127]]))
+        return commands
+
+    def frames_differ_in_kind(a, b):
+        '''Whether frames can't be glided between.'''
+        return SpeechSynth.frames_differ(a, b, float('inf'))
+
+    def compile(self, utterance, model=None, *, no_pitch=False, tolerance=None):
+        '''Compile an utterance into a timeline of `(sample, commands)`, with commands at the start of the run the comm would run them in.
+
+        Returns the timeline and the number of samples it spans.'''
+        timeline = []
+        run = 0
+        wait = 0
+        for commands, event_wait in self.utter_events(utterance, model, no_pitch=no_pitch, tolerance=tolerance):
+            timeline.append((run * self.run_size, commands))
+            # follow the comm's accounting: a wait longer than a run finishes that run
+            wait += event_wait or 0
+            while wait > self.run_size:
+                wait -= self.run_size
+                run += 1
+        return timeline, (run + 1) * self.run_size
+
+    def render_offline(self, utterance, driver, capture=None, model=None, *, no_pitch=False, tolerance=None):
+        '''Render an utterance by running `driver` directly, without the comm.
+
+        The utterance is compiled with `compile`, and each timeline entry's commands are run immediately before their run.
+        `driver` must be running this synth and not be started.
+        `capture` is as in `Audio.run_many`, and defaults to a new array.
+        Returns the rendered samples as a float32 NumPy array.'''
+        assert driver.run_size() == self.run_size
+        timeline, samples = self.compile(utterance, model, no_pitch=no_pitch, tolerance=tolerance)
+        if capture is None:
+            capture = _np.empty(samples, dtype=_np.float32)
+        rendered = []
+        sample = 0
+        for sample_next, commands in timeline + [(samples, [])]:
+            if sample_next > sample:
+                runs = (sample_next - sample) // self.run_size
+                if isinstance(capture, _np.ndarray):
+                    rendered.append(driver.run_many(runs, capture[sample:]))
+                else:
+                    rendered.append(driver.run_many(runs, capture))
+                sample = sample_next
+            for component, name, args in commands:
+                component.command_immediate(name, args)
+        if isinstance(capture, _np.ndarray):
+            return capture[:samples]
+        return _np.concatenate(rendered)
+
+class SpeechVocoder(Subsystem):
+    '''
+    Resynthesizes the audio going into `sampler` through `synth`, with no Python per run.
+    Each run, `sampler`'s stft sends its spectrum to a `phonan` component, which parameterizes it like `Model.parameterize` (tracking formants from run to run) and sends the parameters to `synth` like `SpeechSynth.synthesize`.
+    `sampler` should be added to the driver before `synth`, so the synth hears each run's analysis in the same run.
+    Analysis parameters can be adjusted through `phonan`'s commands.
+    '''
+
+    def init(self, sampler, synth, formants=False, name=None):
+        Subsystem.init(self, {'phonan': 'phonan'}, name=name)
+        sampler.stft.smooth(0)
+        sampler.stft.connect(self.phonan)
+        if formants:
+            self.phonan.connect(synth.forman, kind='formants')
+        else:
+            self.phonan.connect(synth.tone, kind='tone')
+        self.phonan.connect(synth.noise, kind='noise')
+        self.phonan.connect(synth.gain_tone, kind='gain_tone')
+        self.phonan.connect(synth.gain_noise, kind='gain_noise')
+
 def file_to_frames(path, quiet=False):
     from . import Afr, Audio
     driver = Audio(driver=True)
@@ -908,16 +1390,150 @@ def file_to_frames(path, quiet=False):
     speech_sampler.__del__()
     return frames
 
+def file_to_frames_offline(path, model=None, **kwargs):
+    '''Like `file_to_frames`, but reads and analyzes the whole file at once, without a driver. `kwargs` are passed to `analyze`.'''
+    if model == None:
+        model = Model()
+    spectra, amps_tone, amps_noise = analyze_file(
+        path,
+        sample_rate=model.sample_rate,
+        run_size=model.run_size,
+        **kwargs,
+    )
+    paramses = model.parameterize_many(spectra, amps_tone, amps_noise)
+    return [model.frames_from_paramses([params])[0] for params in paramses]
+
+def split_indices(toniness, min_size=32, toniness_thresh=0.5):
+    '''
+    Find the `(start, end)` frame ranges that `split_frames` makes, from each frame's toniness.
+    A range ends where toniness crosses the threshold, unless that would make it shorter than `min_size`.
+    '''
+    if len(toniness) == 0: return [(0, 0)]
+    toniness = _np.asarray(toniness, dtype=float)
+    toniness_thresh = toniness_thresh * toniness.max() + (1 - toniness_thresh) * toniness.min()
+    toniness_low = toniness < toniness_thresh
+    bounds = [0]
+    for i in (_np.flatnonzero(toniness_low[1:] != toniness_low[:-1]) + 1).tolist():
+        if i - bounds[-1] >= min_size:
+            bounds.append(i)
+    bounds.append(len(toniness))
+    return list(zip(bounds[:-1], bounds[1:]))
+
 def split_frames(frames, min_size=32, toniness_thresh=0.5):
-    if len(frames) == 0: return [[]]
-    toniness = [i['toniness'] for i in frames]
-    toniness_thresh = toniness_thresh * max(toniness) + (1 - toniness_thresh) * min(toniness)
-    toniness_low_prev = toniness[0] < toniness_thresh
-    split = [[]]
-    for frame in frames:
-        toniness_low = frame['toniness'] < toniness_thresh
-        if toniness_low != toniness_low_prev and len(split[-1]) >= min_size:
-            split.append([])
-        split[-1].append(frame)
-        toniness_low_prev = toniness_low
-    return split
+    if isinstance(frames, Frames):
+        toniness = frames.arrays['toniness']
+    else:
+        toniness = [i['toniness'] for i in frames]
+    return [list(frames[a:b]) for a, b in split_indices(toniness, min_size, toniness_thresh)]
+
+def note_indices(notes, frame_count):
+    '''Spread `notes` evenly over `frame_count` frames, returning each note's `[start, end]` frame indices. A note ends where the next begins.'''
+    samples_i = notes[0]['on']
+    samples_total = notes[-1]['off'] - samples_i
+    ends = [note['on'] for note in notes[1:]] + [notes[-1]['off']]
+    return [
+        [
+            int((note['on'] - samples_i) / samples_total * frame_count),
+            int((end - samples_i) / samples_total * frame_count),
+        ]
+        for note, end in zip(notes, ends)
+    ]
+
+FRAME_STORE_VERSION = 1
+
+class FrameStore:
+    '''
+    Frames of audio files, analyzed offline once and then kept on disk as arrays.
+    Entries are keyed by the file's content hash, and the model and analysis parameters, so editing a file or changing parameters reanalyzes it.
+    Indexes of toniness segments and note boundaries are built on first use and kept in memory alongside the arrays.
+    '''
+
+    cache = _cache.NpzDiskCache('speech_frames', max_bytes=1 << 30)
+
+    def __init__(
+        self,
+        model=None,
+        stft_bins=512,
+        tone_bins=[1, 6],
+        tone_factor=2e1,
+        noise_bins=[32, 256],
+        noise_factor=1e2,
+    ):
+        self.model = model or Model()
+        self.analysis_kwargs = {
+            'stft_bins': stft_bins,
+            'tone_bins': tone_bins,
+            'tone_factor': tone_factor,
+            'noise_bins': noise_bins,
+            'noise_factor': noise_factor,
+        }
+        self.entries = {}
+
+    def key(self, path):
+        return {
+            'version': FRAME_STORE_VERSION,
+            'audio': _cache.file_hash(path),
+            'model': {
+                'stft_bins': self.model.stft_bins,
+                'tone_bins': self.model.tone_bins,
+                'noise_bins': self.model.noise_bins,
+                'sample_rate': self.model.sample_rate,
+                'run_size': self.model.run_size,
+            },
+            'analysis': self.analysis_kwargs,
+        }
+
+    def entry(self, path):
+        stat = _os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        entry = self.entries.get(str(path))
+        if entry and entry['version'] == version: return entry
+        key = self.key(path)
+        arrays = self.cache.get(key)
+        if arrays == None:
+            frames = file_to_frames_offline(path, self.model, **self.analysis_kwargs)
+            arrays = self.cache.put(key, frames_to_arrays(frames))
+        entry = {
+            'version': version,
+            'frames': Frames(arrays),
+            'indexes': {},
+        }
+        self.entries[str(path)] = entry
+        return entry
+
+    def index(self, path, name, f):
+        indexes = self.entry(path)['indexes']
+        if name not in indexes:
+            indexes[name] = f(self.arrays(path))
+        return indexes[name]
+
+    def arrays(self, path):
+        return self.entry(path)['frames'].arrays
+
+    def frames(self, path):
+        return self.entry(path)['frames']
+
+    def segments(self, path, min_size=32, toniness_thresh=0.5):
+        'Like `split_indices` of the frames.'
+        return self.index(
+            path,
+            ('segments', min_size, toniness_thresh),
+            lambda arrays: split_indices(arrays['toniness'], min_size, toniness_thresh),
+        )
+
+    def last_audible(self, path, threshold=0.001):
+        'Index of the last frame whose noise spectrum sums to at least `threshold`.'
+        def f(arrays):
+            audible = _np.flatnonzero(arrays['noise_spectrum'].sum(axis=1, dtype=float) >= threshold)
+            if not len(audible): raise Exception(f'no audible frames in {path}')
+            return int(audible[-1])
+        return self.index(path, ('last_audible', threshold), f)
+
+    def note_indices(self, path, notes, threshold=0.001):
+        'Like `note_indices`, spreading `notes` over the frames up to the last audible one.'
+        indices = self.index(
+            path,
+            ('notes', tuple((note['on'], note['off']) for note in notes), threshold),
+            lambda arrays: note_indices(notes, self.last_audible(path, threshold)),
+        )
+        return [list(i) for i in indices]
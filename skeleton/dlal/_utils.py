@@ -1,3 +1,5 @@
+import numpy as np
+
 from collections.abc import Iterable
 import json
 import os
@@ -19,6 +21,10 @@ class JsonEncoder(json.JSONEncoder):
     def default(self, o):
         if isinstance(o, Path):
             return str(o)
+        if isinstance(o, np.ndarray):
+            return o.tolist()
+        if isinstance(o, np.generic):
+            return o.item()
 
 def snake_to_upper_camel_case(s):
     return ''.join(i.capitalize() for i in s.split('_'))
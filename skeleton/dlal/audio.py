@@ -1,12 +1,21 @@
 from ._component import Component
 
+import numpy as np
+
+import os
+
 class Audio(Component):
+    # kinds whose runs can touch any component, so they run alone when parallel
+    parallel_barrier_kinds = {'comm'}
+
     def __init__(self, *, driver=False, run_size=None, mic=False, **kwargs):
         from ._skeleton import driver_set
         Component.__init__(self, 'audio', **kwargs)
         self.components = []
         self.slots = {}
         self.with_components = None
+        self.parallel_threads = 0
+        self.parallel_version = None
         if driver: driver_set(self)
         if run_size: self.run_size(run_size)
         if mic: self.add(self)
@@ -45,15 +54,76 @@ class Audio(Component):
         self.slots[component.name] = slot
         if self.with_components != None:
             self.with_components.append(component)
+        self.parallel_sync()
         return result
 
     def remove(self, component):
         result = self.command('remove', component._view())
         self.components.remove(component.name)
         del self.slots[component.name]
+        self.parallel_sync()
         return result
 
+    def parallel(self, threads=None):
+        '''Run addees on `threads` threads, including the audio thread; by default, one per CPU.
+        0 or 1 runs serially.
+        Addees that don't share a component (themselves or what they're connected to) run concurrently, otherwise in serial order, so output is unchanged.
+        When this is the driver, connections are picked up as they're made; otherwise by `start`, `run`, `run_many`, or `parallel_sync`.'''
+        if threads == None:
+            threads = os.cpu_count() or 1
+        self.parallel_threads = threads
+        self.parallel_version = None
+        if threads <= 1:
+            return self.command('parallel', [threads])
+        self.parallel_sync()
+
+    def parallel_sync(self):
+        'Send the connections between addees to the driver, if parallel and they changed.'
+        if self.parallel_threads <= 1: return
+        version = (Component._connections_version, tuple(self.components))
+        if version == self.parallel_version: return
+        touches = {}
+        for name in self.components:
+            component = Component._components.get(name)
+            if component == None or component.kind in self.parallel_barrier_kinds:
+                continue
+            touches[name] = list(Component._connections.get(name, {}))
+        self.command('parallel', [self.parallel_threads, touches])
+        self.parallel_version = version
+
+    def run_many(self, n, capture=None):
+        '''Run `n` times with a single command.
+        `capture` can be:
+        - a tape, which is cleared and then read in bulk as the runs proceed
+        - a float32 NumPy array of at least `n * run_size` samples, which receives the driver output
+        In either case, the captured samples are returned as a NumPy array.'''
+        from .tape import Tape
+        self.parallel_sync()
+        if capture is None:
+            return self.command_immediate('run_many', [n])
+        run_size = self.run_size()
+        if isinstance(capture, Tape):
+            result = np.empty(n * run_size, dtype=np.float32)
+            size = 0
+            capture.clear()
+            chunk = max(capture.size() // run_size, 1)
+            for i in range(0, n, chunk):
+                self.command_immediate('run_many', [min(chunk, n - i)])
+                size += capture.read_into(result[size:])
+            return result[:size]
+        if capture.dtype != np.float32 or not capture.flags.c_contiguous:
+            raise Exception('capture must be a contiguous float32 array')
+        if capture.size < n * run_size:
+            raise Exception(f'capture must have room for {n * run_size} samples')
+        self.command_immediate('run_many', [n, str(capture.ctypes.data)])
+        return capture[:n * run_size]
+
+    def run(self):
+        self.parallel_sync()
+        return self.command('run')
+
     def start(self):
+        self.parallel_sync()
         return self.command_immediate('start')
 
     def stop(self):
@@ -70,16 +140,18 @@ class Audio(Component):
         for name in state['components']:
             self.add(component(name), state['slots'][name])
 
-    def profile_print(self):
-        profiles = self.profiles()
-        for profile in profiles:
-            total = 0
-            durs = []
-            for i in profile:
-                dur = i['duration']['secs'] * 1e3 + i['duration']['nanos'] / 1e6
-                durs.append((i['name'], dur))
-                total += dur
-            durs.sort(key=lambda i: -i[1])
-            for name, dur in durs:
-                print(f'{name:7} {dur:7.3f}', end=', ')
-            print(f'total {total: 7.3f} ms')
+    def stats(self):
+        return self.command_immediate('stats')
+
+    def stats_print(self):
+        stats = self.stats()
+        addees = sorted(stats['addees'], key=lambda i: -i['run']['total_ns'])
+        for i in addees:
+            run = i['run']
+            mean = run['total_ns'] / run['count'] / 1e3 if run['count'] else 0
+            print(f'''{i['name']:12} mean {mean:9.3f} us, max {run['max_ns'] / 1e3:9.3f} us''')
+        utilization = stats['utilization']
+        print(f'''utilization mean {utilization['mean']:.1%}, max {utilization['max']:.1%}''')
+        print('xruns', ', '.join(f'{k} {v}' for k, v in stats['xruns'].items()))
+
+    profile_print = stats_print
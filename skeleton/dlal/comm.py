@@ -1,5 +1,10 @@
+from ._async import Poll, dispatch
 from ._component import Component
 
+import ctypes
+import threading
+import time
+
 class _Pauser():
     def __init__(self, comm):
         self.comm = comm
@@ -15,7 +20,13 @@ class _Pauser():
             x = self.comm.pause(False)
 
 class Comm(Component):
+    '''Queues commands to be run on the audio thread.
+
+    The underlying queues are single-producer, so queueing and collecting replies happen under `self.lock`.
+    Commands with a typed form are decoded here; the rest are passed as JSON, which the component parses on the audio thread.'''
+
     def __init__(self, size=None, **kwargs):
+        self.lock = threading.RLock()
         Component.__init__(self, 'comm', **kwargs)
         from ._skeleton import Immediate
         with Immediate():
@@ -30,22 +41,133 @@ class Comm(Component):
         Component._comm = self.component_comm
 
     def queue(self, component, name, args=[], kwargs={}, timeout_ms=20, detach=False):
-        return self.command_immediate(
-            'queue',
-            [
-                *component._view(),
-                {
-                    'name': name,
-                    'args': args,
-                    'kwargs': kwargs,
-                },
-                timeout_ms,
-                detach,
-            ],
-        )
+        if name in component._typed and not kwargs:
+            typed_args = Component._typed_args(args)
+            if typed_args is not None:
+                return self.queue_typed(component, name, typed_args, timeout_ms, detach)
+        with self.lock:
+            return self.command_immediate(
+                'queue',
+                [
+                    *Comm._command_item(component, name, args, kwargs),
+                    timeout_ms,
+                    detach,
+                ],
+            )
+
+    def queue_typed(self, component, name, args, timeout_ms=20, detach=False):
+        '''Queue a typed command; `args` is copied into a preallocated slot before this returns.'''
+        with self.lock:
+            result = self.command_immediate(
+                'queue_typed',
+                [
+                    *Comm._typed_item(component, name, args),
+                    timeout_ms,
+                    detach,
+                ],
+            )
+        return Comm._typed_result(component, name, result)
+
+    def queue_many(self, commands, wait=None, timeout_ms=20, detach=False):
+        '''Queue several commands to be run together in a single audio run.
+
+        `commands` is a list of `(component, name, args)` or `(component, name, args, kwargs)`.
+        If `wait` is given, the comm waits that many samples after the batch.
+        Returns the list of results, or `None` if detached.
+        '''
+        items, typeds = Comm._many_items(commands)
+        with self.lock:
+            results = self.command_immediate('queue_many', [items, wait, timeout_ms, detach])
+        if detach: return
+        return Comm._many_results(commands, typeds, results)
+
+    async def aqueue(self, component, name, args=[], kwargs={}, timeout_ms=20, detach=False):
+        results = await self.aqueue_many([(component, name, args, kwargs)], timeout_ms=timeout_ms, detach=detach)
+        if results != None: return results[0]
+
+    async def aqueue_many(self, commands, wait=None, timeout_ms=20, detach=False):
+        '''Like `queue_many`, but awaitable. Replies are polled for by the dispatcher thread, so it's free to make other calls meanwhile.'''
+        if detach:
+            return await dispatch(self.queue_many, commands, wait, timeout_ms, detach)
+        return await dispatch(self._queue_many_poll, commands, wait, timeout_ms)
+
+    def _queue_many_poll(self, commands, wait, timeout_ms):
+        items, typeds = Comm._many_items(commands)
+        with self.lock:
+            seq = self.command_immediate('queue_many', [items, wait, None, False])
+        deadline = time.monotonic() + timeout_ms / 1000
+        results = []
+        def poll():
+            with self.lock:
+                while len(results) < len(items):
+                    reply = self.command_immediate('reply', [seq + len(results)])
+                    if reply == None: break
+                    results.append(reply['result'])
+                else:
+                    return Comm._many_results(commands, typeds, results)
+                if time.monotonic() < deadline: return Poll.pending
+                for i in range(len(results), len(items)):
+                    self.command_immediate('forget', [seq + i])
+            raise Exception('timed out waiting for reply')
+        return Poll(poll)
+
+    def _many_items(commands):
+        items = []
+        typeds = []
+        for command in commands:
+            component, name, args, kwargs, *_ = (*command, {})
+            typed_args = None
+            if name in component._typed and not kwargs:
+                typed_args = Component._typed_args(args)
+            if typed_args is not None:
+                items.append(['typed', *Comm._typed_item(component, name, typed_args)])
+            else:
+                items.append(['command', *Comm._command_item(component, name, args, kwargs)])
+            typeds.append(typed_args)  # keeps args alive until they're copied
+        return items, typeds
+
+    def _many_results(commands, typeds, results):
+        for i, result in enumerate(results):
+            if type(result) == dict and 'error' in result:
+                raise Exception(result['error'])
+            if typeds[i] is not None:
+                component, name = commands[i][:2]
+                results[i] = Comm._typed_result(component, name, result)
+        return results
 
     def wait(self, samples):
-        return self.command_immediate('wait', [samples])
+        with self.lock:
+            return self.command_immediate('wait', [samples])
+
+    def resize(self, size):
+        with self.lock:
+            return self.command_immediate('resize', [size])
 
     def pauser(self):
         return _Pauser(self)
+
+    def _command_item(component, name, args, kwargs):
+        return [
+            *component._view(),
+            {
+                'name': name,
+                'args': args,
+                'kwargs': kwargs,
+            },
+        ]
+
+    def _typed_item(component, name, args):
+        return [
+            str(component._raw),
+            str(ctypes.cast(component._lib.command_typed, ctypes.c_void_p).value),
+            name,
+            str(args.ctypes.data),
+            args.size,
+        ]
+
+    def _typed_result(component, name, result):
+        returns = component._typed[name]
+        if returns == 'scalar':
+            if result: return result[0]
+        elif returns == 'array':
+            return result
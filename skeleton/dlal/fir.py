@@ -1,5 +1,8 @@
+from ._cache import DiskCache
 from ._component import Component
 
+import numpy as np
+
 import math
 
 def flip_odd(i):
@@ -90,6 +93,8 @@ class Box:
         self.f = f
 
 class Room:
+    ir_cache = DiskCache('room_ir')
+
     def __init__(
         self,
         size=(7, 3, 5),
@@ -127,40 +132,112 @@ class Room:
         order=32,
         speed_of_sound=343,
         threshold=1e-5,
+        cache=True,
     ):
-        p_src = Vec3(*p_src)
-        d_src = Vec3(*d_src)
-        ir = [0]
-        for i in range(-order, order+1):
-            for j in range(-order, order+1):
-                for k in range(-order, order+1):
-                    ijk = Vec3(i, j, k)
-                    m = Vec3(
-                        (i % 2 * -2 + 1),
-                        (j % 2 * -2 + 1),
-                        (k % 2 * -2 + 1),
-                    )
-                    p_ear = self.size.mul_components(ijk) + self.p_ear.mul_components(m)
-                    s = p_src - p_ear
-                    s_mag = max(s.mag(), 1)
-                    amp = gain / s_mag
-                    amp *= self.damp.l ** (abs((i+0) // 2))
-                    amp *= self.damp.r ** (abs((i+1) // 2))
-                    amp *= self.damp.d ** (abs((j+0) // 2))
-                    amp *= self.damp.u ** (abs((j+1) // 2))
-                    amp *= self.damp.b ** (abs((k+0) // 2))
-                    amp *= self.damp.f ** (abs((k+1) // 2))
-                    d_ear = self.d_ear.mul_components(m)
-                    amp *= self.ear_directionality * max(d_ear.dot(s.norm()), 0) + (1 - self.ear_directionality)
-                    amp *= src_directionality * max(d_src.dot(-s.norm()), 0) + (1 - src_directionality)
-                    if amp < threshold: continue
-                    t = s_mag / speed_of_sound * sample_rate
-                    a = int(t)
-                    u = t - a
-                    while a+1 >= len(ir): ir.append(0)
-                    ir[a+0] += (1-u) * amp
-                    ir[a+1] += (  u) * amp
-        return ir
+        return self.ir_many(
+            [p_src],
+            d_src=d_src,
+            src_directionality=src_directionality,
+            gain=gain,
+            sample_rate=sample_rate,
+            order=order,
+            speed_of_sound=speed_of_sound,
+            threshold=threshold,
+            cache=cache,
+        )[0]
+
+    def ir_many(
+        self,
+        p_srcs,
+        *,
+        d_src=(0, 0, -1),
+        src_directionality=0,
+        gain=10,
+        sample_rate=44100,
+        order=32,
+        speed_of_sound=343,
+        threshold=1e-5,
+        cache=True,
+    ):
+        '''Like `ir`, but for each source position in `p_srcs`. Image sources are computed once and shared.
+
+        If `cache` is true, results are looked up in and stored to `Room.ir_cache`, keyed by geometry and parameters.'''
+        p_srcs = list(p_srcs)
+        irs = [None] * len(p_srcs)
+        keys = [None] * len(p_srcs)
+        if cache:
+            for i, p_src in enumerate(p_srcs):
+                keys[i] = self._ir_key(
+                    p_src,
+                    d_src=d_src,
+                    src_directionality=src_directionality,
+                    gain=gain,
+                    sample_rate=sample_rate,
+                    order=order,
+                    speed_of_sound=speed_of_sound,
+                    threshold=threshold,
+                )
+                ir = Room.ir_cache.get(keys[i])
+                if ir is not None: irs[i] = ir.tolist()
+        if all(ir is not None for ir in irs): return irs
+        p_ear, d_ear, damp = self._images(order)
+        d_src = np.array(d_src, dtype=float)
+        for i_src, p_src in enumerate(p_srcs):
+            if irs[i_src] is not None: continue
+            s = np.array(p_src, dtype=float) - p_ear
+            s_mag = np.sqrt((s ** 2).sum(axis=1))
+            s_norm = s / np.where(s_mag == 0, 1, s_mag)[:, None]
+            s_mag = np.maximum(s_mag, 1)
+            amp = gain / s_mag * damp
+            amp *= self.ear_directionality * np.maximum((d_ear * s_norm).sum(axis=1), 0) + (1 - self.ear_directionality)
+            amp *= src_directionality * np.maximum(-s_norm @ d_src, 0) + (1 - src_directionality)
+            audible = amp >= threshold
+            amp = amp[audible]
+            t = s_mag[audible] / speed_of_sound * sample_rate
+            a = t.astype(int)
+            u = t - a
+            size = a.max() + 2 if len(a) else 1
+            ir = (
+                np.bincount(a, (1 - u) * amp, minlength=size)
+                + np.bincount(a + 1, u * amp, minlength=size)
+            )
+            if cache:
+                ir = Room.ir_cache.put(keys[i_src], ir)
+            irs[i_src] = ir.tolist()
+        return irs
+
+    def _ir_key(self, p_src, **kwargs):
+        vec = lambda v: [float(v.x), float(v.y), float(v.z)]
+        return {
+            'kind': 'room_ir',
+            'size': vec(self.size),
+            'p_ear': vec(self.p_ear),
+            'd_ear': vec(self.d_ear),
+            'ear_directionality': self.ear_directionality,
+            'damp': [self.damp.l, self.damp.r, self.damp.d, self.damp.u, self.damp.b, self.damp.f],
+            'p_src': [float(i) for i in p_src],
+            'd_src': [float(i) for i in kwargs.pop('d_src')],
+            **kwargs,
+        }
+
+    def _images(self, order):
+        '''Ear positions, ear directions, and wall damping for each image of the room, as arrays.'''
+        r = np.arange(-order, order+1)
+        ijk = np.stack(np.meshgrid(r, r, r, indexing='ij'), axis=-1).reshape(-1, 3)
+        i, j, k = ijk.T
+        m = ijk % 2 * -2 + 1
+        size = np.array([self.size.x, self.size.y, self.size.z])
+        p_ear = size * ijk + np.array([self.p_ear.x, self.p_ear.y, self.p_ear.z]) * m
+        d_ear = np.array([self.d_ear.x, self.d_ear.y, self.d_ear.z]) * m
+        damp = (
+            self.damp.l ** np.abs((i+0) // 2)
+            * self.damp.r ** np.abs((i+1) // 2)
+            * self.damp.d ** np.abs((j+0) // 2)
+            * self.damp.u ** np.abs((j+1) // 2)
+            * self.damp.b ** np.abs((k+0) // 2)
+            * self.damp.f ** np.abs((k+1) // 2)
+        )
+        return p_ear, d_ear, damp
 
 class Fir(Component):
     Room = Room
@@ -0,0 +1,21 @@
+from ._component import Component
+
+class Phonan(Component):
+    # typed commands an output needs, per kind of connection
+    typed_commands = {
+        'tone': ['spectrum'],
+        'formants': ['keyframe', 'zero'],
+        'noise': ['spectrum'],
+        'gain_tone': ['set'],
+        'gain_noise': ['set'],
+    }
+
+    def __init__(self, **kwargs):
+        Component.__init__(self, 'phonan', **kwargs)
+
+    def _connect_kwargs(self, other, extra):
+        'Outputs with the typed commands for their kind get args directly as floats, skipping JSON.'
+        names = Phonan.typed_commands.get(extra.get('kind', 'tone'), [])
+        if names and all(i in getattr(other, '_typed', {}) for i in names):
+            return {**extra, 'typed': other._typed_view()}
+        return extra
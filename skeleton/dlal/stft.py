@@ -6,3 +6,9 @@ class Stft(Component):
         from ._skeleton import Immediate
         with Immediate():
             if window_size != None: self.window_size(window_size)
+
+    def _connect_kwargs(self, other, extra):
+        'Outputs with a typed `stft` command get the spectrum directly as floats, skipping JSON.'
+        if 'stft' in getattr(other, '_typed', {}) and extra.get('kind', 'norm') == 'norm':
+            return {**extra, 'typed': other._typed_view()}
+        return extra
@@ -1,6 +1,10 @@
+from ._async import dispatch
 from ._component import Component
+from ._sound import quantize_i16
 
-import struct
+import numpy as np
+
+import asyncio
 import threading
 import weakref
 
@@ -16,17 +20,49 @@ class Tape(Component):
         return self.command_immediate('clear')
 
     def read(self, size=None):
-        args = []
-        if size: args.append(size)
-        return [float(i) for i in self.command_immediate('read', args)]
+        return self.read_numpy(size).tolist()
+
+    def read_into(self, buffer, block=False):
+        '''Fill `buffer` with samples from the tape, without going through JSON.
+        `buffer` can be a float32 NumPy array, or anything exposing a writable buffer of float32s (memoryview, ctypes array, bytearray).
+        If `block` is true, wait until `buffer` is full; otherwise read what's available.
+        Returns the number of samples read.'''
+        if not isinstance(buffer, np.ndarray):
+            buffer = np.frombuffer(buffer, dtype=np.float32)
+        if buffer.dtype != np.float32:
+            raise Exception('buffer must be float32')
+        if not buffer.flags.c_contiguous or not buffer.flags.writeable:
+            raise Exception('buffer must be contiguous and writeable')
+        return self.command_immediate('read_into', [
+            str(buffer.ctypes.data),
+            buffer.size,
+            block,
+        ])
+
+    def read_numpy(self, size=None):
+        '''Like `read`, but returns a float32 NumPy array.
+        If `size` is specified, wait for that many samples; otherwise read what's available.'''
+        if size:
+            buffer = np.empty(size, dtype=np.float32)
+            self.read_into(buffer, block=True)
+            return buffer
+        buffer = np.empty(self.size(), dtype=np.float32)
+        return buffer[:self.read_into(buffer)]
+
+    async def ablocks(self, size, poll=0.005):
+        '''Asynchronously iterate over blocks of `size` samples, as float32 NumPy arrays.
+        Reads don't block the dispatcher; while a block is incomplete, wait `poll` seconds between reads.'''
+        while True:
+            buffer = np.empty(size, dtype=np.float32)
+            filled = 0
+            while True:
+                filled += await dispatch(self.read_into, buffer[filled:])
+                if filled == size: break
+                await asyncio.sleep(poll)
+            yield buffer
 
     def to_file_i16le(self, file, size=None):
-        samples = self.read(size)
-        for sample in samples:
-            i = int(sample * 0x7fff)
-            if i > 0x7fff: i = 0x7fff
-            elif i < -0x8000: i = -0x8000
-            file.write(struct.pack('<h', i))
+        file.write(quantize_i16(self.read_numpy(size)).tobytes())
 
     def to_file_i16le_start(self, file_path='out.i16le', size=64):
         self.clear()
@@ -0,0 +1,193 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+import traceback
+
+SCHEMA_VERSION = 2
+PERIODS = {
+    'hour': 3600,
+    'day': 24 * 3600,
+}
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS category_names(
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    );
+    CREATE TABLE IF NOT EXISTS events(
+        time REAL NOT NULL,
+        category_id INTEGER NOT NULL REFERENCES category_names(id),
+        count INTEGER NOT NULL,
+        amp REAL
+    );
+    CREATE INDEX IF NOT EXISTS events_time ON events(time, category_id, count, amp);
+    CREATE INDEX IF NOT EXISTS events_category_time ON events(category_id, time, count, amp);
+    CREATE TABLE IF NOT EXISTS rollups(
+        period INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,
+        start INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        amp REAL,
+        PRIMARY KEY(period, category_id, start)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS rollups_start ON rollups(period, start, category_id, count);
+    CREATE TABLE IF NOT EXISTS lifeline(time REAL);
+    CREATE INDEX IF NOT EXISTS lifeline_time ON lifeline(time);
+'''
+
+ROLLUP = '''
+    INSERT INTO rollups(period, category_id, start, count, amp)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(period, category_id, start) DO UPDATE SET
+        count = count + excluded.count,
+        amp = max(coalesce(amp, excluded.amp), coalesce(excluded.amp, amp))
+'''
+
+class EventStore:
+    '''Detections over time, as (time, category, count, amp) events plus hourly and daily rollups.
+
+    Writes are queued and committed in batches by a background thread, so callers never wait on the disk.
+    Rollup periods start at multiples of their length since the epoch, so days are UTC days.'''
+
+    def __init__(self, path='monitor.db', flush_period=5):
+        self.path = path
+        self.flush_period = flush_period
+        self.queue = queue.Queue()
+        con = self.connect()
+        con.executescript(SCHEMA)
+        if con.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+            self.migrate(con)
+            con.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        con.commit()
+        con.close()
+        self.thread = threading.Thread(target=self.write_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def connect(self):
+        con = sqlite3.connect(self.path, timeout=30)
+        con.execute('PRAGMA journal_mode = WAL')
+        con.execute('PRAGMA synchronous = NORMAL')
+        return con
+
+    #===== writes =====#
+    def record(self, categories, t=None):
+        '''Queue detections; `categories` maps names to counts or to `[count, amp]`.
+        Malformed detections raise here, since a failed write loses the rest of its batch.'''
+        if t == None: t = time.time()
+        events = {}
+        for name, v in categories.items():
+            if isinstance(v, (list, tuple)):
+                if len(v) != 2:
+                    raise Exception(f'detection of {name} should be a count or [count, amp], got {v!r}')
+                count, amp = v
+            else:
+                count, amp = v, None
+            events[str(name)] = (int(count), None if amp == None else float(amp))
+        self.queue.put(('events', t, events))
+
+    def alive(self, t=None):
+        if t == None: t = time.time()
+        self.queue.put(('lifeline', t, None))
+
+    def flush(self):
+        'Wait until everything queued so far is committed.'
+        done = threading.Event()
+        self.queue.put(('flush', None, done))
+        done.wait()
+
+    def write_forever(self):
+        con = self.connect()
+        category_ids = dict(con.execute('SELECT name, id FROM category_names'))
+        while True:
+            items = [self.queue.get()]
+            deadline = time.time() + self.flush_period
+            while items[-1][0] != 'flush':
+                try:
+                    items.append(self.queue.get(timeout=max(deadline - time.time(), 0)))
+                except queue.Empty:
+                    break
+            try:
+                with con:
+                    for kind, t, arg in items:
+                        if kind == 'events':
+                            self.write_events(con, category_ids, t, arg)
+                        elif kind == 'lifeline':
+                            con.execute('INSERT INTO lifeline VALUES (?)', (t,))
+            except Exception:
+                # the batch was rolled back, so ids cached during it may not exist
+                print(f"EventStore: dropped {sum(kind != 'flush' for kind, _, _ in items)} queued writes")
+                traceback.print_exc()
+                category_ids.clear()
+            finally:
+                for kind, t, arg in items:
+                    if kind == 'flush':
+                        arg.set()
+
+    def write_events(self, con, category_ids, t, categories):
+        events = []
+        for name, v in categories.items():
+            count, amp = v if isinstance(v, (list, tuple)) else (v, None)
+            if name not in category_ids:
+                con.execute('INSERT OR IGNORE INTO category_names(name) VALUES (?)', (name,))
+                category_ids[name] = con.execute('SELECT id FROM category_names WHERE name = ?', (name,)).fetchone()[0]
+            events.append((t, category_ids[name], count, amp))
+        con.executemany('INSERT INTO events VALUES (?, ?, ?, ?)', events)
+        con.executemany(ROLLUP, [
+            (period, category_id, int(t // period * period), count, amp)
+            for period in PERIODS.values()
+            for t, category_id, count, amp in events
+        ])
+
+    def migrate(self, con):
+        'Convert rows of the old `categories(time, categories JSON)` table into events.'
+        if not con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'categories'").fetchone():
+            return
+        category_ids = dict(con.execute('SELECT name, id FROM category_names'))
+        for t, categories in con.execute('SELECT time, categories FROM categories ORDER BY time').fetchall():
+            self.write_events(con, category_ids, t, json.loads(categories))
+        con.execute('DROP TABLE categories')
+
+    #===== queries =====#
+    def category_counts(self, category, since, until, period='hour'):
+        '''`[[start, count, amp], ...]` for `category`, per `period` ('hour', 'day', or None for raw events), with `start < until`.
+        For rollups, `since` is rounded down to the start of its period, so the period containing it is included; raw events have `since <= time`.'''
+        con = self.connect()
+        try:
+            if period == None:
+                return con.execute('''
+                    SELECT time, count, amp
+                    FROM events JOIN category_names ON events.category_id = category_names.id
+                    WHERE name = ? AND time >= ? AND time < ?
+                    ORDER BY time
+                ''', (category, since, until)).fetchall()
+            return con.execute('''
+                SELECT start, count, amp
+                FROM rollups JOIN category_names ON rollups.category_id = category_names.id
+                WHERE name = ? AND period = ? AND start >= ? AND start < ?
+                ORDER BY start
+            ''', (category, PERIODS[period], int(since // PERIODS[period] * PERIODS[period]), until)).fetchall()
+        finally:
+            con.close()
+
+    def counts(self, since, until, period='hour'):
+        '''`[[start, {category: count}], ...]` per `period`, with `start < until`.
+        `since` is rounded down to the start of its period, so the period containing it is included.'''
+        con = self.connect()
+        try:
+            rows = con.execute('''
+                SELECT start, name, count
+                FROM rollups JOIN category_names ON rollups.category_id = category_names.id
+                WHERE period = ? AND start >= ? AND start < ?
+                ORDER BY start
+            ''', (PERIODS[period], int(since // PERIODS[period] * PERIODS[period]), until)).fetchall()
+        finally:
+            con.close()
+        result = []
+        for start, name, count in rows:
+            if not result or result[-1][0] != start:
+                result.append([start, {}])
+            result[-1][1][name] = count
+        return result
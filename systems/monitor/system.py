@@ -1,3 +1,5 @@
+from event_store import EventStore
+
 import dlal
 
 import atexit
@@ -5,7 +7,6 @@ from datetime import datetime
 import json
 from pathlib import Path
 import pprint
-import sqlite3
 import threading
 import time
 import weakref
@@ -46,37 +47,28 @@ class MonitorSys(dlal.subsystem.Subsystem):
         self.audio.start_input_only()
         atexit.register(lambda: self.audio.stop())
 
-    def start_db(self):
+    def start_db(self, period=60):
+        'Every `period` seconds, record the categories detected since last time.'
+        self.event_store = EventStore('monitor.db')
         weak_self = weakref.proxy(self)
         def f():
-            need_schema = not Path('monitor.db').exists()
-            con = sqlite3.connect('monitor.db')
-            if need_schema: con.executescript('''
-                CREATE TABLE categories(time REAL, categories TEXT);
-                CREATE INDEX categories_time ON categories(time);
-                CREATE TABLE lifeline(time REAL);
-                CREATE INDEX lifeline_time ON lifeline(time);
-            ''')
-            con.execute(f'''INSERT INTO lifeline VALUES ({time.time()})''')
-            con.commit()
+            event_store = weak_self.event_store
+            event_store.alive()
             alive_h = int(time.time()) // 3600
             while True:
                 categories = {
                     k: v
-                    for k, v in weak_self.monitor.category_take_recent().items()
+                    for k, v in weak_self.monitor.category_take_recent(True).items()
                     if not k.startswith('unknown')
                 }
                 if categories:
-                    categories = json.dumps(categories)
-                    con.execute(f'''INSERT INTO categories VALUES ({time.time()}, '{categories}')''')
-                    con.commit()
-                q = int(time.time()) // (60 * 15)
-                while q == int(time.time()) // (60 * 15):
+                    event_store.record(categories)
+                q = int(time.time()) // period
+                while q == int(time.time()) // period:
                     time.sleep(1)
                 h = int(time.time()) // 3600
                 if h != alive_h:
-                    con.execute(f'''INSERT INTO lifeline VALUES ({time.time()})''')
-                    con.commit()
+                    event_store.alive()
                     alive_h = h
         self.db_thread = threading.Thread(target=f)
         self.db_thread.daemon = True
@@ -114,20 +106,15 @@ class MonitorSys(dlal.subsystem.Subsystem):
         with open(path) as f: j = json.load(f)
         self.monitor.from_json(j)
 
-    def db_categories(self, since, until):
+    def db_categories(self, since, until, period='hour'):
+        since = datetime.fromisoformat(since).timestamp()
+        until = datetime.fromisoformat(until).timestamp()
+        return self.event_store.counts(since, until, period)
+
+    def db_category_counts(self, category, since, until, period='hour'):
         since = datetime.fromisoformat(since).timestamp()
         until = datetime.fromisoformat(until).timestamp()
-        con = sqlite3.connect('monitor.db')
-        cur = con.execute(f'''
-            SELECT time, categories
-            FROM categories
-            WHERE time BETWEEN {since} and {until}
-            ORDER BY time
-        ''')
-        return [
-            (time, json.loads(categories))
-            for time, categories in cur.fetchall()
-        ]
+        return self.event_store.category_counts(category, since, until, period)
 
     def list_wavs_for_category(self, name):
         return [str(i) for i in Path('.').glob(f'*-{name}.wav')]
@@ -19,6 +19,7 @@ import time
 parser = argparse.ArgumentParser()
 parser.add_argument('--midi', '-m', nargs=2, metavar=('path', 'track'))
 parser.add_argument('--audio-path', '-a', nargs='+')
+parser.add_argument('--render', action='store_true', help='render each phrase offline, using saved alignments if present, instead of aligning interactively')
 args = parser.parse_args()
 
 #===== helpers =====#
@@ -76,30 +77,27 @@ assert len(noteses) == len(audio_paths), f'{len(noteses)} {len(audio_paths)}'
 
 audio = dlal.Audio()
 speech_synth = dlal.speech.SpeechSynth()
+frame_store = dlal.speech.FrameStore()
 audio.add(speech_synth)
 dlal.connect(speech_synth, audio)
 
 for notes, audio_path in zip(noteses, audio_paths):
     output_path = Path(audio_path).with_suffix('.json')
-    if output_path.exists(): continue
-    samples_i = notes[0]['on']
-    samples_f = notes[-1]['off']
-    samples_total = samples_f - samples_i
-    frames = dlal.speech.file_to_frames(audio_path, quiet=True)
-    frame_indices = []
-    frameses = []
-    frame_f = len(frames) - 1
-    while sum(frames[frame_f]['noise']['spectrum']) < 0.001:
-        frame_f -= 1
-    for i, note in enumerate(notes):
-        a = int((note['on'] - samples_i) / samples_total * frame_f)
-        if i + 1 < len(notes):
-            b = int((notes[i+1]['on'] - samples_i) / samples_total * frame_f)
-        else:
-            b = int((notes[-1]['off'] - samples_i) / samples_total * frame_f)
-        frame_indices.append([a, b])
-        frameses.append(frames[a:b])
+    if output_path.exists() and not args.render: continue
+    samples_total = notes[-1]['off'] - notes[0]['on']
+    frames = frame_store.frames(audio_path)
+    frame_indices = frame_store.note_indices(audio_path, notes)
+    frameses = [frames[a:b] for a, b in frame_indices]
     utterance = dlal.speech.Utterance.from_frameses_and_notes(frameses, notes)
+    if args.render:
+        if output_path.exists():
+            with open(output_path) as f:
+                frame_indices = json.loads(f.read())
+            frameses = [frames[a:b] for a, b in frame_indices]
+            utterance = dlal.speech.Utterance.from_frameses_and_notes(frameses, notes)
+        samples = speech_synth.render_offline(utterance, audio)
+        dlal.sound.Sound(samples).to_flac(str(Path(audio_path).with_suffix('.render.flac')))
+        continue
     while True:
         audio.start()
         speech_synth.utter(utterance)
@@ -23,7 +23,7 @@ dlal.connect(
 )
 
 #===== main =====#
-model = dlal.speech.Model('assets/local/phonetic-model.json')
+model = dlal.speech.Model('assets/local/phonetic-model.npz')
 run_size = audio.run_size()
 sample_rate = audio.sample_rate()
 
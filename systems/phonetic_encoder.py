@@ -9,62 +9,80 @@ try:
 except:
     pass
 
-parser = argparse.ArgumentParser()
-parser.add_argument('recordings_path', nargs='?', default='assets/phonetics')
-parser.add_argument('--only', nargs='+')
-args = parser.parse_args()
-
 MODEL_PATH = 'assets/local/phonetic-model.json'
+MODEL_PATH_BINARY = 'assets/local/phonetic-model.npz'
+
+#===== main =====#
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('recordings_path', nargs='?', default='assets/phonetics')
+    parser.add_argument('--only', nargs='+')
+    parser.add_argument('--online', action='store_true', help='sample by running the audio graph instead of analyzing files directly')
+    parser.add_argument('--processes', type=int, help='number of processes to analyze files with')
+    args = parser.parse_args()
 
-# components
-audio = dlal.Audio(driver=True)
-afr = dlal.Afr()
-sampler = dlal.speech.SpeechSampler()
+    # components
+    if args.online:
+        audio = dlal.Audio(driver=True)
+        afr = dlal.Afr()
+    sampler = dlal.speech.SpeechSampler()
 
-# connect
-dlal.connect(
-    afr,
-    sampler,
-)
+    # connect
+    if args.online:
+        dlal.connect(
+            afr,
+            sampler,
+        )
 
-# model
-if args.only:
-    model = dlal.speech.Model(MODEL_PATH)
-else:
-    model = dlal.speech.Model()
-assert audio.sample_rate() == model.sample_rate
-assert audio.run_size() == model.run_size
+    # model
+    if args.only:
+        model = dlal.speech.Model(MODEL_PATH)
+    else:
+        model = dlal.speech.Model()
+    if args.online:
+        assert audio.sample_rate() == model.sample_rate
+        assert audio.run_size() == model.run_size
 
-# run
-print('===== SAMPLING =====')
-sampleses = sampler.sampleses(args.recordings_path, afr, audio, args.only)
+    # run
+    print('===== SAMPLING =====')
+    if args.online:
+        sampleses = sampler.sampleses(args.recordings_path, afr, audio, args.only)
+    else:
+        sampleses = sampler.sampleses_offline(
+            args.recordings_path,
+            args.only,
+            sample_rate=model.sample_rate,
+            run_size=model.run_size,
+            processes=args.processes,
+        )
 
-print('===== MODELING =====')
-for k, samples in sampleses.items():
-    print(k)
-    if k in dlal.speech.PHONETICS:
-        model.add(k, samples)
-    elif k in dlal.speech.VOICED_STOP_CONTEXTS:
-        model.add_voiced_stop_context(k, samples)
-model.add_0()
-model.save(MODEL_PATH)
-model.save_formant_path_plot_data('assets/local/formant-paths.json')
+    print('===== MODELING =====')
+    for k, samples in sampleses.items():
+        print(k)
+        if k in dlal.speech.PHONETICS:
+            model.add(k, samples)
+        elif k in dlal.speech.VOICED_STOP_CONTEXTS:
+            model.add_voiced_stop_context(k, samples)
+    model.add_0()
+    model.save(MODEL_PATH)
+    model.save(MODEL_PATH_BINARY)
+    model.save_formant_path_plot_data('assets/local/formant-paths.json')
 
-print('===== DUMPING MEAN SPECTRA =====')
-mean_spectra = {}
-for k, samples in sampleses.items():
-    print(k)
-    mean_spectrum = [0] * len(samples[0][0])
-    if k in dlal.speech.VOICED and k not in dlal.speech.STOPS:
-        irrelevant = dlal.speech.RECORD_DURATION_UNSTRESSED_VOWEL + dlal.speech.RECORD_DURATION_TRANSITION + 1
-        total = irrelevant + dlal.speech.RECORD_DURATION_GO - 1
-        start = int(len(samples) * irrelevant / total)
-        samples = samples[start:]
-    for (spectrum, _, _) in samples:
+    print('===== DUMPING MEAN SPECTRA =====')
+    mean_spectra = {}
+    for k, samples in sampleses.items():
+        print(k)
+        mean_spectrum = [0] * len(samples[0][0])
+        if k in dlal.speech.VOICED and k not in dlal.speech.STOPS:
+            irrelevant = dlal.speech.RECORD_DURATION_UNSTRESSED_VOWEL + dlal.speech.RECORD_DURATION_TRANSITION + 1
+            total = irrelevant + dlal.speech.RECORD_DURATION_GO - 1
+            start = int(len(samples) * irrelevant / total)
+            samples = samples[start:]
+        for (spectrum, _, _) in samples:
+            for i in range(len(mean_spectrum)):
+                mean_spectrum[i] += spectrum[i]
         for i in range(len(mean_spectrum)):
-            mean_spectrum[i] += spectrum[i]
-    for i in range(len(mean_spectrum)):
-        mean_spectrum[i] /= len(samples)
-    mean_spectra[k] = mean_spectrum
-with open('assets/local/mean-spectra.json', 'w') as f:
-    json.dump(mean_spectra, f, indent=2)
+            mean_spectrum[i] /= len(samples)
+        mean_spectra[k] = mean_spectrum
+    with open('assets/local/mean-spectra.json', 'w') as f:
+        json.dump(mean_spectra, f, indent=2)
@@ -6,11 +6,14 @@ print('===== Setup =====')
 print(timestamp())
 
 import dlal
+from dlal._cache import JsonDiskCache, file_hash
 
 import cmudict
-import whisper
+import numpy as np
+import soundfile as sf
 
 import argparse
+import concurrent.futures
 import glob
 import math
 import os
@@ -19,6 +22,9 @@ import pprint
 import re
 import sys
 
+CACHE_VERSION = 1
+WHISPER_SAMPLE_RATE = 16000
+
 parser = argparse.ArgumentParser()
 parser.add_argument('audio_glob')
 parser.add_argument(
@@ -34,62 +40,133 @@ parser.add_argument('--output-aligner-dataset', '--oad',
     metavar='path',
     help='default .',
 )
+parser.add_argument('--jobs', '-j', type=int, default=1, help='number of worker processes, each with its own model')
+parser.add_argument('--no-cache', action='store_true', help='transcribe even if a file is unchanged since last time')
 args = parser.parse_args()
 
-def split(sound):
-    return sound.split(window_backward=sound.sample_rate * 10)
+cache = JsonDiskCache('phonetic_recognizer', max_bytes=1 << 30)
 
-print('===== Load Model =====')
-print(timestamp())
-try:
-    model = whisper.load_model(args.model)
-except Exception as e:
-    if type(e).__name__ != 'OutOfMemoryError':
-        raise
-    if os.environ.get('CUDA_VISIBLE_DEVICES') == '':
-        raise
-    print("Ran out of VRAM. Try CUDA_VISIBLE_DEVICES=''")
-    sys.exit(1)
-
-for audio_path in sorted(glob.glob(args.audio_glob)):
-    print(f'===== Transcribe {audio_path} =====')
-    print(timestamp())
-    tmp_path = 'phonetic_recognizer_tmp.flac'
+#===== helpers =====#
+def split(samples, sample_rate):
+    return dlal.sound.split_indices(samples, window_backward=int(sample_rate * 10))
+
+def resample(samples, sample_rate_from, sample_rate_to):
+    'Band-limited resampling via the FFT.'
+    if sample_rate_from == sample_rate_to: return samples
+    size = round(len(samples) * sample_rate_to / sample_rate_from)
+    spectrum = np.fft.rfft(samples)[:size // 2 + 1]
+    return (np.fft.irfft(spectrum, size) * size / len(samples)).astype(np.float32)
+
+def ipa(word):
+    return cmudict.convert(re.sub('[ ,.?]', '', word))
+
+#===== transcription =====#
+class F:
+    model = None
+
+def load_model(model_name):
+    if F.model: return F.model
+    import whisper
+    try:
+        F.model = whisper.load_model(model_name)
+    except Exception as e:
+        if type(e).__name__ != 'OutOfMemoryError':
+            raise
+        if os.environ.get('CUDA_VISIBLE_DEVICES') == '':
+            raise
+        print("Ran out of VRAM. Try CUDA_VISIBLE_DEVICES=''")
+        sys.exit(1)
+    return F.model
+
+def transcribe_file(audio_path, model_name, use_cache=True, verbose=None):
+    '''Transcribe each part of the file, keeping the parts in memory.
+    Results are cached by the file's content hash, along with CMUdict lookups for each word.'''
+    key = {
+        'version': CACHE_VERSION,
+        'audio': file_hash(audio_path),
+        'model': model_name,
+    }
+    if use_cache:
+        transcriptions = cache.get(key)
+        if transcriptions != None: return transcriptions
+    samples, sample_rate = sf.read(audio_path, dtype='float32', always_2d=True)
+    samples = samples[:, 0]
     transcriptions = []
-    sound = dlal.sound.read(audio_path)
-    for sound_part in split(sound):
-        sound_part.to_flac(tmp_path)
-        transcription = model.transcribe(
-            tmp_path,
-            verbose=True,
+    for start, end in split(samples, sample_rate):
+        transcription = load_model(model_name).transcribe(
+            resample(samples[start:end], sample_rate, WHISPER_SAMPLE_RATE),
+            verbose=verbose,
             word_timestamps=True,
             language='en',
         )
-        transcription['start_time'] = sound_part.start_time
-        transcriptions.append(transcription)
-    os.remove(tmp_path)
-
-    print(f'===== Results {audio_path} =====')
-    print(timestamp())
-    for transcription in transcriptions:
-        print(f'transcription starting at {transcription["start_time"]:.3f}')
-        print(transcription['text'])
-        for segment in transcription['segments']:
-            for word in segment['words']:
-                ipa = cmudict.convert(re.sub('[ ,.?]', '', word['word']))
-                print(f'''{word['start']:5.2f} {word['end']:5.2f}''', word['word'], ipa)
-        print()
-
-    if args.output_aligner_dataset:
-        sound = dlal.sound.read(audio_path)
-        for sound_part, transcription in zip(split(sound), transcriptions):
-            out_dir = args.output_aligner_dataset / f'recognized-{audio_path.stem}' / '{sound_part.start_time:08.3f}'
-            out_dir.mkdir(parents=True, exist_ok=True)
-            size = sum(len(segment['words']) for segment in transcription['segments'])
-            size_mag = math.floor(math.log10(size)) + 1
-            index_fmt = f'{{:0{size_mag}}}'
-            for segment_i, segment in enumerate(transcription['segments']):
-                prefix = out_dir / index_fmt.format(segment_i + 1)
-                sound.copy(segment['start'], segment['end']).to_flac(prefix.with_suffix('.flac'))
-                with open(prefix.with_suffix('.txt'), 'w') as txt:
-                    txt.write(segment['text'].strip().upper())
+        transcriptions.append({
+            'text': transcription['text'],
+            'segments': [
+                {
+                    'start': float(segment['start']),
+                    'end': float(segment['end']),
+                    'text': segment['text'],
+                    'words': [
+                        {
+                            'word': word['word'],
+                            'start': float(word['start']),
+                            'end': float(word['end']),
+                            'ipa': ipa(word['word']),
+                        }
+                        for word in segment['words']
+                    ],
+                }
+                for segment in transcription['segments']
+            ],
+            'start_sample': start,
+            'end_sample': end,
+            'start_time': start / sample_rate,
+        })
+    cache.put(key, transcriptions)
+    return transcriptions
+
+def transcribe_files(audio_paths):
+    'Yield `(audio_path, transcriptions)` in order.'
+    if args.jobs <= 1:
+        for audio_path in audio_paths:
+            print(f'===== Transcribe {audio_path} =====')
+            print(timestamp())
+            yield audio_path, transcribe_file(audio_path, args.model, not args.no_cache, True)
+        return
+    with concurrent.futures.ProcessPoolExecutor(args.jobs) as executor:
+        futures = [
+            executor.submit(transcribe_file, audio_path, args.model, not args.no_cache)
+            for audio_path in audio_paths
+        ]
+        for audio_path, future in zip(audio_paths, futures):
+            yield audio_path, future.result()
+
+#===== main =====#
+if __name__ == '__main__':
+    audio_paths = [Path(i) for i in sorted(glob.glob(args.audio_glob))]
+    for audio_path, transcriptions in transcribe_files(audio_paths):
+        print(f'===== Results {audio_path} =====')
+        print(timestamp())
+        for transcription in transcriptions:
+            print(f'transcription starting at {transcription["start_time"]:.3f}')
+            print(transcription['text'])
+            for segment in transcription['segments']:
+                for word in segment['words']:
+                    print(f'''{word['start']:5.2f} {word['end']:5.2f}''', word['word'], word['ipa'])
+            print()
+
+        if args.output_aligner_dataset:
+            samples, sample_rate = sf.read(audio_path, dtype='float32', always_2d=True)
+            samples = samples[:, 0]
+            for transcription in transcriptions:
+                out_dir = args.output_aligner_dataset / f'recognized-{audio_path.stem}' / f'{transcription["start_time"]:08.3f}'
+                out_dir.mkdir(parents=True, exist_ok=True)
+                size = sum(len(segment['words']) for segment in transcription['segments'])
+                size_mag = math.floor(math.log10(size)) + 1
+                index_fmt = f'{{:0{size_mag}}}'
+                part = dlal.sound.Sound(samples[transcription['start_sample']:transcription['end_sample']], sample_rate)
+                for segment_i, segment in enumerate(transcription['segments']):
+                    prefix = out_dir / index_fmt.format(segment_i + 1)
+                    part.copy(segment['start'], segment['end']).to_flac(prefix.with_suffix('.flac'))
+                    with open(prefix.with_suffix('.txt'), 'w') as txt:
+                        txt.write(segment['text'].strip().upper())
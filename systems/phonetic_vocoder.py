@@ -9,7 +9,8 @@ import os
 from pathlib import Path
 
 parser = argparse.ArgumentParser()
-parser.add_argument('recording_glob')
+parser.add_argument('recording_glob', nargs='?')
+parser.add_argument('--live', '-l', action='store_true', help='resynthesize the mic, analyzing in the audio graph instead of in Python')
 parser.add_argument('--visualize', '-v', action='store_true')
 parser.add_argument('--noise-only', action='store_true')
 parser.add_argument('--amp-plot', action='store_true')
@@ -18,10 +19,10 @@ parser.add_argument('--noise-pieces', action='store_true')
 parser.add_argument('--output-dir', '-o')
 args = parser.parse_args()
 
-recording_paths = sorted(glob.glob(args.recording_glob))
+recording_paths = sorted(glob.glob(args.recording_glob)) if args.recording_glob else []
 
 # components
-audio = dlal.Audio(driver=True)
+audio = dlal.Audio(driver=True, mic=args.live)
 afr = dlal.Afr()
 sampler = dlal.speech.SpeechSampler()
 synth = dlal.speech.SpeechSynth()
@@ -103,6 +104,12 @@ class Visualizer:
 
 visualizer = Visualizer()
 
+# live
+if args.live:
+    vocoder = dlal.speech.SpeechVocoder(sampler, synth, formants=args.formants)
+    dlal.connect(audio, sampler)
+    dlal.connect(synth, audio)
+
 # amp plot
 if args.amp_plot:
     peak_rec = dlal.Peak()
@@ -173,3 +180,6 @@ for recording_path in recording_paths:
             plot.text(k, **plot.transform(0, -(i+1)/5, i, plot.series))
             plot.plot(v)
         plot.show()
+
+if args.live:
+    dlal.typical_setup()
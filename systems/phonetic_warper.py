@@ -6,13 +6,12 @@ parser = argparse.ArgumentParser()
 parser.add_argument('audio_path')
 args = parser.parse_args()
 
-frames = dlal.speech.file_to_frames(args.audio_path)
-split = dlal.speech.split_frames(frames)
+split = dlal.speech.FrameStore().segments(args.audio_path)
 
 audio = dlal.Audio()
 run_size = audio.run_size()
 sample_rate = audio.sample_rate()
 t = 0
-for frames in split:
-    t += len(frames) * run_size / sample_rate
+for a, b in split:
+    t += (b - a) * run_size / sample_rate
     print(f'{t:>8.3f}')
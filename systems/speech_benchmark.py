@@ -0,0 +1,300 @@
+'''
+Benchmark the speech analysis and synthesis pipeline on synthetic input, so no recorded assets are needed.
+
+Analysis benchmarks report frames/sec. Synthesis benchmarks report control messages/sec, and rendering also reports real-time factor (wall time / audio duration, lower is better).
+Results are written as JSON, tagged with the commit, for tracking regressions across commits.
+Benchmarks that need components that aren't built report an error instead of results.
+'''
+
+#===== imports =====#
+#----- in-repo -----#
+import dlal
+
+#----- 3rd party -----#
+import numpy as np
+import soundfile as sf
+
+#----- standard -----#
+import argparse
+import datetime
+import json
+import os
+from pathlib import Path
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+#===== args =====#
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--output', '-o', type=Path, help='write results as JSON here, instead of to stdout')
+parser.add_argument('--only', nargs='+', metavar='benchmark', help='run only these benchmarks')
+parser.add_argument('--list', action='store_true', help='list benchmarks and exit')
+parser.add_argument('--seconds', type=float, default=4, help='duration of synthetic speech, default 4')
+parser.add_argument('--repeat', type=int, default=3, help='report the best of this many runs, default 3')
+parser.add_argument('--seed', type=int, default=0)
+args = parser.parse_args()
+
+SAMPLE_RATE = 44100
+RUN_SIZE = 64
+
+#===== synthetic input =====#
+def vowel(seconds, f0, formants, rng):
+    'Harmonics of `f0` shaped by `(freq, bandwidth)` formant resonances, with a little jitter.'
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    f = f0 * (1 + 0.01 * np.sin(2 * np.pi * 5 * t))
+    phase = 2 * np.pi * np.cumsum(f) / SAMPLE_RATE
+    samples = np.zeros(len(t))
+    for harmonic in range(1, int(8000 / f0)):
+        freq = harmonic * f0
+        amp = sum(1 / (1 + ((freq - fc) / bw) ** 2) for fc, bw in formants) / harmonic
+        samples += amp * np.sin(harmonic * phase + rng.uniform(0, 2 * np.pi))
+    return 0.5 * samples / np.abs(samples).max()
+
+def noise_burst(seconds, band, rng, attack=0.01, release=0.05):
+    'White noise band-limited to `band` Hz, with a linear attack and release.'
+    size = int(seconds * SAMPLE_RATE)
+    spectrum = np.fft.rfft(rng.standard_normal(size))
+    freqs = np.fft.rfftfreq(size, 1 / SAMPLE_RATE)
+    spectrum[(freqs < band[0]) | (freqs > band[1])] = 0
+    samples = np.fft.irfft(spectrum, size)
+    envelope = np.minimum(1, np.minimum(
+        np.arange(size) / (attack * SAMPLE_RATE),
+        np.arange(size)[::-1] / (release * SAMPLE_RATE),
+    ))
+    return 0.3 * samples * envelope / np.abs(samples).max()
+
+VOWELS = [
+    [(700, 130), (1220, 70), (2600, 160)],  # a
+    [(300, 60), (2300, 100), (3000, 120)],  # i
+    [(300, 60), (870, 80), (2250, 100)],  # u
+    [(500, 80), (1500, 90), (2500, 120)],  # schwa
+]
+
+FRICATIVE_BANDS = [
+    (2000, 8000),  # sh
+    (4000, 12000),  # s
+    (1000, 10000),  # f
+]
+
+def speech(seconds, rng):
+    'Alternating vowels and noise bursts, with short silences between.'
+    parts = []
+    total = 0
+    while total < seconds * SAMPLE_RATE:
+        parts.append(vowel(rng.uniform(0.15, 0.4), rng.uniform(90, 220), VOWELS[rng.integers(len(VOWELS))], rng))
+        parts.append(np.zeros(int(rng.uniform(0.01, 0.05) * SAMPLE_RATE)))
+        parts.append(noise_burst(rng.uniform(0.05, 0.2), FRICATIVE_BANDS[rng.integers(len(FRICATIVE_BANDS))], rng))
+        parts.append(np.zeros(int(rng.uniform(0.01, 0.05) * SAMPLE_RATE)))
+        total += sum(len(i) for i in parts[-4:])
+    return np.concatenate(parts)[:int(seconds * SAMPLE_RATE)].astype(np.float32)
+
+def recording(phonetic, rng):
+    'A synthetic recording of `phonetic`, laid out like the recorder makes them, for `Model.add`.'
+    go = dlal.speech.RECORD_DURATION_GO
+    if phonetic == 'a':
+        lead = dlal.speech.RECORD_DURATION_UNSTRESSED_VOWEL + dlal.speech.RECORD_DURATION_TRANSITION + 1
+        return np.concatenate([vowel(lead, 120, VOWELS[3], rng), vowel(go, 120, VOWELS[0], rng)])
+    elif phonetic == 'sh':
+        return noise_burst(go, FRICATIVE_BANDS[0], rng)
+    elif phonetic == 't':
+        return np.concatenate([
+            np.zeros(SAMPLE_RATE // 2),
+            noise_burst(0.05, (3000, 10000), rng, attack=0.001, release=0.04),
+            np.zeros(SAMPLE_RATE // 2),
+        ])
+
+#===== harness =====#
+BENCHMARKS = {}
+
+def benchmark(f):
+    BENCHMARKS[f.__name__.replace('__', '.')] = f
+    return f
+
+def best_time(f, setup=None):
+    'Best wall time of `args.repeat` calls of `f`, each after an untimed call of `setup`, and its last result.'
+    best = float('inf')
+    for _ in range(args.repeat):
+        if setup: setup()
+        start = time.perf_counter()
+        result = f()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+class Context:
+    'Synthetic input, and results derived from it, shared between benchmarks.'
+
+    def __init__(self, seconds, seed):
+        self.rng = np.random.default_rng(seed)
+        self.samples = speech(seconds, self.rng)
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'speech.flac')
+        sf.write(self.path, self.samples, SAMPLE_RATE)
+        self.model = dlal.speech.Model()
+        self.sampler_kwargs = dlal.speech.FrameStore().analysis_kwargs
+        self.analysis = dlal.speech.analyze(self.samples, run_size=RUN_SIZE, **self.sampler_kwargs)
+        self.frames = dlal.speech.file_to_frames_offline(self.path, self.model, **self.sampler_kwargs)
+
+    def utterance(self):
+        return dlal.speech.Utterance.from_frameses_and_notes(
+            [self.frames],
+            [{'on': 0, 'off': len(self.frames) * RUN_SIZE, 'number': 48}],
+        )
+
+#===== benchmarks =====#
+@benchmark
+def analyze(ctx):
+    seconds, (spectra, _, _) = best_time(lambda: dlal.speech.analyze(ctx.samples, run_size=RUN_SIZE, **ctx.sampler_kwargs))
+    return {'frames': len(spectra), 'seconds': seconds, 'frames_per_sec': len(spectra) / seconds}
+
+@benchmark
+def sampler__sample(ctx):
+    'Time spent in `SpeechSampler.sample` while a driver plays the synthetic file.'
+    driver = dlal.Audio(driver=True)
+    afr = dlal.Afr(ctx.path)
+    sampler = dlal.speech.SpeechSampler()
+    afr.connect(sampler.buf)
+    seconds = 0
+    frames = 0
+    while afr.playing():
+        driver.run()
+        start = time.perf_counter()
+        sampler.sample()
+        seconds += time.perf_counter() - start
+        frames += 1
+    sampler.__del__()
+    return {'frames': frames, 'seconds': seconds, 'frames_per_sec': frames / seconds}
+
+@benchmark
+def file_to_frames(ctx):
+    seconds, frames = best_time(lambda: dlal.speech.file_to_frames(ctx.path, quiet=True))
+    return {'frames': len(frames), 'seconds': seconds, 'frames_per_sec': len(frames) / seconds}
+
+@benchmark
+def file_to_frames_offline(ctx):
+    seconds, frames = best_time(lambda: dlal.speech.file_to_frames_offline(ctx.path, ctx.model, **ctx.sampler_kwargs))
+    return {'frames': len(frames), 'seconds': seconds, 'frames_per_sec': len(frames) / seconds}
+
+@benchmark
+def model__parameterize(ctx):
+    spectra, amps_tone, amps_noise = ctx.analysis
+    def f():
+        for i in range(len(spectra)):
+            ctx.model.parameterize(spectra[i], amps_tone[i], amps_noise[i])
+    seconds, _ = best_time(f)
+    return {'frames': len(spectra), 'seconds': seconds, 'frames_per_sec': len(spectra) / seconds}
+
+@benchmark
+def model__parameterize_many(ctx):
+    spectra, amps_tone, amps_noise = ctx.analysis
+    seconds, _ = best_time(lambda: ctx.model.parameterize_many(spectra, amps_tone, amps_noise))
+    return {'frames': len(spectra), 'seconds': seconds, 'frames_per_sec': len(spectra) / seconds}
+
+@benchmark
+def model__add(ctx):
+    'Build a model of a voiced continuant, an unvoiced continuant, and an unvoiced stop.'
+    sampleses = {}
+    for phonetic in ['a', 'sh', 't']:
+        spectra, amps_tone, amps_noise = dlal.speech.analyze(recording(phonetic, ctx.rng), run_size=RUN_SIZE, **ctx.sampler_kwargs)
+        sampleses[phonetic] = list(zip(spectra, amps_tone.tolist(), amps_noise.tolist()))
+    frames = sum(len(i) for i in sampleses.values())
+    def f():
+        model = dlal.speech.Model()
+        for phonetic, samples in sampleses.items():
+            model.add(phonetic, samples)
+    seconds, _ = best_time(f)
+    return {'frames': frames, 'seconds': seconds, 'frames_per_sec': frames / seconds}
+
+def synth_commands(ctx, tolerance):
+    '''Time `SpeechSynth.utter`, which builds the control messages and queues them on its comm, detached.
+    Nothing runs the comm, so it's emptied between runs by resizing it to hold every message and wait.'''
+    synth = dlal.speech.SpeechSynth()
+    utterance = ctx.utterance()
+    counts = [len(commands) for commands, _ in synth.utter_events(utterance, tolerance=tolerance)]
+    seconds, _ = best_time(
+        lambda: synth.utter(utterance, tolerance=tolerance),
+        lambda: synth.comm.resize(sum(counts) + len(counts)),
+    )
+    return {
+        'frames': len(ctx.frames),
+        'batches': len(counts),
+        'messages': sum(counts),
+        'seconds': seconds,
+        'messages_per_sec': sum(counts) / seconds,
+    }
+
+@benchmark
+def synth__commands(ctx):
+    'Build and queue the control messages `SpeechSynth.synthesize` sends for each frame.'
+    return synth_commands(ctx, None)
+
+@benchmark
+def synth__keyframes(ctx):
+    'Build and queue only the keyframes, see `SpeechSynth.keyframe_events`.'
+    return synth_commands(ctx, 0.5)
+
+@benchmark
+def synth__render(ctx):
+    'Render offline, reporting real-time factor as wall time / audio duration.'
+    driver = dlal.Audio(driver=True)
+    synth = dlal.speech.SpeechSynth()
+    driver.add(synth)
+    utterance = ctx.utterance()
+    timeline, samples = synth.compile(utterance)
+    messages = sum(len(commands) for _, commands in timeline)
+    seconds, _ = best_time(lambda: synth.render_offline(utterance, driver))
+    return {
+        'messages': messages,
+        'samples': samples,
+        'seconds': seconds,
+        'messages_per_sec': messages / seconds,
+        'realtime_factor': seconds / (samples / SAMPLE_RATE),
+    }
+
+#===== main =====#
+if args.list:
+    for name, f in BENCHMARKS.items():
+        print(name, '-', (f.__doc__ or '').strip())
+    raise SystemExit
+
+def git(*git_args):
+    try:
+        return subprocess.run(
+            ['git', *git_args],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+ctx = Context(args.seconds, args.seed)
+report = {
+    'commit': git('rev-parse', 'HEAD'),
+    'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+    'timestamp': datetime.datetime.now().isoformat(),
+    'python': platform.python_version(),
+    'machine': platform.machine(),
+    'config': {'seconds': args.seconds, 'repeat': args.repeat, 'seed': args.seed},
+    'results': {},
+}
+for name, f in BENCHMARKS.items():
+    if args.only and name not in args.only: continue
+    print(f'{name}...', end=' ', flush=True, file=sys.stderr)
+    try:
+        result = f(ctx)
+    except Exception as e:
+        traceback.print_exc()
+        result = {'error': f'{type(e).__name__}: {e}'}
+    report['results'][name] = result
+    print(', '.join(f'{k}={v:.4g}' if isinstance(v, float) else f'{k}={v}' for k, v in result.items()), file=sys.stderr)
+ctx.dir.cleanup()
+
+text = json.dumps(report, indent=2)
+if args.output:
+    args.output.write_text(text + '\n')
+else:
+    print(text)